@@ -3,21 +3,41 @@ import os
 import awsgi
 import flask
 
+from . import cache
 from . import filters
 from . import db
+from . import jobs
+from . import metrics
+from . import search
+from . import timing
 
 
 def create_app():
     app = flask.Flask(__name__, instance_relative_config=True)
     app.config.from_prefixed_env(prefix='BLOGGY')
+    # fail now rather than on the first list page, whose links carry
+    # signed cursors (see utils.make_cursor)
+    if not app.config.get('SECRET_KEY'):
+        raise RuntimeError('BLOGGY_SECRET_KEY must be set: it signs the '
+                           'paging cursors in list page links')
+
+    # e.g. BLOGGY_DB_MAX_POOL_CONNECTIONS=16, BLOGGY_DB_READ_TIMEOUT=3
+    db_config = app.config.get_namespace('DB_')
 
     env = app.config.get('ENV', '')
     if env == 'dev':
         os.environ['AWS_ACCESS_KEY_ID'] = 'foo'
         os.environ['AWS_SECRET_ACCESS_KEY'] = 'bar'
-        db.connect(use_local=True)
+        db.connect(use_local=True, **db_config)
     else:
-        db.connect()
+        db.connect(**db_config)
+
+    timing.init_app(app)
+    metrics.init_app(app)
+    # e.g. BLOGGY_METRICS_DIR=/tmp/bloggy-metrics, when running several
+    # processes
+    metrics.default_registry.use_directory(app.config.get('METRICS_DIR'))
+    timing.request_timed.connect(metrics.observe_timings)
 
     @app.route('/')
     def index():
@@ -27,6 +47,11 @@ def create_app():
     def ping():
         return 'pong'
 
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return flask.Response(metrics.default_registry.exposition(),
+                              content_type=metrics.CONTENT_TYPE)
+
     @app.errorhandler(404)
     def page_not_found(e):
         return flask.render_template('404.html'), 404
@@ -43,6 +68,46 @@ def create_app():
     def first_para(text):
         return filters.first_para(text)
 
+    @app.template_filter('post_html')
+    def post_html(post):
+        return filters.post_html(post)
+
+    @app.template_filter('post_excerpt')
+    def post_excerpt(post):
+        return filters.post_excerpt(post)
+
+    filters.render_cache.backend = cache.make_backend(
+        kind=app.config.get('RENDER_CACHE', 'memory'),
+        path=app.config.get('RENDER_CACHE_DIR'),
+        maxsize=int(app.config.get('RENDER_CACHE_SIZE', 256))
+    )
+    db.tag_catalogue.ttl = float(app.config.get('TAG_CACHE_TTL', 300))
+    db.post_updated.connect(filters.evict_post_html)
+    db.post_deleted.connect(filters.evict_deleted_post_html)
+
+    db.posts_updated.connect(filters.evict_posts_html)
+
+    # the index must outlive the process and be shared by every process
+    # serving the blog (e.g. on an EFS mount, for Lambda), and be built
+    # with `flask build-search-index` when first set up
+    search_index = app.config.get('SEARCH_INDEX')
+    if not search_index and env == 'dev':
+        search_index = '/tmp/bloggy-search.idx'
+    if not search_index:
+        raise RuntimeError('BLOGGY_SEARCH_INDEX must be set: the search '
+                           'index file, on storage shared by every process')
+    search.index.open(search_index)
+    db.post_created.connect(search.index_post)
+    db.post_updated.connect(search.index_post)
+    db.posts_updated.connect(search.index_posts)
+    db.post_deleted.connect(search.unindex_post)
+
+    jobs.runner.workers = int(app.config.get('JOBS_WORKERS', 2))
+    db.tag_updated.connect(jobs.relabel_on_update)
+
+    from . import cli
+    cli.register(app)
+
     from . import blog
     app.register_blueprint(blog.bp)
 
@@ -52,8 +117,13 @@ def create_app():
     return app
 
 
-_app = create_app()
+# created by the first event rather than at import, keeping the import of
+# this module (and so the Lambda init phase) cheap
+_app = None
 
 
 def handler(event, context):
+    global _app
+    if _app is None:
+        _app = create_app()
     return awsgi.response(_app, event, context)
@@ -1,25 +1,33 @@
+import copy
+
 import flask
 
 from flask import request
 
 from . import db
-from . import forms
+from . import jobs
 from . import utils
 
 
 bp = flask.Blueprint('blog_admin', __name__, url_prefix='/admin')
 
 
+def _forms():
+    # deferred so that wtforms is only loaded once a form is needed
+    from . import forms
+    return forms
+
+
 @bp.get('/posts/')
 @utils.pageable('blog/admin/posts/list.html')
-def list_posts(paging_key):
-    pageable = db.get_all_posts(paging_key=paging_key)
-    return dict(posts=pageable.items), pageable.paging_key
+def list_posts(paging_key, backward):
+    pageable = db.get_all_posts(paging_key=paging_key, backward=backward)
+    return dict(posts=pageable.items), pageable
 
 
 @bp.route('/posts/add/', methods=['GET', 'POST'])
 def add_post():
-    form = forms.NewPostForm(request.form)
+    form = _forms().NewPostForm(request.form)
 
     if request.method == 'POST' and form.validate():
         img = db.Image(src='', alt='', title='')
@@ -45,12 +53,13 @@ def _post_or_404(slug):
 @bp.route('/posts/<slug>/edit/', methods=['GET', 'POST'])
 def edit_post(slug):
     post = _post_or_404(slug)
-    form = forms.EditPostForm(request.form, post)
+    form = _forms().EditPostForm(request.form, post)
 
     if request.method == 'POST' and form.validate():
+        previous = copy.deepcopy(post)
         form.populate_obj(post)
         try:
-            db.update_post(post)
+            db.update_post(post, previous=previous)
             flask.flash('Post updated successfully', 'success')
             return flask.redirect(flask.url_for('blog_admin.view_post',
                                                 slug=slug))
@@ -78,14 +87,14 @@ def delete_post(slug):
 
 @bp.get('/tags/')
 @utils.pageable('blog/admin/tags/list.html')
-def list_tags(paging_key):
-    pageable = db.get_all_tags(paging_key=paging_key)
-    return dict(tags=pageable.items), pageable.paging_key
+def list_tags(paging_key, backward):
+    pageable = db.get_all_tags(paging_key=paging_key, backward=backward)
+    return dict(tags=pageable.items), pageable
 
 
 @bp.route('/tags/add/', methods=['GET', 'POST'])
 def add_tag():
-    form = forms.NewTagForm(request.form)
+    form = _forms().NewTagForm(request.form)
     if request.method == 'POST' and form.validate():
         tag = db.Tag(name=form.name.data, label=form.label.data)
         try:
@@ -105,12 +114,13 @@ def _tag_or_404(name):
 @bp.route('/tags/<name>/edit/', methods=['GET', 'POST'])
 def edit_tag(name):
     tag = _tag_or_404(name)
-    form = forms.EditTagForm(request.form, tag)
+    form = _forms().EditTagForm(request.form, tag)
     if request.method == 'POST' and form.validate():
         form.populate_obj(tag)
         try:
             db.update_tag(tag)
-            flask.flash('Tag updated successfully', 'success')
+            flask.flash('Tag updated successfully. Its posts are being '
+                        'updated in the background', 'success')
             return flask.redirect(flask.url_for('blog_admin.view_tag',
                                                 name=name))
         except db.ConcurrentUpdateException:
@@ -130,6 +140,16 @@ def view_tag(name):
 
 @bp.route('/tags/<name>/', methods=['DELETE'])
 def delete_tag(name):
-    db.delete_tag(name=name)
-    flask.flash('Tag deleted successfully', 'success')
-    return flask.redirect(flask.url_for('blog_admin.list_tags'), 303)
+    # removing the tag from its posts can take a while, so the request only
+    # records the job
+    _tag_or_404(name)
+    jobs.runner.submit('delete_tag', name=name)
+    flask.flash('Tag is being removed from its posts and deleted in the '
+                'background', 'success')
+    return flask.redirect(flask.url_for('blog_admin.list_jobs'), 303)
+
+
+@bp.get('/jobs/')
+def list_jobs():
+    return flask.render_template('blog/admin/jobs/list.html',
+                                 jobs=db.get_jobs())
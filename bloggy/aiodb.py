@@ -0,0 +1,510 @@
+"""An asyncio twin of bloggy.db, for serving under an ASGI server.
+
+Requests are built and responses parsed by the same helpers as bloggy.db,
+so both write identical items and return the same objects; only the sending
+differs. Requires aiobotocore (`pip install bloggy[async]`).
+
+Unlike bloggy.db, the connection is opened and closed explicitly, typically
+from the ASGI server's lifespan hooks:
+
+    await aiodb.connect()
+    ...
+    await aiodb.close()
+"""
+import asyncio
+import contextlib
+import copy
+import random
+import uuid
+
+from . import db
+from . import timing
+
+
+class Conn:
+
+    def __init__(self, client, exit_stack):
+        self.client = client
+        self.exit_stack = exit_stack
+
+
+_conn = None
+
+
+def client_config(max_pool_connections=100, **config_args):
+    """Build the aiobotocore client config used for DynamoDB.
+
+    Takes the same settings as `db.client_config`, but defaults to a larger
+    pool: one event loop can have many requests in flight at once.
+    """
+    import aiobotocore.config
+
+    return aiobotocore.config.AioConfig(**db._config_options(
+        max_pool_connections=max_pool_connections, **config_args
+    ))
+
+
+async def connect(use_local=False, config=None, published_shards=None,
+                  page_index=None, **config_args):
+    """Open the DynamoDB client, closing any previously opened one.
+
+    Pass either an aiobotocore `config` or keyword arguments for
+    `client_config`. The table layout is shared with bloggy.db, so
+    `published_shards` and `page_index` need only be passed if db.connect
+    hasn't been.
+    """
+    import aiobotocore.session
+
+    if published_shards is not None:
+        db._published_shards = int(published_shards)
+    if page_index is not None:
+        db._page_index = bool(page_index)
+
+    config = config or client_config(**config_args)
+    ddb_args = use_local and {'endpoint_url': 'http://localhost:8000'} or {}
+    exit_stack = contextlib.AsyncExitStack()
+    session = aiobotocore.session.get_session()
+    client = await exit_stack.enter_async_context(
+        session.create_client('dynamodb', config=config, **ddb_args)
+    )
+    timing.instrument(client)
+    global _conn
+    previous, _conn = _conn, Conn(client, exit_stack)
+    if previous:
+        await previous.exit_stack.aclose()
+
+
+async def close():
+    global _conn
+    conn, _conn = _conn, None
+    if conn:
+        await conn.exit_stack.aclose()
+
+
+# The shared builders produce arguments with plain values, for db._conn.table;
+# the low-level client needs them typed.
+def _typed(values):
+    return db._serialized(**values)
+
+
+_untyped = db._deserialized
+
+
+async def _query(**query_args):
+    response = await _conn.client.query(**db._client_args(query_args))
+    return db._plain_response(response)
+
+
+async def _get_item(**get_args):
+    response = await _conn.client.get_item(**db._client_args(get_args))
+    return db._plain_response(response)
+
+
+async def _write(transact_items, on_conflict):
+    """See db._write."""
+    try:
+        if len(transact_items) == 1 and 'Put' in transact_items[0]:
+            await _conn.client.put_item(**transact_items[0]['Put'])
+        else:
+            await _conn.client.transact_write_items(
+                TransactItems=transact_items
+            )
+    except _conn.client.exceptions.ConditionalCheckFailedException:
+        raise on_conflict
+    except _conn.client.exceptions.TransactionCanceledException as e:
+        reasons = [reason['Code'] for reason
+                   in e.response['CancellationReasons']]
+        if 'ConditionalCheckFailed' in reasons:
+            raise on_conflict
+        raise e
+
+
+async def _batch_write(requests, max_attempts=8):
+    """See db._batch_write."""
+    request_items = {db._table_name: requests}
+    for attempt in range(max_attempts):
+        response = await _conn.client.batch_write_item(
+            RequestItems=request_items
+        )
+        request_items = response.get('UnprocessedItems')
+        if not request_items:
+            return
+        await asyncio.sleep(
+            min(0.05 * 2 ** attempt, 5) * random.uniform(0.5, 1)
+        )
+    raise RuntimeError(f'{len(request_items[db._table_name])} items were '
+                       f'still unprocessed after {max_attempts} attempts')
+
+
+async def _batch_get(keys, projection=None, max_attempts=8):
+    """See db._batch_get."""
+    found = []
+    for i in range(0, len(keys), db._batch_get_size):
+        request = dict(Keys=[_typed(key)
+                             for key in keys[i:i + db._batch_get_size]])
+        if projection:
+            request.update(projection)
+        request_items = {db._table_name: request}
+        for attempt in range(max_attempts):
+            response = await _conn.client.batch_get_item(
+                RequestItems=request_items
+            )
+            found.extend(response['Responses'].get(db._table_name, []))
+            request_items = response.get('UnprocessedKeys')
+            if not request_items:
+                break
+            await asyncio.sleep(
+                min(0.05 * 2 ** attempt, 5) * random.uniform(0.5, 1)
+            )
+        else:
+            raise RuntimeError(f'Keys were still unprocessed after '
+                               f'{max_attempts} attempts')
+    return [_untyped(item) for item in found]
+
+
+async def _send(signal, sender, **kwargs):
+    """Send one of db's signals from a worker thread, as its receivers (the
+    search index and the render cache) do blocking I/O."""
+    await asyncio.to_thread(signal.send, sender, **kwargs)
+
+
+async def save_tag(tag):
+    await _write(db._save_tag_request(tag),
+                 on_conflict=db.DuplicateKeyException('Item already exists'))
+    db.tag_catalogue.invalidate()
+
+
+async def save_post(post):
+    await _write(db._save_post_request(post),
+                 on_conflict=db.DuplicateKeyException('Item already exists'))
+    await _reindex(post, None)
+    await _send(db.post_created, post)
+
+
+async def _query_shard(query_args, paging_key, limit, backward=False):
+    """See db._query_shard."""
+    items = []
+    while True:
+        response = await _query(**query_args)
+        items.extend(item for item in response['Items']
+                     if db._after_key(item, paging_key, backward))
+        if len(items) > limit or 'LastEvaluatedKey' not in response:
+            return items
+        query_args = dict(query_args,
+                          ExclusiveStartKey=response['LastEvaluatedKey'])
+
+
+async def get_posts(include_unpublished=False, tag=None, limit=10,
+                    paging_key=None, backward=False):
+    if not include_unpublished and db._published_shards > 1:
+        shard_pages = await asyncio.gather(*(
+            _query_shard(query_args, paging_key, limit, backward)
+            for query_args in db._shard_queries(tag, limit, paging_key,
+                                                backward)
+        ))
+        page = db._merge_shard_pages(shard_pages, limit, backward)
+    else:
+        query_args = db._posts_query(include_unpublished=include_unpublished,
+                                     tag=tag, limit=limit,
+                                     paging_key=paging_key, backward=backward)
+        page = db._posts_page(await _query(**query_args), limit)
+    page = db._oriented(page, backward, db._post_paging_key)
+
+    published = await _batch_get(db._summary_keys(page.items),
+                                 db._summary_only)
+    return db._summaries(page, {item['pk']: item for item in published})
+
+
+async def get_all_posts(limit=10, paging_key=None, backward=False):
+    return await get_posts(include_unpublished=True, limit=limit,
+                           paging_key=paging_key, backward=backward)
+
+
+async def get_published_posts(tag=None, limit=10, paging_key=None,
+                              backward=False):
+    return await get_posts(include_unpublished=False, tag=tag, limit=limit,
+                           paging_key=paging_key, backward=backward)
+
+
+async def _query_all(query_args):
+    """See db._query_all; collects the items rather than streaming them."""
+    items = []
+    while True:
+        response = await _query(**query_args)
+        items.extend(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            return items
+        query_args = dict(query_args,
+                          ExclusiveStartKey=response['LastEvaluatedKey'])
+
+
+async def _listed_keys(tag=None):
+    items = []
+    for query_args in db._list_key_queries(tag):
+        items.extend(await _query_all(query_args))
+    return db._list_keys(items)
+
+
+async def _page_chunks(tag, ids):
+    """See db._page_chunks."""
+    chunks = {}
+    for chunk_id in ids:
+        item = (await _get_item(Key=db._page_chunk_key(tag, chunk_id),
+                                ConsistentRead=True)).get('Item')
+        if item is None:
+            return None
+        chunks[chunk_id] = item['keys']
+    return chunks
+
+
+async def _update_page_index(tag, moves=(), rebuild=False):
+    """See db._update_page_index."""
+    while True:
+        item = (await _get_item(Key=db._page_index_key(tag),
+                                ConsistentRead=True)).get('Item')
+        try:
+            if rebuild or not db._is_page_index(item):
+                keys = db._moved_keys(await _listed_keys(tag), tag, moves)
+                await _build_page_index(tag, item, keys)
+                return
+            chunks = await _page_chunks(
+                tag, db._touched_chunks(item, tag, moves)
+            )
+            if chunks is not None:
+                await _write(
+                    db._page_index_request(tag, item, chunks, moves),
+                    on_conflict=db.ConcurrentUpdateException(
+                        'Page index changed')
+                )
+                return
+        except db.ConcurrentUpdateException:
+            pass
+
+
+async def _build_page_index(tag, item, keys):
+    """See db._build_page_index."""
+    chunks = db._new_chunks(keys)
+    await _put_all([_typed(dict(db._page_chunk_key(tag, entry[0]), keys=keys))
+                    for entry, keys in chunks])
+    try:
+        await _write(
+            [db._page_index_put(tag, item, [entry for entry, _ in chunks])],
+            on_conflict=db.ConcurrentUpdateException('Page index changed')
+        )
+    except db.ConcurrentUpdateException:
+        await _delete_all([db._page_chunk_key(tag, entry[0])
+                           for entry, _ in chunks])
+        raise
+    await _delete_all(db._replaced_page_items(tag, item))
+
+
+async def rebuild_page_index(tag=None):
+    """See db.rebuild_page_index."""
+    await _update_page_index(tag, rebuild=True)
+
+
+async def get_page_start(page, tag=None, limit=10):
+    """See db.get_page_start."""
+    if page < 2:
+        return None
+    position = (page - 1) * limit - 1
+    item = (await _get_item(Key=db._page_index_key(tag))).get('Item')
+    while True:
+        if not db._is_page_index(item):
+            await _update_page_index(tag)
+        else:
+            found = db._page_chunk_at(item, position)
+            if found is None:
+                return None
+            chunks = await _page_chunks(tag, [found[0]])
+            if chunks is not None:
+                return db._page_start(chunks[found[0]], found[1])
+        item = (await _get_item(Key=db._page_index_key(tag),
+                                ConsistentRead=True)).get('Item')
+
+
+async def _reindex(post, previous):
+    if db._page_index:
+        for tag in db._reindexed_lists(post, previous):
+            await _update_page_index(tag, [(post, previous)])
+
+
+async def get_post(slug, on_not_found):
+    response = await _get_item(Key=db._post_key(slug))
+    if 'Item' not in response:
+        on_not_found()
+        return None
+    return db._convertor.structure(response['Item']['post'], db.Post)
+
+
+async def _exists(key):
+    response = await _get_item(Key=key, **db._key_only)
+    return 'Item' in response
+
+
+async def post_exists(slug):
+    return await _exists(db._post_key(slug))
+
+
+async def posts_exist(slugs):
+    found = await _batch_get([db._post_key(slug) for slug in set(slugs)],
+                             db._key_only)
+    return {item['pk'].removeprefix('post#') for item in found}
+
+
+async def tag_exists(name):
+    return await _exists(db._tag_key(name))
+
+
+async def get_tag(name, on_not_found):
+    response = await _get_item(Key=db._tag_key(name))
+    if 'Item' not in response:
+        on_not_found()
+        return None
+    return db._convertor.structure(response['Item']['tag'], db.Tag)
+
+
+async def get_all_tags(limit=10, paging_key=None, backward=False):
+    query_args = db._tags_query(limit, paging_key, backward)
+    return db._tags_page(await _query(**query_args), limit, backward)
+
+
+async def get_published_post(slug, on_not_found):
+    post = await get_post(slug, on_not_found)
+    if not post.published:
+        on_not_found()
+    else:
+        return post
+
+
+async def get_published_post_version(slug):
+    response = await _get_item(**db._published_post_version_request(slug))
+    return db._post_version_from_response(response)
+
+
+async def update_post(post, previous=None):
+    """See db.update_post."""
+    if previous is None:
+        previous = await get_post(post.slug, on_not_found=lambda: None)
+    if previous is None:
+        raise db.ConcurrentUpdateException('Post no longer exists')
+    await _update_post(post, previous)
+    await _send(db.post_updated, post, previous_version=post.version - 1)
+
+
+async def _update_post(post, previous):
+    """See db._update_post."""
+    on_conflict = db.ConcurrentUpdateException('Concurrent update exception')
+    for transact_items in db._update_post_request(post, previous):
+        await _write(transact_items, on_conflict=on_conflict)
+    await _reindex(post, previous)
+
+
+async def update_tag(tag):
+    await _write(db._update_tag_request(tag),
+                 on_conflict=db.ConcurrentUpdateException('Concurrent update '
+                                                          'exception'))
+    db.tag_catalogue.invalidate()
+    # rather than sending db.tag_updated, whose receiver submits the job with
+    # blocking calls; the job waits for a runner (see jobs.Runner.resume)
+    await save_job(db.Job(id=uuid.uuid4().hex, kind='relabel_tag',
+                          args=dict(name=tag.name)))
+
+
+async def save_job(job):
+    """See db.save_job. Only records the job: this module doesn't run
+    them."""
+    await _write(db._save_job_request(job),
+                 on_conflict=db.DuplicateKeyException('Item already exists'))
+
+
+async def _get_items(pk):
+    return await _query_all(db._items_query(pk))
+
+
+async def _put_all(items):
+    """Unconditionally write serialised items, in batches."""
+    requests = [dict(PutRequest=dict(Item=item)) for item in items]
+    await asyncio.gather(*(
+        _batch_write(requests[i:i + db._batch_size])
+        for i in range(0, len(requests), db._batch_size)
+    ))
+
+
+async def _delete_all(items):
+    requests = [dict(DeleteRequest=dict(Key=_typed(dict(pk=item['pk'],
+                                                        sk=item['sk']))))
+                for item in items]
+    await asyncio.gather(*(
+        _batch_write(requests[i:i + db._batch_size])
+        for i in range(0, len(requests), db._batch_size)
+    ))
+
+
+async def delete_post(slug):
+    items = await _get_items(pk=f'post#{slug}')
+    await _delete_all(items)
+    await _reindex(None, db._base_post(items))
+    await _send(db.post_deleted, slug)
+
+
+async def _tagged_slugs(name):
+    """See db._tagged_slugs."""
+    items = []
+    for query_args in db._tagged_queries(name):
+        items.extend(await _query_all(query_args))
+    return db._slugs_of(items)
+
+
+async def _retag(slug, change, max_attempts=5):
+    """See db._retag."""
+    for _ in range(max_attempts):
+        post = await get_post(slug, on_not_found=lambda: None)
+        if post is None:
+            return None
+        tags = change(post.tags)
+        if tags == post.tags:
+            return None
+        previous = copy.deepcopy(post)
+        post.tags = tags
+        try:
+            await _update_post(post, previous)
+            return post
+        except db.ConcurrentUpdateException:
+            pass
+    raise db.ConcurrentUpdateException(f'{slug} kept changing while '
+                                       f'retagging')
+
+
+async def retag_posts(name, change, workers=8, progress=None):
+    """See db.retag_posts; `workers` bounds the posts updated at once."""
+    slugs = await _tagged_slugs(name)
+    semaphore = asyncio.Semaphore(workers)
+    done = 0
+    changed = []
+
+    async def retag(slug):
+        nonlocal done
+        async with semaphore:
+            post = await _retag(slug, change)
+        if post is not None:
+            changed.append(post)
+        done += 1
+        if progress:
+            progress(done, len(slugs))
+
+    try:
+        await asyncio.gather(*(retag(slug) for slug in slugs))
+    finally:
+        if changed:
+            await _send(db.posts_updated, changed)
+    return len(changed)
+
+
+async def delete_tag(name, workers=8, progress=None):
+    """See db.delete_tag."""
+    count = await retag_posts(name, db._without_tag(name), workers=workers,
+                              progress=progress)
+    await _delete_all(await _get_items(pk=f'tag#{name}'))
+    db.tag_catalogue.invalidate()
+    return count
@@ -1,21 +1,135 @@
+import urllib.parse
+
 import flask
+import jinja2
+import markupsafe
 
 import bloggy.db as db
+import bloggy.filters as filters
+import bloggy.search as search
 import bloggy.utils as utils
 
 
 bp = flask.Blueprint('blog', __name__, url_prefix='/blog')
 
 
+@bp.after_request
+def set_cache_control(response):
+    if response.status_code in (200, 304):
+        config = flask.current_app.config
+        response.cache_control.public = True
+        response.cache_control.max_age = config.get('CACHE_MAX_AGE', 60)
+        response.cache_control.s_maxage = config.get('CACHE_S_MAXAGE', 300)
+    return response
+
+
+def static_list_path(tag=None, page=1):
+    """The path of a list page in a static export of the blog."""
+    path = '/blog/'
+    if tag:
+        path += f'tags/{tag}/'
+    if page > 1:
+        path += f'page/{page}/'
+    return path
+
+
+@bp.app_template_global()
+def tag_url(name):
+    if flask.g.get('static_export'):
+        return static_list_path(tag=name)
+    return f'/blog/?{urllib.parse.urlencode(dict(tag=name))}'
+
+
+@bp.app_template_global()
+def tag_label(tag):
+    """The tag's current label, which may have changed since it was copied
+    onto a post."""
+    return db.tag_catalogue.label(tag.name, tag.label)
+
+
+@bp.app_template_global()
+@jinja2.pass_context
+def list_page_url(context, page):
+    tag = flask.request.args.get('tag', None)
+    if flask.g.get('static_export'):
+        return static_list_path(tag=tag, page=page)
+    args = dict(tag=tag) if tag else {}
+    if page > 1 and db.page_index_enabled():
+        args['page'] = page
+    elif page in context['cursors']:
+        args['c'] = context['cursors'][page]
+    query = f'?{urllib.parse.urlencode(args)}' if args else ''
+    return markupsafe.Markup(f'/blog/{query}')
+
+
+def _list_validators(ctx, next_paging_key):
+    # list pages have no single modification time (a post dropping off the
+    # page doesn't make the page any newer), so they rely on the etag alone
+    etag = utils.make_etag(
+        filters.RENDERER_VERSION,
+        db.tag_catalogue.version(),
+        [(p.slug, p.version) for p in ctx['posts']],
+        next_paging_key
+    )
+    return etag, None
+
+
+def _page_start(page):
+    if not db.page_index_enabled():
+        return None
+    return db.get_page_start(page, tag=flask.request.args.get('tag', None))
+
+
 @bp.get('/')
-@utils.pageable('blog/list.html')
-def list(paging_key):
+@utils.pageable('blog/list.html', validators=_list_validators,
+                page_start=_page_start)
+def list(paging_key, backward):
     tag = flask.request.args.get('tag', None)
-    pageable = db.get_published_posts(tag=tag, paging_key=paging_key)
-    return dict(posts=pageable.items), pageable.paging_key
+    pageable = db.get_published_posts(tag=tag, paging_key=paging_key,
+                                      backward=backward)
+    return dict(posts=pageable.items), pageable
+
+
+@bp.app_template_global()
+@jinja2.pass_context
+def search_page_url(context, page):
+    args = dict(q=context['q'])
+    if page in context['cursors']:
+        args['c'] = context['cursors'][page]
+    return markupsafe.Markup(f'/blog/search/?{urllib.parse.urlencode(args)}')
+
+
+@bp.get('/search/')
+@utils.pageable('blog/search.html')
+def search_posts(paging_key, backward):
+    # search pages are numbered by offset, which reads the same either way
+    q = flask.request.args.get('q', '').strip()
+    limit = 10
+    offset = paging_key['offset'] if paging_key else 0
+    slugs, matches = search.index.search(q, offset=offset, limit=limit)
+    posts = db.get_published_summaries(slugs)
+    pageable = db.PageableList(
+        items=posts,
+        paging_key=dict(offset=offset + limit)
+        if offset + limit < matches else None,
+        prev_key=dict(offset=max(offset - limit, 0)) if offset else None
+    )
+    return dict(posts=posts, q=q, matches=matches), pageable
 
 
 @bp.get('/<slug>/')
 def show_post(slug):
-    post = db.get_published_post(slug=slug, on_not_found=utils.abort_404)
-    return flask.render_template('blog/post.html', post=post)
+    # validate the client's copy against the version alone, so that a 304
+    # never needs the full post
+    version = db.get_published_post_version(slug)
+    if version is None:
+        flask.abort(404)
+
+    def render():
+        post = db.get_published_post(slug=slug,
+                                     on_not_found=utils.abort_404)
+        return flask.render_template('blog/post.html', post=post)
+
+    etag = utils.make_etag(filters.RENDERER_VERSION,
+                           db.tag_catalogue.version(), slug, version.version)
+    return utils.conditional(render, etag, version.modified)
@@ -0,0 +1,257 @@
+import collections
+import hashlib
+import os
+import threading
+import time
+
+from . import metrics
+
+
+class MemoryBackend:
+    """A bounded, thread-safe, in-process LRU store.
+
+    Keys are (group, name) tuples so that every entry in a group can be
+    dropped at once.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                return None
+            return self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_group(self, group):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == group]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskBackend:
+    """A bounded LRU store that keeps one file per entry under `path`.
+
+    Intended for Lambda's /tmp, which survives between invocations of a warm
+    function. Recency is tracked with file modification times.
+    """
+
+    def __init__(self, path, maxsize=1024):
+        self.path = path
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._count = len(self._files())
+
+    def _files(self):
+        return [f for f in os.listdir(self.path) if f.endswith('.html')]
+
+    def _filename(self, key):
+        group, name = key
+        return f'{_digest(group)}-{_digest(name)}.html'
+
+    def get(self, key):
+        filename = os.path.join(self.path, self._filename(key))
+        try:
+            with open(filename, encoding='utf-8') as f:
+                value = f.read()
+            os.utime(filename)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def set(self, key, value):
+        filename = os.path.join(self.path, self._filename(key))
+        tmp = f'{filename}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(value)
+        existed = os.path.exists(filename)
+        os.replace(tmp, filename)
+        with self._lock:
+            if not existed:
+                self._count += 1
+            if self._count > self.maxsize:
+                self._evict()
+
+    def _evict(self):
+        paths = [os.path.join(self.path, f) for f in self._files()]
+        paths.sort(key=_mtime)
+        for p in paths[:max(len(paths) - self.maxsize, 0)]:
+            _remove(p)
+        self._count = min(len(paths), self.maxsize)
+
+    def delete(self, key):
+        self._delete_file(self._filename(key))
+
+    def delete_group(self, group):
+        prefix = f'{_digest(group)}-'
+        for f in self._files():
+            if f.startswith(prefix):
+                self._delete_file(f)
+
+    def _delete_file(self, f):
+        if _remove(os.path.join(self.path, f)):
+            with self._lock:
+                self._count -= 1
+
+    def clear(self):
+        with self._lock:
+            for f in self._files():
+                _remove(os.path.join(self.path, f))
+            self._count = 0
+
+    def __len__(self):
+        return self._count
+
+
+def _digest(s):
+    return hashlib.sha1(s.encode('utf-8')).hexdigest()[:20]
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def make_backend(kind='memory', path=None, maxsize=256):
+    if kind == 'memory':
+        return MemoryBackend(maxsize=maxsize)
+    if kind == 'disk':
+        return DiskBackend(path or '/tmp/bloggy-render-cache',
+                           maxsize=maxsize)
+    raise ValueError(f'Unknown cache backend: {kind}')
+
+
+class RenderCache:
+    """Caches rendered post HTML keyed on (slug, version).
+
+    A post's version is bumped on every update, so a stale entry can never be
+    served; `invalidate` just frees the space early.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(slug, version):
+        return (slug, str(version))
+
+    def get_or_render(self, slug, version, render):
+        key = self._key(slug, version)
+        html = self.backend.get(key)
+        with self._lock:
+            if html is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.cache_lookups.inc('render',
+                                  'miss' if html is None else 'hit')
+        if html is not None:
+            return html
+        html = render()
+        self.backend.set(key, html)
+        return html
+
+    def invalidate(self, slug, version=None):
+        """Drop the entry for one version of a post, or all of them."""
+        if version is None:
+            self.backend.delete_group(slug)
+        else:
+            self.backend.delete(self._key(slug, version))
+
+    def clear(self):
+        self.backend.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses,
+                    size=len(self.backend))
+
+
+class TagCatalogue:
+    """An in-process copy of every tag, as returned by `load`.
+
+    The copy is reloaded once it is more than `ttl` seconds old, which bounds
+    how stale it can be when tags are changed by another process, and as
+    soon as it is invalidated by a change made by this one.
+    """
+
+    def __init__(self, load, ttl=300):
+        self.load = load
+        self.ttl = ttl
+        self._tags = None
+        self._by_name = {}
+        self._version = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def _current(self):
+        with self._lock:
+            if self._tags is None or \
+                    time.monotonic() - self._loaded_at > self.ttl:
+                metrics.cache_lookups.inc('tags', 'miss')
+                tags = list(self.load())
+                self._by_name = {tag.name: tag for tag in tags}
+                self._version = _digest(repr(
+                    sorted((tag.name, tag.label) for tag in tags)
+                ))
+                self._tags = tags
+                self._loaded_at = time.monotonic()
+            else:
+                metrics.cache_lookups.inc('tags', 'hit')
+            return self._tags, self._by_name, self._version
+
+    def tags(self):
+        return self._current()[0]
+
+    def get(self, name, default=None):
+        return self._current()[1].get(name, default)
+
+    def label(self, name, default=None):
+        tag = self.get(name)
+        return tag.label if tag is not None else default
+
+    def version(self):
+        """A digest of every tag's name and label, which changes whenever
+        one of them does."""
+        return self._current()[2]
+
+    def invalidate(self):
+        with self._lock:
+            self._tags = None
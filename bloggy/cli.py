@@ -0,0 +1,146 @@
+import click
+import flask.cli
+
+from . import db
+
+
+def _scan_progress(count):
+    click.echo(f'\rScanned {count} items', nl=False, err=True)
+
+
+@click.command('backfill')
+@click.option('--all', 'rerender_all', is_flag=True,
+              help='Re-render every post, not just stale ones.')
+def backfill_command(rerender_all):
+    """Re-render posts stored by an older renderer."""
+    count = db.rerender_posts(force=rerender_all, progress=_scan_progress)
+    click.echo(err=True)
+    click.echo(f'Re-rendered {count} items')
+
+
+@click.command('export')
+@click.argument('out_dir', type=click.Path(file_okay=False))
+@click.option('--full', is_flag=True,
+              help='Re-render every post, e.g. after changing templates.')
+@click.option('--workers', type=int, default=None,
+              help='Rendering processes (default: CPU count, 0: none).')
+@flask.cli.with_appcontext
+def export_command(out_dir, full, workers):
+    """Export the published blog as static HTML."""
+    from . import export
+    result = export.export(out_dir, full=full, workers=workers)
+    click.echo(f'Wrote {result.list_pages} list pages and '
+               f'{result.posts_rendered} posts '
+               f'({result.posts_unchanged} unchanged, '
+               f'{result.posts_removed} removed) to {out_dir}')
+
+
+@click.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--workers', type=int, default=8,
+              help='Threads sending batch writes.')
+@click.option('--skip-existing', is_flag=True,
+              help='Leave posts that already exist alone.')
+def import_command(path, workers, skip_existing):
+    """Bulk import posts and tags from a .json or .jsonl file."""
+    from . import importer
+    result = importer.import_file(path, workers=workers,
+                                  skip_existing=skip_existing)
+    click.echo(f'Imported {result.posts} posts and {result.tags} tags '
+               f'({result.items} items) in {result.seconds:.2f}s, '
+               f'{result.items_per_second:.0f} items/s')
+    if result.skipped:
+        click.echo(f'Skipped {result.skipped} existing posts')
+
+
+@click.command('reshard')
+@click.option('--shards', type=int, default=None,
+              help='Shards to move to (default: BLOGGY_DB_PUBLISHED_SHARDS).')
+def reshard_command(shards):
+    """Move published posts into a sharded (or unsharded) layout."""
+    count = db.reshard_published(shards=shards, progress=_scan_progress)
+    click.echo(err=True)
+    click.echo(f'Moved {count} posts')
+
+
+@click.command('replay-pending')
+def replay_pending_command():
+    """Finish post updates interrupted part way through."""
+    count = db.replay_pending_updates()
+    click.echo(f'Finished {count} updates')
+
+
+@click.command('delete-tag')
+@click.argument('name')
+@click.option('--workers', type=int, default=8,
+              help='Threads updating posts.')
+def delete_tag_command(name, workers):
+    """Remove a tag from every post that has it, then delete it."""
+    def progress(done, total):
+        click.echo(f'\rUpdated {done}/{total} posts', nl=False, err=True)
+
+    count = db.delete_tag(name, workers=workers, progress=progress)
+    click.echo(err=True)
+    click.echo(f'Deleted {name}, removing it from {count} posts')
+
+
+@click.command('rebuild-page-index')
+def rebuild_page_index_command():
+    """Rebuild the page index of every published list."""
+    db.rebuild_page_index()
+    count = 1
+    paging_key = None
+    while True:
+        tags = db.get_all_tags(limit=100, paging_key=paging_key)
+        for tag in tags.items:
+            db.rebuild_page_index(tag=tag.name)
+            count += 1
+        paging_key = tags.paging_key
+        if not paging_key:
+            break
+    click.echo(f'Indexed {count} lists')
+
+
+@click.command('build-search-index')
+def build_search_index_command():
+    """Rebuild the search index from every published post."""
+    from . import search
+    count = search.build(progress=_scan_progress)
+    click.echo(err=True)
+    click.echo(f'Indexed {count} posts')
+
+
+@click.command('compact-search-index')
+def compact_search_index_command():
+    """Fold the search index's change log into the index file."""
+    from . import search
+    count = search.index.compact()
+    click.echo(f'Compacted {count} changes')
+
+
+@click.command('resume-jobs')
+def resume_jobs_command():
+    """Finish background jobs left unfinished by a process that died."""
+    from . import jobs
+    count = jobs.runner.resume()
+    jobs.runner.join()
+    click.echo(f'Resumed {count} jobs')
+
+
+def register(app):
+    app.cli.add_command(backfill_command)
+    app.cli.add_command(reshard_command)
+    app.cli.add_command(replay_pending_command)
+    app.cli.add_command(rebuild_page_index_command)
+    app.cli.add_command(delete_tag_command)
+    app.cli.add_command(resume_jobs_command)
+    app.cli.add_command(build_search_index_command)
+    app.cli.add_command(compact_search_index_command)
+    app.cli.add_command(export_command)
+    app.cli.add_command(import_command)
+
+
+def main():
+    from . import create_app
+    cli = flask.cli.FlaskGroup(create_app=create_app)
+    cli.main(prog_name='bloggy')
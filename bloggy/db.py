@@ -1,9 +1,25 @@
+import collections
+import concurrent.futures
+import copy
 import dataclasses
 import datetime
-
-import boto3
-import boto3.dynamodb.types
+import heapq
+import inspect
+import queue
+import random
+import threading
+import time
+import typing
+import uuid
+import zlib
+
+import blinker
 import cattrs
+import cattrs.gen
+
+from . import cache
+from . import filters
+from . import timing
 
 
 class ConcurrentUpdateException(Exception):
@@ -14,7 +30,24 @@ class DuplicateKeyException(Exception):
     pass
 
 
-_convertor = cattrs.Converter()
+_signals = blinker.Namespace()
+post_created = _signals.signal('post-created')
+post_updated = _signals.signal('post-updated')
+post_deleted = _signals.signal('post-deleted')
+tag_updated = _signals.signal('tag-updated')
+# sent with a list of posts updated together (by retag_posts), instead of
+# post_updated for each
+posts_updated = _signals.signal('posts-updated')
+
+
+class _Converter(cattrs.Converter):
+
+    def structure(self, obj, cl):
+        with timing.timed('cattrs'):
+            return super().structure(obj, cl)
+
+
+_convertor = _Converter()
 _convertor.register_unstructure_hook(datetime.datetime,
                                      lambda dt: dt.isoformat())
 _convertor.register_structure_hook(
@@ -23,21 +56,28 @@ _convertor.register_structure_hook(
 )
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, slots=True)
 class Image:
     src: str
     alt: str
     title: str
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True, slots=True)
+class Rendered:
+    html: str
+    excerpt: str
+    version: int
+
+
+@dataclasses.dataclass(slots=True)
 class Tag:
     name: str
     label: str
     version: int = 1
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Post:
     slug: str
     title: str
@@ -47,64 +87,433 @@ class Post:
     main_image: Image
     created: datetime.datetime = datetime.datetime.now()
     version: int = 1
+    rendered: typing.Optional[Rendered] = None
+    modified: typing.Optional[datetime.datetime] = None
+
+    def summary(self):
+        return PostSummary(
+            slug=self.slug,
+            title=self.title,
+            published=self.published,
+            tags=self.tags,
+            main_image=self.main_image,
+            excerpt=self.rendered.excerpt if self.rendered else '',
+            created=self.created,
+            version=self.version,
+            modified=self.modified
+        )
+
+
+@dataclasses.dataclass(slots=True)
+class PostSummary:
+    """The parts of a post needed to list it, without the body."""
+    slug: str
+    title: str
+    published: bool
+    tags: list[Tag]
+    main_image: Image
+    excerpt: str
+    created: datetime.datetime
+    version: int = 1
+    modified: typing.Optional[datetime.datetime] = None
+
+
+@dataclasses.dataclass(slots=True)
+class PostVersion:
+    """Just enough of a published post to validate a cached copy."""
+    version: int
+    modified: typing.Optional[datetime.datetime] = None
+
+
+@dataclasses.dataclass(slots=True)
+class Job:
+    """Background work, tracked in the table so that its progress can be
+    shown and it can be resumed from `checkpoint` by another process."""
+    id: str
+    kind: str
+    args: dict
+    status: str = 'pending'
+    done: int = 0
+    total: int = 0
+    checkpoint: typing.Optional[str] = None
+    attempts: int = 0
+    error: typing.Optional[str] = None
+    created: typing.Optional[datetime.datetime] = None
+    modified: typing.Optional[datetime.datetime] = None
+
+
+# Post bodies and rendered HTML are stored zlib-compressed, as binary
+# attributes, from this many bytes: shorter text gains too little. Items
+# written before this hold text, which reads back just the same.
+_COMPRESS_FROM = 1024
+
+
+def _pack(text):
+    encoded = text.encode('utf-8')
+    if len(encoded) >= _COMPRESS_FROM:
+        compressed = zlib.compress(encoded)
+        if len(compressed) < len(encoded):
+            return compressed
+    return text
+
+
+def _unpack(value, _=None):
+    if isinstance(value, str):
+        return value
+    # boto3 reads binary attributes as Binary, which converts to bytes
+    return zlib.decompress(bytes(value)).decode('utf-8')
+
+
+def _register_hooks():
+    """Generate the code that (un)structures the stored types up front.
+
+    Structuring skips cattrs' detailed validation, as items are written by
+    this module, and posts and summaries leave out fields that hold their
+    defaults (only `created`'s changes over time, so it's always kept).
+    """
+    text = cattrs.gen.override(unstruct_hook=_pack, struct_hook=_unpack)
+    keep = cattrs.gen.override(omit_if_default=False)
+    # nested types first: a class's hooks use those registered for its
+    # fields when they're generated
+    for cls, omit_defaults, overrides in [
+        (Image, False, {}),
+        (Tag, False, {}),
+        (Rendered, False, dict(html=text)),
+        (Post, True, dict(body=text, created=keep)),
+        (PostSummary, True, dict(created=keep)),
+    ]:
+        _convertor.register_unstructure_hook(
+            cls, cattrs.gen.make_dict_unstructure_fn(
+                cls, _convertor, _cattrs_omit_if_default=omit_defaults,
+                **overrides
+            )
+        )
+        _convertor.register_structure_hook(
+            cls, cattrs.gen.make_dict_structure_fn(
+                cls, _convertor, _cattrs_detailed_validation=False,
+                **overrides
+            )
+        )
+
+
+_register_hooks()
+
+
+class _Table:
+    """Makes calls on the table with plain values, like boto3's Table
+    resource, through the low-level client.
+
+    Unlike the resource, which makes its own client, this shares the one
+    typed calls use, and with it a single connection pool.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, operation):
+        call = getattr(self.client, operation)
+
+        def plain_call(**args):
+            return _plain_response(call(**_client_args(args)))
+        return plain_call
 
 
 class Conn:
-    pass
+    """The DynamoDB table and client, created on first use so that neither
+    boto3 nor a connection is set up until the app needs one."""
+
+    def __init__(self, use_local=False, config=None, config_args=None,
+                 backend='dynamodb'):
+        self.use_local = use_local
+        self.backend = backend
+        self.config = config
+        self.config_args = config_args or {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # only called until _open has set the attribute
+        if name not in ('table', 'client'):
+            raise AttributeError(name)
+        with self._lock:
+            if 'client' not in self.__dict__:
+                self._open()
+        return self.__dict__[name]
+
+    def _open(self):
+        if self.backend == 'memory':
+            self._open_memory()
+            return
+
+        import boto3.session
+
+        ddb_args = self.use_local and \
+            {'endpoint_url': 'http://localhost:8000'} or {}
+        config = self.config or client_config(**self.config_args)
+        session = boto3.session.Session()
+        client = session.client('dynamodb', config=config, **ddb_args)
+        timing.instrument(client)
+
+        self.table = _Table(client)
+        # set last: its presence marks the connection as open
+        self.client = client
+
+    def _open_memory(self):
+        from . import memory
+
+        # the same layout as the DynamoDB table (see the Makefile)
+        memory.database.create_table(_table_name, 'pk', 'sk',
+                                     indexes={'GSI': ('sk', 'data')})
+        self.table = memory.Table(_table_name)
+        self.client = memory.Client()
 
 
 _table_name = 'Blog'
 _conn = Conn()
+# see _published_sk
+_published_shards = 1
+# see rebuild_page_index
+_page_index = False
+
+
+def _config_options(max_pool_connections=10, connect_timeout=2,
+                    read_timeout=5, retry_mode='standard', max_attempts=3,
+                    tcp_keepalive=True):
+    return dict(
+        max_pool_connections=max_pool_connections,
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        retries=dict(mode=retry_mode, max_attempts=max_attempts),
+        tcp_keepalive=tcp_keepalive
+    )
+
+
+def client_config(**options):
+    """Build the botocore client config used for DynamoDB.
+
+    Takes `max_pool_connections` (default 10), `connect_timeout` (2),
+    `read_timeout` (5), `retry_mode` ('standard'), `max_attempts` (3) and
+    `tcp_keepalive` (True). The pool should be at least as large as the
+    number of threads serving requests (Waitress defaults to 4), or threads
+    will queue for connections.
+    """
+    import botocore.config
+
+    return botocore.config.Config(**_config_options(**options))
+
 
+def connect(use_local=False, config=None, published_shards=1,
+            page_index=False, backend='dynamodb', **config_args):
+    """Configure the DynamoDB connection, which is opened on first use.
 
-def connect(use_local=False):
-    ddb_args = use_local and {'endpoint_url': 'http://localhost:8000'} or {}
-    dynamodb = boto3.resource('dynamodb', **ddb_args)
+    Pass either a botocore `config` or keyword arguments for
+    `client_config`. `published_shards` sets the table layout: see
+    `_published_sk`. `page_index` turns on upkeep of the page index: see
+    `rebuild_page_index`. `backend='memory'` keeps the table in this
+    process's memory instead (see `bloggy.memory`), for tests and local
+    development.
+    """
+    # fail now, rather than on first use, if given unknown settings
+    if backend not in ('dynamodb', 'memory'):
+        raise ValueError(f'Unknown backend: {backend!r}')
+    inspect.signature(_config_options).bind(**config_args)
+    # publish a complete Conn in one step, so that threads already serving
+    # requests never see a half-configured one
+    global _conn, _published_shards, _page_index
+    _published_shards = int(published_shards)
+    _page_index = bool(page_index)
+    _conn = Conn(use_local=use_local, config=config, config_args=config_args,
+                 backend=backend)
 
-    _conn.table = dynamodb.Table(_table_name)
 
-    client = boto3.client('dynamodb', **ddb_args)
-    _conn.client = client
+class _Deferred:
+    """Stands in for an object that is only created when first used."""
 
+    def __init__(self, factory):
+        self._factory = factory
 
-_serializer = boto3.dynamodb.types.TypeSerializer()
-_deserializer = boto3.dynamodb.types.TypeDeserializer()
+    def __getattr__(self, name):
+        obj = self.__dict__.get('_obj')
+        if obj is None:
+            obj = self.__dict__['_obj'] = self._factory()
+        return getattr(obj, name)
+
+
+def _types():
+    import boto3.dynamodb.types
+    return boto3.dynamodb.types
+
+
+_serializer = _Deferred(lambda: _types().TypeSerializer())
+_deserializer = _Deferred(lambda: _types().TypeDeserializer())
 
 
 def _serialized(**kwargs):
     return {k: _serializer.serialize(v) for k, v in kwargs.items()}
 
 
+def _deserialized(item):
+    return {k: _deserializer.deserialize(v) for k, v in item.items()}
+
+
+def _client_args(args):
+    """Turn arguments with plain values, as built for the table, into ones
+    for the low-level client."""
+    args = dict(args, TableName=_table_name)
+    for name in ('Key', 'Item', 'ExpressionAttributeValues',
+                 'ExclusiveStartKey'):
+        if name in args:
+            args[name] = _serialized(**args[name])
+    return args
+
+
+def _plain_response(response):
+    """Turn the typed values in a low-level client response into plain
+    ones."""
+    if 'Items' in response:
+        response['Items'] = [_deserialized(item)
+                             for item in response['Items']]
+    for name in ('Item', 'Attributes', 'LastEvaluatedKey'):
+        if name in response:
+            response[name] = _deserialized(response[name])
+    return response
+
+
+def _render(post):
+    """Store the sanitised HTML and excerpt for the post's current body."""
+    html = filters.md_to_html(post.body)
+    post.rendered = Rendered(html=str(html),
+                             excerpt=str(filters.first_para(html)),
+                             version=filters.RENDERER_VERSION)
+
+
 def _post_item(post):
     return _serialized(
         pk=f'post#{post.slug}',
         sk='#post',
         data=post.created.isoformat(),
         version=post.version,
+        renderer=post.rendered.version,
         post=_convertor.unstructure(post)
     )
 
 
-def _published_post_item(post):
+def _shard(slug, shards):
+    return zlib.crc32(slug.encode('utf-8')) % shards
+
+
+def _published_partition(tag=None, shard=None):
+    sk = '#post#published' + (f'#tag#{tag}' if tag else '')
+    return sk if shard is None else f'{sk}#{shard}'
+
+
+def _published_sk(slug, tag=None, shards=None):
+    """The sort key, and so GSI partition, of a post's published item or
+    its item for `tag`.
+
+    Every published post would otherwise share one GSI partition (and every
+    post with a tag, another), so with more than one shard the partition is
+    split into `#post#published#<n>` and `#post#published#tag#<name>#<n>`,
+    with n chosen by the post's slug. Lists then query every shard.
+    """
+    shards = shards or _published_shards
+    return _published_partition(
+        tag, _shard(slug, shards) if shards > 1 else None
+    )
+
+
+# Published items only back the list pages, so they carry a summary rather
+# than the full post; bodies are only read by get_post.
+def _published_post_item(post, shards=None):
     return _serialized(
         pk=f'post#{post.slug}',
-        sk='#post#published',
+        sk=_published_sk(post.slug, shards=shards),
         data=post.created.isoformat(),
         version=post.version,
-        post=_convertor.unstructure(post)
+        renderer=post.rendered.version,
+        summary=_convertor.unstructure(post.summary())
     )
 
 
-def _published_post_tag_item(post, tag):
+# Tag items just record membership: tag pages read summaries from the
+# published items, so that a post's tag items only change with its tags.
+def _published_post_tag_item(post, tag, shards=None):
     return _serialized(
         pk=f'post#{post.slug}',
-        sk=f'#post#published#tag#{tag.name}',
-        data=post.created.isoformat(),
-        version=post.version,
-        post=_convertor.unstructure(post)
+        sk=_published_sk(post.slug, tag.name, shards=shards),
+        data=post.created.isoformat()
+    )
+
+
+# Unpublished posts are in no list, so each of their tags gets an item of
+# its own instead, in a GSI partition per tag, so that retagging can find
+# them (see _tagged_slugs).
+def _draft_tag_sk(tag):
+    return f'#post#tag#{tag}'
+
+
+def _draft_tag_item(post, tag):
+    return _serialized(
+        pk=f'post#{post.slug}',
+        sk=_draft_tag_sk(tag.name),
+        data=post.created.isoformat()
     )
 
 
+def _published_keys(post, shards=None):
+    """The keys, and created time, of the published and tag items that a
+    post should have."""
+    if not post.published:
+        return [dict(pk=f'post#{post.slug}', sk=_draft_tag_sk(tag.name),
+                     data=post.created.isoformat())
+                for tag in post.tags]
+    return [dict(pk=f'post#{post.slug}',
+                 sk=_published_sk(post.slug, tag, shards),
+                 data=post.created.isoformat())
+            for tag in [None] + [tag.name for tag in post.tags]]
+
+
+def _published_items(post, shards=None):
+    if not post.published:
+        return [_draft_tag_item(post, tag) for tag in post.tags]
+    return [_published_post_item(post, shards)] + \
+        [_published_post_tag_item(post, tag, shards) for tag in post.tags]
+
+
+def _published_puts(post, shards=None):
+    return [dict(Put=dict(TableName=_table_name, Item=item))
+            for item in _published_items(post, shards)]
+
+
+def _published_writes(post, existing, shards=None):
+    """Writes that bring a post's `existing` published and tag items (as
+    dicts of pk, sk and data) up to date: deletes for those it no longer
+    has, and puts for those that are new or changed."""
+    items = _published_items(post, shards)
+    existing = {item['sk']: item for item in existing}
+    keep = {item['sk']['S'] for item in items}
+    deletes = [dict(
+        Delete=dict(
+            TableName=_table_name,
+            Key=_serialized(pk=item['pk'], sk=sk)
+        )
+    ) for sk, item in existing.items() if sk not in keep]
+    puts = [dict(Put=dict(TableName=_table_name, Item=item))
+            for item in items if _changed(item, existing.get(item['sk']['S']))]
+    return deletes + puts
+
+
+def _changed(item, existing):
+    # the published item's summary changes with every update, whereas a
+    # tag item only holds the created time
+    return existing is None or 'summary' in item or \
+        existing.get('data') != item['data']['S']
+
+
+def _post_items(post):
+    """All the items that make up a post."""
+    return [_post_item(post)] + _published_items(post)
+
+
 def _tag_item(tag):
     return _serialized(
         pk=f'tag#{tag.name}',
@@ -115,9 +524,36 @@ def _tag_item(tag):
     )
 
 
-def save_tag(tag):
+def _write(transact_items, on_conflict):
+    """Write the given transaction items atomically, raising `on_conflict`
+    if a condition check fails.
+
+    A lone Put is sent as a plain conditional PutItem: it is just as atomic,
+    and costs half the write capacity of a transaction.
+    """
+    try:
+        if len(transact_items) == 1 and 'Put' in transact_items[0]:
+            _conn.client.put_item(**transact_items[0]['Put'])
+        else:
+            _conn.client.transact_write_items(TransactItems=transact_items)
+    except _conn.client.exceptions.ConditionalCheckFailedException:
+        raise on_conflict
+    except _conn.client.exceptions.TransactionCanceledException as e:
+        reasons = [reason['Code'] for reason
+                   in e.response['CancellationReasons']]
+        if 'ConditionalCheckFailed' in reasons:
+            raise on_conflict
+        raise e
+
+
+# Each write below is split into a function that builds its transaction
+# items and one that sends them, so that the async twin of this module
+# (bloggy.aiodb) can share the former.
+
+
+def _save_tag_request(tag):
     tag.version = 1
-    transact_items = [dict(
+    return [dict(
         Put=dict(
             TableName=_table_name,
             ConditionExpression='attribute_not_exists(pk)',
@@ -125,20 +561,21 @@ def save_tag(tag):
         )
     )]
 
-    try:
-        _conn.client.transact_write_items(
-            TransactItems=transact_items
-        )
-    except _conn.client.exceptions.TransactionCanceledException as e:
-        reasons = [reason['Code'] for reason
-                   in e.response['CancellationReasons']]
-        if 'ConditionalCheckFailed' in reasons:
-            raise DuplicateKeyException('Item already exists')
-        raise e
 
+def save_tag(tag):
+    _write(_save_tag_request(tag),
+           on_conflict=DuplicateKeyException('Item already exists'))
+    tag_catalogue.invalidate()
 
-def save_post(post):
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _save_post_request(post):
     post.version = 1
+    post.modified = _now()
+    _render(post)
     transact_items = [dict(
         Put=dict(
             TableName=_table_name,
@@ -146,41 +583,134 @@ def save_post(post):
             Item=_post_item(post)
         )
     )]
-    if post.published:
-        transact_items.append(dict(
-            Put=dict(
-                TableName=_table_name,
-                Item=_published_post_item(post)
-            )
-        ))
-        for tag in post.tags:
-            transact_items.append(dict(
-                Put=dict(
-                    TableName=_table_name,
-                    Item=_published_post_tag_item(post, tag)
+    transact_items.extend(_published_puts(post))
+    return transact_items
+
+
+def save_post(post):
+    _write(_save_post_request(post),
+           on_conflict=DuplicateKeyException('Item already exists'))
+    _reindex(post, None)
+    post_created.send(post)
+
+
+_batch_size = 25
+
+
+def _batch_write(requests, max_attempts=8):
+    """Send up to 25 write requests, retrying unprocessed ones with
+    exponential backoff."""
+    request_items = {_table_name: requests}
+    for attempt in range(max_attempts):
+        response = _conn.client.batch_write_item(RequestItems=request_items)
+        request_items = response.get('UnprocessedItems')
+        if not request_items:
+            return
+        time.sleep(min(0.05 * 2 ** attempt, 5) * random.uniform(0.5, 1))
+    raise RuntimeError(f'{len(request_items[_table_name])} items were still '
+                       f'unprocessed after {max_attempts} attempts')
+
+
+def _batches(items):
+    batch = []
+    keys = set()
+    for item in items:
+        key = (item['pk']['S'], item['sk']['S'])
+        # a single BatchWriteItem call can't touch the same key twice
+        if len(batch) == _batch_size or key in keys:
+            yield batch
+            batch = []
+            keys = set()
+        batch.append(item)
+        keys.add(key)
+    if batch:
+        yield batch
+
+
+def _send_batches(batches, workers):
+    """Send batches of write requests over a thread pool, returning how many
+    requests were sent."""
+    count = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for requests in batches:
+            pending.add(pool.submit(_batch_write, requests))
+            count += len(requests)
+            # bound the number of batches held in memory
+            if len(pending) >= workers * 2:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
                 )
-            ))
+                for future in done:
+                    future.result()
+        for future in concurrent.futures.as_completed(pending):
+            future.result()
+    return count
+
+
+def batch_put(items, workers=8):
+    """Unconditionally write an iterable of serialised items using batches
+    of 25 spread over a thread pool, and return how many were written.
+
+    Unlike save_post and update_post this neither checks for existing items
+    nor bumps versions, so it suits bulk imports and restores.
+    """
+    return _send_batches(
+        ([dict(PutRequest=dict(Item=item)) for item in batch]
+         for batch in _batches(items)),
+        workers
+    )
 
-    try:
-        _conn.client.transact_write_items(
-            TransactItems=transact_items
-        )
-    except _conn.client.exceptions.TransactionCanceledException as e:
-        reasons = [reason['Code'] for reason
-                   in e.response['CancellationReasons']]
-        if 'ConditionalCheckFailed' in reasons:
-            raise DuplicateKeyException('Item already exists')
-        raise e
+
+def batch_delete(items, workers=8):
+    """Unconditionally delete an iterable of items (or just their pk and sk)
+    using batches of 25 spread over a thread pool, and return how many were
+    deleted."""
+    keys = (_serialized(pk=item['pk'], sk=item['sk']) for item in items)
+    return _send_batches(
+        ([dict(DeleteRequest=dict(Key=key)) for key in batch]
+         for batch in _batches(keys)),
+        workers
+    )
 
 
 @dataclasses.dataclass
 class PageableList:
+    """A page of a list, newest first (or in label order, for tags).
+
+    `paging_key` leads to the page after this one, if there is one, and
+    `prev_key` to the page before it when read with backward=True.
+    """
     items: list
     paging_key: dict = None
+    prev_key: dict = None
 
 
-def get_posts(include_unpublished=False, tag=None, limit=10,
-              paging_key=None):
+def _post_paging_key(item):
+    return dict(created=item['data'], slug=item['pk'].split('#')[1])
+
+
+def _tag_paging_key(item):
+    return dict(created=item['data'], name=item['pk'].split('#')[1])
+
+
+def _oriented(page, backward, paging_key_of):
+    """Turn a page of items read from `page.paging_key` in either direction
+    into one in list order, with keys leading both ways."""
+    items = page.items
+    if not backward:
+        return PageableList(items=items, paging_key=page.paging_key,
+                            prev_key=items and paging_key_of(items[0]) or None)
+    # read towards the start of the list, so the page reached the start if
+    # there's nothing more that way
+    items = items[::-1]
+    return PageableList(items=items,
+                        paging_key=items and paging_key_of(items[-1]) or None,
+                        prev_key=page.paging_key)
+
+
+def _posts_query(include_unpublished=False, tag=None, limit=10,
+                 paging_key=None, backward=False):
     sk = f'#post{"" if include_unpublished else "#published"}' \
         f'{f"#tag#{tag}" if tag else ""}'
 
@@ -190,8 +720,8 @@ def get_posts(include_unpublished=False, tag=None, limit=10,
         ExpressionAttributeValues={
             ':sk': sk
         },
-        Limit=limit,
-        ScanIndexForward=False
+        Limit=limit + 1,
+        ScanIndexForward=backward
     )
 
     if paging_key:
@@ -200,84 +730,679 @@ def get_posts(include_unpublished=False, tag=None, limit=10,
                              data=paging_key['created'])
         query_args['ExclusiveStartKey'] = exc_start_key
 
-    response = _conn.table.query(**query_args)
-    posts = [_convertor.structure(item['post'], Post)
-             for item in response['Items']]
-
+    if include_unpublished:
+        # base items hold the whole post, so only read back what a summary
+        # needs
+        query_args['ProjectionExpression'] = _summary_projection
+        query_args['ExpressionAttributeNames'] = {'#data': 'data'}
+    elif tag:
+        query_args.update(_tag_item_keys)
+    return query_args
+
+
+def _query_page(response, limit, paging_key_of):
+    """A page of the first `limit` items in the response to a query for one
+    more, so that it only leads on if there is more to read.
+
+    DynamoDB stops at the Limit whether or not there is anything after it,
+    so a query for just `limit` leads from a list's full last page to an
+    empty one.
+    """
+    items = response['Items']
     paging_key = None
-    if 'LastEvaluatedKey' in response:
-        paging_key = dict(
-            created=response['LastEvaluatedKey']['data'],
-            slug=response['LastEvaluatedKey']['pk'].split('#')[1]
+    if len(items) > limit:
+        items = items[:limit]
+        paging_key = paging_key_of(items[-1])
+    elif 'LastEvaluatedKey' in response:
+        # cut short by the 1MB limit on a response
+        paging_key = paging_key_of(response['LastEvaluatedKey'])
+    return PageableList(items=items, paging_key=paging_key)
+
+
+def _posts_page(response, limit):
+    return _query_page(response, limit, _post_paging_key)
+
+
+# tag items' summaries are read from the published items, so only their
+# keys are needed
+_tag_item_keys = dict(ProjectionExpression='pk, sk, #data',
+                      ExpressionAttributeNames={'#data': 'data'})
+
+
+def _is_tag_item(item):
+    return '#tag#' in item['sk']
+
+
+def _summary_keys(items):
+    """Keys of the published items holding summaries for the tag items
+    among `items`."""
+    return [dict(pk=item['pk'], sk=_published_sk(item['pk'].split('#')[1]))
+            for item in items if _is_tag_item(item)]
+
+
+def _summaries(page, published):
+    """Turn a page of items into a page of PostSummaries, looking up tag
+    items' summaries by pk in the `published` items.
+
+    Tag items written before they only recorded membership carry a copy of
+    the summary, which updates no longer keep current, so it's ignored.
+    """
+    items = [published.get(item['pk']) if _is_tag_item(item) else item
+             for item in page.items]
+    # a post unpublished since the tag query is left out
+    return dataclasses.replace(
+        page, items=[_summary_from_item(item) for item in items if item]
+    )
+
+
+def _shard_queries(tag=None, limit=10, paging_key=None, backward=False):
+    condition = 'sk = :sk'
+    if paging_key:
+        # items with the same created time as the paging key can fall either
+        # side of it, so start from that time and filter with _after_key
+        condition += f' and #data {">=" if backward else "<="} :created'
+    for shard in range(_published_shards):
+        query_args = dict(
+            IndexName='GSI',
+            KeyConditionExpression=condition,
+            ExpressionAttributeValues={
+                ':sk': _published_partition(tag, shard)
+            },
+            Limit=limit + 1,
+            ScanIndexForward=backward
         )
+        if tag:
+            query_args.update(_tag_item_keys)
+        if paging_key:
+            query_args['ExpressionAttributeValues'][':created'] = \
+                paging_key['created']
+            query_args['ExpressionAttributeNames'] = {'#data': 'data'}
+        yield query_args
+
+
+def _list_order(item):
+    return (item['data'], item['pk'])
 
-    return PageableList(items=posts,
-                        paging_key=paging_key)
 
+def _after_key(item, paging_key, backward=False):
+    if not paging_key:
+        return True
+    key = (paging_key['created'], f'post#{paging_key["slug"]}')
+    return _list_order(item) > key if backward else _list_order(item) < key
 
-def get_all_posts(limit=10, paging_key=None):
+
+def _merge_shard_pages(shard_pages, limit, backward=False):
+    """Merge the items read from each shard into one page, in the order they
+    were read.
+
+    Each shard is read until it has more than `limit` items or runs out, so
+    there's another page only if they have more than `limit` between them.
+    """
+    merged = list(heapq.merge(
+        *(sorted(items, key=_list_order, reverse=not backward)
+          for items in shard_pages),
+        key=_list_order, reverse=not backward
+    ))
+    page = merged[:limit]
+    paging_key = None
+    if len(merged) > limit:
+        paging_key = _post_paging_key(page[-1])
+    return PageableList(items=page, paging_key=paging_key)
+
+
+def _query_shard(query_args, paging_key, limit, backward=False):
+    items = []
+    while True:
+        response = _conn.table.query(**query_args)
+        items.extend(item for item in response['Items']
+                     if _after_key(item, paging_key, backward))
+        if len(items) > limit or 'LastEvaluatedKey' not in response:
+            return items
+        query_args = dict(query_args,
+                          ExclusiveStartKey=response['LastEvaluatedKey'])
+
+
+_shard_pool = _Deferred(lambda: concurrent.futures.ThreadPoolExecutor(
+    max_workers=16, thread_name_prefix='bloggy-shards'
+))
+
+
+_batch_get_size = 100
+
+
+def _batch_get(keys, projection=None, max_attempts=8):
+    """Read the items with the given keys, in batches of 100, retrying
+    unprocessed keys with exponential backoff. Returns the items found."""
+    found = []
+    for i in range(0, len(keys), _batch_get_size):
+        request = dict(Keys=[_serialized(**key)
+                             for key in keys[i:i + _batch_get_size]])
+        if projection:
+            request.update(projection)
+        request_items = {_table_name: request}
+        for attempt in range(max_attempts):
+            response = _conn.client.batch_get_item(RequestItems=request_items)
+            found.extend(response['Responses'].get(_table_name, []))
+            request_items = response.get('UnprocessedKeys')
+            if not request_items:
+                break
+            time.sleep(min(0.05 * 2 ** attempt, 5) * random.uniform(0.5, 1))
+        else:
+            raise RuntimeError(f'Keys were still unprocessed after '
+                               f'{max_attempts} attempts')
+    return [{k: _deserializer.deserialize(v) for k, v in item.items()}
+            for item in found]
+
+
+_summary_only = dict(ProjectionExpression='pk, summary')
+
+
+def get_posts(include_unpublished=False, tag=None, limit=10,
+              paging_key=None, backward=False):
+    """Read a page of posts, starting after `paging_key` or, if `backward`
+    is set, ending before it."""
+    if not include_unpublished and _published_shards > 1:
+        futures = [timing.submit(_shard_pool, _query_shard, query_args,
+                                 paging_key, limit, backward)
+                   for query_args in _shard_queries(tag, limit, paging_key,
+                                                    backward)]
+        page = _merge_shard_pages([f.result() for f in futures], limit,
+                                  backward)
+    else:
+        query_args = _posts_query(include_unpublished=include_unpublished,
+                                  tag=tag, limit=limit,
+                                  paging_key=paging_key, backward=backward)
+        page = _posts_page(_conn.table.query(**query_args), limit)
+    page = _oriented(page, backward, _post_paging_key)
+
+    published = _batch_get(_summary_keys(page.items), _summary_only)
+    return _summaries(page, {item['pk']: item for item in published})
+
+
+_summary_projection = ', '.join(
+    ['pk', 'sk', '#data', 'version', 'post.rendered.excerpt'] +
+    [f'post.{f.name}' for f in dataclasses.fields(PostSummary)
+     if f.name != 'excerpt']
+)
+
+
+def _summary_from_item(item):
+    if 'summary' in item:
+        return _convertor.structure(item['summary'], PostSummary)
+    # a base item, or a published item written before summaries existed
+    post = dict(item['post'])
+    post.pop('body', None)
+    rendered = post.pop('rendered', None) or {}
+    post['excerpt'] = rendered.get('excerpt', '')
+    return _convertor.structure(post, PostSummary)
+
+
+def get_published_summaries(slugs):
+    """Summaries of the published posts among `slugs`, in the same order."""
+    keys = [dict(pk=f'post#{slug}', sk=_published_sk(slug)) for slug in slugs]
+    found = {item['pk']: item for item in _batch_get(keys, _summary_only)}
+    return [_summary_from_item(found[key['pk']]) for key in keys
+            if key['pk'] in found]
+
+
+def get_published_post_texts(progress=None):
+    """Stream the slug, title, body and tags of every published post, e.g.
+    for indexing."""
+    items = scan(
+        progress=progress,
+        FilterExpression='sk = :sk and #post.published = :published',
+        ProjectionExpression='#post.slug, #post.title, #post.body, '
+                             '#post.tags',
+        ExpressionAttributeNames={'#post': 'post'},
+        ExpressionAttributeValues={':sk': '#post', ':published': True}
+    )
+    for item in items:
+        post = item['post']
+        yield dict(post, body=_unpack(post['body']))
+
+
+def get_all_posts(limit=10, paging_key=None, backward=False):
     return get_posts(include_unpublished=True, limit=limit,
-                     paging_key=paging_key)
+                     paging_key=paging_key, backward=backward)
 
 
-def get_published_posts(tag=None, limit=10, paging_key=None):
+def get_published_posts(tag=None, limit=10, paging_key=None,
+                        backward=False):
     return get_posts(include_unpublished=False, tag=tag, limit=limit,
-                     paging_key=paging_key)
+                     paging_key=paging_key, backward=backward)
 
 
-def get_post(slug, on_not_found):
-    response = _conn.table.get_item(
-        Key={
-            'pk': f'post#{slug}',
-            'sk': '#post'
+def page_index_enabled():
+    return _page_index
+
+
+def _page_index_key(tag=None):
+    return dict(pk='pages' + (f'#tag#{tag}' if tag else ''), sk='#pages')
+
+
+def _page_chunk_key(tag, chunk_id):
+    return dict(_page_index_key(tag), sk=f'#pages#{chunk_id}')
+
+
+def _query_all(query_args):
+    """Stream every item matching a query, a page at a time."""
+    while True:
+        response = _conn.table.query(**query_args)
+        yield from response['Items']
+        if 'LastEvaluatedKey' not in response:
+            return
+        query_args = dict(query_args,
+                          ExclusiveStartKey=response['LastEvaluatedKey'])
+
+
+def _list_key_queries(tag=None):
+    shards = range(_published_shards) if _published_shards > 1 else [None]
+    for shard in shards:
+        yield dict(
+            IndexName='GSI',
+            KeyConditionExpression='sk = :sk',
+            ExpressionAttributeValues={
+                ':sk': _published_partition(tag, shard)
+            },
+            ProjectionExpression='pk, #data',
+            ExpressionAttributeNames={'#data': 'data'}
+        )
+
+
+def _list_keys(items):
+    """The (created, slug) keys of a list's items, in list order."""
+    return sorted([[item['data'], item['pk'].split('#')[1]]
+                   for item in items], reverse=True)
+
+
+def _listed_keys(tag=None):
+    return _list_keys(item for query_args in _list_key_queries(tag)
+                      for item in _query_all(query_args))
+
+
+def _moved_keys(keys, tag, moves):
+    """A list's `keys` with each (post, previous) pair in `moves` applied:
+    `previous` taken out, and `post` put in if it belongs in the list.
+    Applying them twice changes nothing."""
+    posts = {}
+    for post, previous in moves:
+        posts[(post or previous).slug] = post
+    keys = [key for key in keys if key[1] not in posts]
+    keys.extend([post.created.isoformat(), post.slug]
+                for post in posts.values() if tag in _list_names(post))
+    return sorted(keys, reverse=True)
+
+
+# The page index of a list keeps its keys in chunks of up to twice this
+# many, one item each, so that a change rewrites one small chunk however
+# long the list is. The list's `#pages` item holds the chunks in list order,
+# as [id, count, oldest created, oldest slug], from which any position in
+# the list can be found. Chunks are never changed in place but replaced
+# (with new ids), so that a reader holding an older `#pages` item either
+# finds the chunk it expects or finds it gone.
+_page_chunk_size = 64
+
+
+def _is_page_index(item):
+    # rather than an index from before chunking, which is rebuilt
+    return item is not None and 'chunks' in item
+
+
+def _chunk(keys):
+    """A new chunk of `keys`, as its entry in the `#pages` item and its
+    keys."""
+    return [uuid.uuid4().hex[:12], len(keys)] + keys[-1], keys
+
+
+def _new_chunks(keys):
+    return [_chunk(keys[i:i + _page_chunk_size])
+            for i in range(0, len(keys), _page_chunk_size)]
+
+
+def _chunk_holding(entries, key):
+    """The index of the chunk that does (or would) hold `key`: the first
+    whose oldest key isn't newer, or else the last."""
+    for i, entry in enumerate(entries):
+        if entry[2:] <= key:
+            return i
+    return len(entries) - 1
+
+
+def _moved_list_keys(tag, moves):
+    """The keys `moves` takes out of a list (by slug), and puts in."""
+    posts = {}
+    for post, previous in moves:
+        posts[(post or previous).slug] = (post, previous)
+    removed = [[previous.created.isoformat(), slug]
+               for slug, (post, previous) in posts.items()
+               if tag in _list_names(previous)]
+    added = [[post.created.isoformat(), slug]
+             for slug, (post, previous) in posts.items()
+             if tag in _list_names(post)]
+    return removed, added
+
+
+def _touched_chunks(item, tag, moves):
+    """The ids of the chunks of a list's page index (its `#pages` item)
+    that `moves` changes."""
+    entries = item['chunks']
+    removed, added = _moved_list_keys(tag, moves)
+    return sorted({entries[i][0] for i in (_chunk_holding(entries, key)
+                                           for key in removed + added)
+                   if i >= 0})
+
+
+def _page_index_condition(item):
+    if item is None:
+        return dict(ConditionExpression='attribute_not_exists(pk)')
+    if 'version' not in item:
+        return dict(ConditionExpression='attribute_not_exists(version)')
+    return dict(
+        ConditionExpression='version = :version',
+        ExpressionAttributeValues={
+            ':version': _serializer.serialize(item['version'])
         }
     )
+
+
+def _page_index_put(tag, item, entries):
+    """Save a list's chunks, unless its `#pages` item has changed since
+    `item` was read (None if it wasn't there)."""
+    return dict(Put=dict(
+        TableName=_table_name,
+        Item=_serialized(**_page_index_key(tag), chunks=entries,
+                         version=(item or {}).get('version', 0) + 1),
+        **_page_index_condition(item)
+    ))
+
+
+def _page_chunk_put(tag, entry, keys):
+    return dict(Put=dict(
+        TableName=_table_name,
+        Item=_serialized(**_page_chunk_key(tag, entry[0]), keys=keys)
+    ))
+
+
+def _page_index_request(tag, item, chunks, moves):
+    """Apply `moves` to a list's page index, given its `#pages` item and
+    the keys of the chunks they touch (by id): each touched chunk is
+    replaced, and split if it has grown too big."""
+    entries = item['chunks']
+    removed, added = _moved_list_keys(tag, moves)
+    slugs = {key[1] for key in removed + added}
+    adding = collections.defaultdict(list)
+    for key in added:
+        adding[max(_chunk_holding(entries, key), 0)].append(key)
+
+    transact_items, kept = [], []
+    for i, entry in enumerate(entries or [None]):
+        if entry is not None and entry[0] not in chunks:
+            kept.append(entry)
+            continue
+        keys = chunks[entry[0]] if entry else []
+        keys = sorted([key for key in keys if key[1] not in slugs] +
+                      adding[i], reverse=True)
+        if entry is not None:
+            transact_items.append(dict(Delete=dict(
+                TableName=_table_name,
+                Key=_serialized(**_page_chunk_key(tag, entry[0]))
+            )))
+        if len(keys) > 2 * _page_chunk_size:
+            replacements = _new_chunks(keys)
+        else:
+            replacements = [_chunk(keys)] if keys else []
+        for new_entry, new_keys in replacements:
+            kept.append(new_entry)
+            transact_items.append(_page_chunk_put(tag, new_entry, new_keys))
+    return [_page_index_put(tag, item, kept)] + transact_items
+
+
+def _page_chunks(tag, ids):
+    """The keys of a list's page index chunks, by id, or None if one has
+    been replaced since the `#pages` item naming it was read."""
+    chunks = {}
+    for chunk_id in ids:
+        item = _conn.table.get_item(Key=_page_chunk_key(tag, chunk_id),
+                                    ConsistentRead=True).get('Item')
+        if item is None:
+            return None
+        chunks[chunk_id] = item['keys']
+    return chunks
+
+
+def _update_page_index(tag, moves=(), rebuild=False):
+    """Apply `moves`, (post, previous) pairs, to a list's page index, or
+    build it from the GSI if it is missing (or if `rebuild`), trying again
+    if another write gets in first."""
+    while True:
+        item = _conn.table.get_item(Key=_page_index_key(tag),
+                                    ConsistentRead=True).get('Item')
+        try:
+            if rebuild or not _is_page_index(item):
+                _build_page_index(tag, item, _moved_keys(_listed_keys(tag),
+                                                         tag, moves))
+                return
+            chunks = _page_chunks(tag, _touched_chunks(item, tag, moves))
+            if chunks is not None:
+                _write(_page_index_request(tag, item, chunks, moves),
+                       on_conflict=ConcurrentUpdateException(
+                           'Page index changed'))
+                return
+        except ConcurrentUpdateException:
+            pass
+
+
+def _replaced_page_items(tag, item):
+    """The items of a list's page index that a rebuild replaces, given its
+    `#pages` item."""
+    if item is None:
+        return []
+    if not _is_page_index(item):
+        # all the keys, from before chunking
+        return [dict(_page_index_key(tag), sk='#pages#keys')]
+    return [_page_chunk_key(tag, entry[0]) for entry in item['chunks']]
+
+
+def _build_page_index(tag, item, keys):
+    """Replace a list's page index with one of `keys`, unless its `#pages`
+    item has changed since `item` was read. There may be too many chunks
+    for one transaction, so they're written first, and any replaced chunks
+    deleted after."""
+    chunks = _new_chunks(keys)
+    batch_put(_serialized(**_page_chunk_key(tag, entry[0]), keys=keys)
+              for entry, keys in chunks)
+    try:
+        _write([_page_index_put(tag, item, [entry for entry, _ in chunks])],
+               on_conflict=ConcurrentUpdateException('Page index changed'))
+    except ConcurrentUpdateException:
+        batch_delete(_page_chunk_key(tag, entry[0]) for entry, _ in chunks)
+        raise
+    batch_delete(_replaced_page_items(tag, item))
+
+
+def rebuild_page_index(tag=None):
+    """Record the keys of published posts (or of those with `tag`) in list
+    order, so that get_page_start can find where any page starts in two
+    reads.
+
+    Reads the keys of every post in the list from the GSI, which can lag a
+    moment behind writes, so this is for building or repairing the index.
+    Once it exists, each change that moves the page boundaries (publishing,
+    unpublishing, retagging or redating a post) updates it from the post
+    written, rather than from the GSI.
+    """
+    _update_page_index(tag, rebuild=True)
+
+
+def _page_chunk_at(item, position):
+    """The id of the chunk of a list's page index (given its `#pages` item)
+    holding the key at `position` in the list, and the key's offset in the
+    chunk, or None if no page starts after it."""
+    if position >= sum(entry[1] for entry in item['chunks']) - 1:
+        return None
+    for chunk_id, count, *_ in item['chunks']:
+        if position < count:
+            return chunk_id, int(position)
+        position -= count
+    return None
+
+
+def _page_start(keys, offset):
+    created, slug = keys[offset]
+    return dict(created=created, slug=slug)
+
+
+def get_page_start(page, tag=None, limit=10):
+    """The paging key that starts a page of published posts (or of those with
+    `tag`), or None if the list has no such page.
+
+    Builds the page index first if it is missing.
+    """
+    if page < 2:
+        return None
+    # each page after the first starts after the last item of the one before
+    position = (page - 1) * limit - 1
+    item = _conn.table.get_item(Key=_page_index_key(tag)).get('Item')
+    while True:
+        if not _is_page_index(item):
+            _update_page_index(tag)
+        else:
+            found = _page_chunk_at(item, position)
+            if found is None:
+                return None
+            chunks = _page_chunks(tag, [found[0]])
+            if chunks is not None:
+                return _page_start(chunks[found[0]], found[1])
+        # or the chunk was replaced since the item was read
+        item = _conn.table.get_item(Key=_page_index_key(tag),
+                                    ConsistentRead=True).get('Item')
+
+
+def _list_names(post):
+    if not post or not post.published:
+        return set()
+    return {None} | {tag.name for tag in post.tags}
+
+
+def _reindexed_lists(post, previous):
+    """The lists (None for all published posts, otherwise a tag name) whose
+    page boundaries move when a post changes from `previous`."""
+    before, after = _list_names(previous), _list_names(post)
+    if previous and post and previous.created != post.created:
+        return before | after
+    return before ^ after
+
+
+def _reindex(post, previous):
+    _reindex_all([(post, previous)])
+
+
+def _reindex_all(moves):
+    """Update the page index for each (post, previous) pair in `moves`,
+    once per list they move."""
+    if _page_index:
+        lists = set().union(*(_reindexed_lists(post, previous)
+                              for post, previous in moves))
+        for tag in lists:
+            _update_page_index(tag, moves)
+
+
+def _post_key(slug):
+    return {
+        'pk': f'post#{slug}',
+        'sk': '#post'
+    }
+
+
+def get_post(slug, on_not_found):
+    response = _conn.table.get_item(Key=_post_key(slug))
     if 'Item' not in response:
         on_not_found()
         return None
     return _convertor.structure(response['Item']['post'], Post)
 
 
+# existence checks only need to know whether an item came back
+_key_only = dict(ProjectionExpression='pk')
+
+
+def _exists(key):
+    return 'Item' in _conn.table.get_item(Key=key, **_key_only)
+
+
+def post_exists(slug):
+    return _exists(_post_key(slug))
+
+
+def posts_exist(slugs):
+    """Return the subset of `slugs` that have a post, reading only keys."""
+    found = _batch_get([_post_key(slug) for slug in set(slugs)], _key_only)
+    return {item['pk'].removeprefix('post#') for item in found}
+
+
+def _tag_key(name):
+    return {
+        'pk': f'tag#{name}',
+        'sk': '#tag'
+    }
+
+
 def get_tag(name, on_not_found):
-    response = _conn.table.get_item(
-        Key={
-            'pk': f'tag#{name}',
-            'sk': '#tag'
-        }
-    )
+    response = _conn.table.get_item(Key=_tag_key(name))
     if 'Item' not in response:
         on_not_found()
         return None
     return _convertor.structure(response['Item']['tag'], Tag)
 
 
-def get_all_tags(limit=10, paging_key=None):
+def tag_exists(name):
+    return _exists(_tag_key(name))
+
+
+def _tags_query(limit=10, paging_key=None, backward=False):
     query_args = dict(
         IndexName='GSI',
         KeyConditionExpression='sk = :sk',
         ExpressionAttributeValues={
             ':sk': '#tag'
         },
-        Limit=limit
+        Limit=limit + 1,
+        ScanIndexForward=not backward
     )
     if paging_key:
         exc_start_key = dict(pk=f'tag#{paging_key["name"]}',
                              sk='#tag',
                              data=paging_key['created'])
         query_args['ExclusiveStartKey'] = exc_start_key
+    return query_args
 
-    response = _conn.table.query(**query_args)
-    tags = [_convertor.structure(item['tag'], Tag)
-            for item in response['Items']]
 
+def _tags_page(response, limit, backward=False):
+    page = _oriented(_query_page(response, limit, _tag_paging_key),
+                     backward, _tag_paging_key)
+    return dataclasses.replace(
+        page, items=[_convertor.structure(item['tag'], Tag)
+                     for item in page.items]
+    )
+
+
+def get_all_tags(limit=10, paging_key=None, backward=False):
+    query_args = _tags_query(limit, paging_key, backward)
+    return _tags_page(_conn.table.query(**query_args), limit, backward)
+
+
+def _every_tag():
     paging_key = None
-    if 'LastEvaluatedKey' in response:
-        paging_key = dict(
-            created=response['LastEvaluatedKey']['data'],
-            name=response['LastEvaluatedKey']['pk'].split('#')[1]
-        )
+    while True:
+        page = get_all_tags(limit=100, paging_key=paging_key)
+        yield from page.items
+        paging_key = page.paging_key
+        if not paging_key:
+            return
 
-    return PageableList(items=tags, paging_key=paging_key)
+
+# every tag, in label order; invalidated by this module's tag writes
+tag_catalogue = cache.TagCatalogue(_every_tag)
 
 
 def get_published_post(slug, on_not_found):
@@ -288,39 +1413,77 @@ def get_published_post(slug, on_not_found):
         return post
 
 
-def _get_post_tag_items(slug):
-    response = _conn.table.query(
+def _published_post_version_request(slug):
+    return dict(
+        Key={
+            'pk': f'post#{slug}',
+            'sk': _published_sk(slug)
+        },
+        ProjectionExpression='version, summary.modified'
+    )
+
+
+def get_published_post_version(slug):
+    """Return the version of a published post without reading it, or None
+    if there is no such published post."""
+    response = _conn.table.get_item(**_published_post_version_request(slug))
+    return _post_version_from_response(response)
+
+
+def _post_version_from_response(response):
+    if 'Item' not in response:
+        return None
+    item = response['Item']
+    modified = item.get('summary', {}).get('modified')
+    return PostVersion(
+        version=int(item['version']),
+        modified=modified and datetime.datetime.fromisoformat(modified)
+    )
+
+
+def _published_items_query(slug):
+    return dict(
         KeyConditionExpression='pk = :pk and begins_with(sk, :sk_prefix)',
         ExpressionAttributeValues={
             ':pk': f'post#{slug}',
-            ':sk_prefix': '#post#published#tag#'
-        }
+            ':sk_prefix': '#post#'
+        },
+        ProjectionExpression='pk, sk, #data',
+        ExpressionAttributeNames={'#data': 'data'}
     )
-    if 'LastEvaluatedKey' in response:
-        raise ValueError('LastEvaluatedKey not yet supported')
-    return response['Items']
 
 
-def _get_tag_name(post_tag_item):
-    return post_tag_item['sk'].split('#')[4]
+def _get_published_items(slug):
+    """The keys of a post's published and tag items, in any layout."""
+    # the pending marker shares the prefix
+    return [item for item in _query_all(_published_items_query(slug))
+            if item['sk'] != '#post#pending']
+
+
+_transaction_size = 100
+
+
+def _chunks(writes, size=_transaction_size):
+    return [writes[i:i + size] for i in range(0, len(writes), size)]
+
 
+def _pending_key(slug):
+    return _serialized(pk=f'post#{slug}', sk='#post#pending')
 
-def update_post(post):
+
+def _update_post_request(post, previous):
+    """The transactions that update a post from its `previous` state.
+
+    Only the published and tag items that change are written, and usually
+    all in one transaction. If there are more writes than fit in one, the
+    first transaction also writes a pending marker that the last deletes,
+    so that replay_pending_updates can finish an update interrupted between
+    them.
+    """
     post.version += 1
-    tag_items = _get_post_tag_items(post.slug)
-    transact_items = []
-    for item in tag_items:
-        tag_names = [tag.name for tag in post.tags]
-        # if the post is unpublished, or is not longer tagged with this
-        # tag, delete it
-        if not post.published or _get_tag_name(item) not in tag_names:
-            transact_items.append(dict(
-                Delete=dict(
-                    TableName=_table_name,
-                    Key=_serialized(pk=item['pk'], sk=item['sk'])
-                )
-            ))
-    transact_items.append(dict(
+    post.modified = _now()
+    _render(post)
+    transact_items = [dict(
         Put=dict(
             TableName=_table_name,
             Item=_post_item(post),
@@ -329,37 +1492,96 @@ def update_post(post):
                 ':version': _serializer.serialize(post.version - 1)
             }
         ),
-    ))
-    if post.published:
-        transact_items.append(dict(
-            Put=dict(
+    )]
+    writes = _published_writes(post, _published_keys(previous))
+    if len(writes) < _transaction_size:
+        return [transact_items + writes]
+
+    pending = dict(_pending_key(post.slug),
+                   version=_serializer.serialize(post.version))
+    transact_items.append(dict(Put=dict(TableName=_table_name,
+                                        Item=pending)))
+    first = _transaction_size - len(transact_items)
+    rest = writes[first:] + [dict(
+        Delete=dict(TableName=_table_name, Key=_pending_key(post.slug))
+    )]
+    return [transact_items + writes[:first]] + _chunks(rest)
+
+
+def update_post(post, previous=None):
+    """Save changes to a post, given as it was before them (`previous`,
+    which is read from the table if not given).
+
+    Raises ConcurrentUpdateException if the post has been updated since
+    `previous` was read.
+    """
+    if previous is None:
+        previous = get_post(post.slug, on_not_found=lambda: None)
+    if previous is None:
+        raise ConcurrentUpdateException('Post no longer exists')
+    _update_post(post, previous)
+    post_updated.send(post, previous_version=post.version - 1)
+
+
+def _update_post(post, previous):
+    """update_post, without sending post_updated."""
+    on_conflict = ConcurrentUpdateException('Concurrent update exception')
+    for transact_items in _update_post_request(post, previous):
+        _write(transact_items, on_conflict=on_conflict)
+    _reindex(post, previous)
+
+
+def _checked_chunks(post, writes):
+    """Split writes into transactions that only apply if the post's version
+    is still `post.version`."""
+    check = dict(
+        ConditionCheck=dict(
+            TableName=_table_name,
+            Key=_serialized(pk=f'post#{post.slug}', sk='#post'),
+            ConditionExpression='version = :version',
+            ExpressionAttributeValues={
+                ':version': _serializer.serialize(post.version)
+            }
+        )
+    )
+    return [[check] + chunk
+            for chunk in _chunks(writes, _transaction_size - 1)]
+
+
+def replay_pending_updates():
+    """Finish any post updates that were interrupted between transactions,
+    returning how many were finished."""
+    count = 0
+    markers = scan(FilterExpression='sk = :sk',
+                   ExpressionAttributeValues={':sk': '#post#pending'})
+    for marker in markers:
+        slug = marker['pk'].split('#', 1)[1]
+        post = get_post(slug, on_not_found=lambda: None)
+        try:
+            if post:
+                writes = _published_writes(post, _get_published_items(slug))
+                for transact_items in _checked_chunks(post, writes):
+                    _write(transact_items,
+                           on_conflict=ConcurrentUpdateException())
+            _conn.client.delete_item(
                 TableName=_table_name,
-                Item=_published_post_item(post)
+                Key=_pending_key(slug),
+                ConditionExpression='version = :version',
+                ExpressionAttributeValues={
+                    ':version': _serializer.serialize(marker['version'])
+                }
             )
-        ))
-        for tag in post.tags:
-            transact_items.append(dict(
-                Put=dict(
-                    TableName=_table_name,
-                    Item=_published_post_tag_item(post, tag)
-                )
-            ))
-    try:
-        _conn.client.transact_write_items(
-            TransactItems=transact_items
-        )
-    except _conn.client.exceptions.TransactionCanceledException as e:
-        reasons = [reason['Code'] for reason
-                   in e.response['CancellationReasons']]
-        if 'ConditionalCheckFailed' in reasons:
-            raise ConcurrentUpdateException('Concurrent update exception')
-        raise e
+            count += 1
+        except (ConcurrentUpdateException,
+                _conn.client.exceptions.ConditionalCheckFailedException):
+            # updated again since: try that update next time
+            pass
+    return count
 
 
-def update_tag(tag):
+def _update_tag_request(tag):
     tag.version += 1
-    transact_items = []
-    transact_items.append(dict(
+    return [dict(
         Put=dict(
             TableName=_table_name,
             Item=_tag_item(tag),
@@ -368,57 +1590,391 @@ def update_tag(tag):
                 ':version': _serializer.serialize(tag.version - 1)
             }
         ),
-    ))
+    )]
+
+
+def update_tag(tag):
+    _write(_update_tag_request(tag),
+           on_conflict=ConcurrentUpdateException('Concurrent update '
+                                                 'exception'))
+    tag_catalogue.invalidate()
+    tag_updated.send(tag)
+
+
+_scan_segments = 4
+
+
+def scan(segments=None, progress=None, **scan_args):
+    """Stream every item in the table, or those matching `scan_args`, in no
+    particular order.
+
+    The table is split into `segments` segments, each scanned on its own
+    thread. Pages are handed over through a bounded queue, so the scan runs
+    at most a few pages ahead of the consumer however big the table is. If
+    given, `progress` is called with the number of items read so far after
+    each page.
+    """
+    segments = segments or _scan_segments
+    pages = queue.Queue(maxsize=segments * 2)
+    stop = threading.Event()
+
+    def hand_over(page):
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def scan_segment(segment):
+        args = dict(scan_args, Segment=segment, TotalSegments=segments)
+        try:
+            while not stop.is_set():
+                response = _conn.table.scan(**args)
+                hand_over(response['Items'])
+                if 'LastEvaluatedKey' not in response:
+                    break
+                args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+            hand_over(None)
+        except Exception as e:
+            hand_over(e)
+
+    for segment in range(segments):
+        threading.Thread(target=scan_segment, args=(segment,),
+                         name=f'bloggy-scan-{segment}', daemon=True).start()
+
+    count = 0
+    finished = 0
     try:
-        _conn.client.transact_write_items(
-            TransactItems=transact_items
-        )
-    except _conn.client.exceptions.TransactionCanceledException as e:
-        reasons = [reason['Code'] for reason
-                   in e.response['CancellationReasons']]
-        if 'ConditionalCheckFailed' in reasons:
-            raise ConcurrentUpdateException('Concurrent update exception')
-        raise e
+        while finished < segments:
+            page = pages.get()
+            if page is None:
+                finished += 1
+                continue
+            if isinstance(page, Exception):
+                raise page
+            count += len(page)
+            if progress:
+                progress(count)
+            yield from page
+    finally:
+        # also stops the threads if the consumer gives up early
+        stop.set()
+
+
+def rerender_posts(force=False, progress=None):
+    """Regenerate the stored HTML and excerpt of every post rendered by an
+    older renderer version (or all of them, if `force` is set), rewriting its
+    published and tag items in the current layout.
+
+    Posts are rewritten without bumping their version, so this can safely
+    run alongside admin edits.
+    """
+    filter_expr = 'sk = :sk'
+    values = {':sk': '#post'}
+    if not force:
+        filter_expr += ' and (attribute_not_exists(renderer) or ' \
+            'renderer <> :renderer)'
+        values[':renderer'] = filters.RENDERER_VERSION
+
+    count = 0
+    items = scan(progress=progress, FilterExpression=filter_expr,
+                 ExpressionAttributeValues=values)
+    for item in items:
+        post = _convertor.structure(item['post'], Post)
+        _render(post)
+        transact_items = [dict(
+            Put=dict(
+                TableName=_table_name,
+                Item=_post_item(post),
+                ConditionExpression='version = :version',
+                ExpressionAttributeValues={
+                    ':version': _serializer.serialize(post.version)
+                }
+            )
+        )]
+        transact_items.extend(_published_puts(post))
+        try:
+            _write(transact_items, on_conflict=ConcurrentUpdateException())
+            count += 1
+        except ConcurrentUpdateException:
+            # updated since we read it, so it was rendered at write time
+            pass
+    return count
+
+
+def reshard_published(shards=None, progress=None):
+    """Move every post's published and tag items into the layout for
+    `shards` shards (by default, the configured number), returning how many
+    posts were moved.
+
+    Run this when changing the number of shards: until it finishes, lists
+    miss the posts still in the old layout. It also gives unpublished posts
+    saved before they had tag items their tag items.
+    """
+    shards = shards or _published_shards
+    count = 0
+    items = scan(progress=progress, FilterExpression='sk = :sk',
+                 ExpressionAttributeValues={':sk': '#post'})
+    for item in items:
+        post = _convertor.structure(item['post'], Post)
+        existing = _get_published_items(post.slug)
+        if {item['sk'] for item in existing} == \
+                {key['sk'] for key in _published_keys(post, shards)}:
+            continue
+        writes = _published_writes(post, existing, shards)
+        try:
+            for transact_items in _checked_chunks(post, writes):
+                _write(transact_items,
+                       on_conflict=ConcurrentUpdateException())
+            count += 1
+        except ConcurrentUpdateException:
+            # updated since we read it; running again will move it
+            pass
+    return count
+
+
+def truncate(workers=8, progress=None):
+    """Delete every item in the table, returning how many were deleted."""
+    count = batch_delete(scan(progress=progress,
+                              ProjectionExpression='pk, sk'),
+                         workers=workers)
+    tag_catalogue.invalidate()
+    return count
+
+
+def _items_query(pk):
+    return dict(
+        KeyConditionExpression='pk = :pk',
+        ExpressionAttributeValues={
+            ':pk': pk
+        }
+    )
 
 
-def _scan(esk=None):
-    scan_args = {}
-    if esk:
-        scan_args['ExclusiveStartKey'] = esk
+def _get_items(pk):
+    return _query_all(_items_query(pk))
 
-    response = _conn.table.scan(**scan_args)
-    for item in response['Items']:
-        yield item
 
-    if 'LastEvaluatedKey' in response:
-        yield from _scan(response['LastEvaluatedKey'])
+def _base_post(items):
+    for item in items:
+        if item['sk'] == '#post':
+            return _convertor.structure(item['post'], Post)
+    return None
 
 
-def _delete_all(items):
-    with _conn.table.batch_writer() as batch:
-        for item in items:
-            batch.delete_item(Key={'pk': item['pk'], 'sk': item['sk']})
+def delete_post(slug):
+    items = list(_get_items(pk=f'post#{slug}'))
+    batch_delete(items)
+    _reindex(None, _base_post(items))
+    post_deleted.send(slug)
 
 
-def truncate():
-    _delete_all(_scan())
+def _tagged_queries(name):
+    """Queries for the items of every post tagged `name`: the tag's list
+    partitions, and its partition of unpublished posts."""
+    yield from _list_key_queries(name)
+    yield dict(
+        IndexName='GSI',
+        KeyConditionExpression='sk = :sk',
+        ExpressionAttributeValues={':sk': _draft_tag_sk(name)},
+        ProjectionExpression='pk'
+    )
 
 
-def _get_items(pk):
+def _slugs_of(items):
+    return {item['pk'].split('#', 1)[1] for item in items}
+
+
+def _tagged_slugs(name):
+    """The slugs of every post tagged `name`."""
+    return _slugs_of(item for query_args in _tagged_queries(name)
+                     for item in _query_all(query_args))
+
+
+def _retag(slug, change, max_attempts=5):
+    """Apply `change` to a post's tags, retrying if the post is updated
+    meanwhile. Returns the updated post, or None if it didn't change.
+
+    Doesn't send post_updated: callers send posts_updated for a batch.
+    """
+    for _ in range(max_attempts):
+        post = get_post(slug, on_not_found=lambda: None)
+        if post is None:
+            return None
+        tags = change(post.tags)
+        if tags == post.tags:
+            return None
+        previous = copy.deepcopy(post)
+        post.tags = tags
+        try:
+            _update_post(post, previous)
+            return post
+        except ConcurrentUpdateException:
+            pass
+    raise ConcurrentUpdateException(f'{slug} kept changing while retagging')
+
+
+def retag_posts(name, change, workers=8, progress=None):
+    """Update every post tagged `name`, setting its tags to `change(tags)`,
+    spread over a thread pool. Returns how many posts changed.
+
+    If given, `progress` is called with the number of posts done and the
+    total after each one.
+    """
+    slugs = _tagged_slugs(name)
+    changed = []
+    try:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers) as pool:
+            futures = [pool.submit(_retag, slug, change) for slug in slugs]
+            for done, future in enumerate(
+                    concurrent.futures.as_completed(futures), start=1):
+                post = future.result()
+                if post is not None:
+                    changed.append(post)
+                if progress:
+                    progress(done, len(futures))
+    finally:
+        # including the posts changed before any failure
+        if changed:
+            posts_updated.send(changed)
+    return len(changed)
+
+
+def _without_tag(name):
+    return lambda tags: [tag for tag in tags if tag.name != name]
+
+
+def delete_tag(name, workers=8, progress=None):
+    """Remove a tag from every post that has it, then delete the tag.
+    Returns how many posts were changed.
+
+    Safe to run again if interrupted: the tag is only deleted once no post
+    has it.
+    """
+    count = retag_posts(name, _without_tag(name), workers=workers,
+                        progress=progress)
+    _delete_tag_items(name)
+    return count
+
+
+def _delete_tag_items(name):
+    batch_delete(_get_items(pk=f'tag#{name}'))
+    tag_catalogue.invalidate()
+
+
+class LeaseLostException(Exception):
+    pass
+
+
+def _job_key(job_id):
+    return {
+        'pk': f'job#{job_id}',
+        'sk': '#job'
+    }
+
+
+def _job_item(job):
+    return dict(_job_key(job.id),
+                data=job.created.isoformat(),
+                job=_convertor.unstructure(job))
+
+
+def _save_job_request(job):
+    job.created = job.modified = _now()
+    return [dict(
+        Put=dict(
+            TableName=_table_name,
+            ConditionExpression='attribute_not_exists(pk)',
+            Item=_serialized(**_job_item(job))
+        )
+    )]
+
+
+def save_job(job):
+    _write(_save_job_request(job),
+           on_conflict=DuplicateKeyException('Item already exists'))
+
+
+def get_job(job_id, on_not_found):
+    response = _conn.table.get_item(Key=_job_key(job_id))
+    if 'Item' not in response:
+        on_not_found()
+        return None
+    return _convertor.structure(response['Item']['job'], Job)
+
+
+def get_jobs(limit=20):
+    """The most recently created jobs."""
     response = _conn.table.query(
-        KeyConditionExpression='pk = :pk',
+        IndexName='GSI',
+        KeyConditionExpression='sk = :sk',
+        ExpressionAttributeValues={':sk': '#job'},
+        ScanIndexForward=False,
+        Limit=limit
+    )
+    return [_convertor.structure(item['job'], Job)
+            for item in response['Items']]
+
+
+def get_unfinished_jobs():
+    query_args = dict(
+        IndexName='GSI',
+        KeyConditionExpression='sk = :sk',
+        FilterExpression='job.#status in (:pending, :running)',
+        ExpressionAttributeNames={'#status': 'status'},
         ExpressionAttributeValues={
-            ':pk': pk
+            ':sk': '#job',
+            ':pending': 'pending',
+            ':running': 'running'
         }
     )
-    if 'LastEvaluatedKey' in response:
-        raise ValueError('LastEvaluatedKey not yet supported')
-    return response['Items']
+    return [_convertor.structure(item['job'], Job)
+            for item in _query_all(query_args)]
 
 
-def delete_post(slug):
-    _delete_all(_get_items(pk=f'post#{slug}'))
+def claim_job(job_id, owner, lease=60):
+    """Take the lease on a job for `lease` seconds, returning the job, or
+    None if it's finished or another owner's lease hasn't expired."""
+    now = time.time()
+    try:
+        response = _conn.table.update_item(
+            Key=_job_key(job_id),
+            UpdateExpression='set #owner = :owner, lease = :lease, '
+                             'job.#status = :running',
+            ConditionExpression='job.#status in (:pending, :running) and '
+                                '(attribute_not_exists(lease) or '
+                                'lease < :now or #owner = :owner)',
+            ExpressionAttributeNames={'#owner': 'owner',
+                                      '#status': 'status'},
+            ExpressionAttributeValues={
+                ':owner': owner,
+                ':lease': int(now + lease),
+                ':now': int(now),
+                ':pending': 'pending',
+                ':running': 'running'
+            },
+            ReturnValues='ALL_NEW'
+        )
+    except _conn.client.exceptions.ConditionalCheckFailedException:
+        return None
+    return _convertor.structure(response['Attributes']['job'], Job)
+
 
+def save_job_progress(job, owner, lease=60):
+    """Record a job's progress, renewing the lease on it.
 
-def delete_tag(name):
-    _delete_all(_get_items(pk=f'tag#{name}'))
+    Raises LeaseLostException if another owner has taken the job over.
+    """
+    job.modified = _now()
+    try:
+        _conn.table.put_item(
+            Item=dict(_job_item(job), owner=owner,
+                      lease=int(time.time() + lease)),
+            ConditionExpression='#owner = :owner',
+            ExpressionAttributeNames={'#owner': 'owner'},
+            ExpressionAttributeValues={':owner': owner}
+        )
+    except _conn.client.exceptions.ConditionalCheckFailedException:
+        raise LeaseLostException(f'Job {job.id} was taken over')
@@ -0,0 +1,176 @@
+"""Render the published blog to a directory of static HTML files.
+
+Pages are written as `<path>/index.html` so that the exported tree mirrors
+the app's URLs (`/blog/`, `/blog/<slug>/`), with list pages beyond the first
+and per-tag pages at the paths given by `blog.static_list_path`. A manifest
+of exported post versions lets later runs re-render only what changed.
+"""
+import concurrent.futures
+import dataclasses
+import json
+import os
+import shutil
+
+import flask
+
+from . import blog
+from . import db
+from . import filters
+
+
+MANIFEST = '.bloggy-export.json'
+
+
+@dataclasses.dataclass
+class ExportResult:
+    list_pages: int = 0
+    posts_rendered: int = 0
+    posts_unchanged: int = 0
+    posts_removed: int = 0
+
+
+def _write(out_dir, path, html):
+    filename = os.path.join(out_dir, path.strip('/'), 'index.html')
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(html)
+
+
+def _render(app, url, template, **ctx):
+    with app.test_request_context(url):
+        flask.g.static_export = True
+        return flask.render_template(template, **ctx)
+
+
+def _load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if manifest.get('renderer') != filters.RENDERER_VERSION:
+        return {}
+    return manifest.get('posts', {})
+
+
+def _save_manifest(out_dir, posts):
+    with open(os.path.join(out_dir, MANIFEST), 'w') as f:
+        json.dump(dict(renderer=filters.RENDERER_VERSION, posts=posts), f,
+                  indent=2, sort_keys=True)
+
+
+def _list_pages(tag=None):
+    pages = []
+    paging_key = None
+    while True:
+        pageable = db.get_published_posts(tag=tag, paging_key=paging_key)
+        # a full last page can still come back with a paging key, leaving
+        # an empty page after it
+        if pageable.items or not pages:
+            pages.append(pageable.items)
+        if not pageable.paging_key:
+            return pages
+        paging_key = pageable.paging_key
+
+
+def _export_list(app, out_dir, tag=None):
+    """Write every list page for `tag` (or the home page) and return the
+    posts listed, plus the number of pages written."""
+    pages = _list_pages(tag)
+    url = '/blog/' + (f'?tag={tag}' if tag else '')
+    for page, posts in enumerate(pages, start=1):
+        html = _render(app, url, 'blog/list.html',
+                       posts=posts,
+                       prev=page - 1,
+                       next=page + 1 if page < len(pages) else None)
+        _write(out_dir, blog.static_list_path(tag=tag, page=page), html)
+    return [post for posts in pages for post in posts], len(pages)
+
+
+_worker_app = None
+
+
+def _init_worker():
+    global _worker_app
+    from . import create_app
+    _worker_app = create_app()
+
+
+def _export_post(out_dir, post, app=None):
+    html = _render(app or _worker_app, f'/blog/{post.slug}/',
+                   'blog/post.html', post=post)
+    _write(out_dir, f'/blog/{post.slug}/', html)
+    return post.slug
+
+
+def _current_posts(slugs, versions):
+    """Read the posts to render, leaving out any deleted or unpublished since
+    the lists were read, and taking them out of `versions` so that the
+    manifest doesn't record them as exported."""
+    for slug in slugs:
+        post = db.get_post(slug=slug, on_not_found=lambda: None)
+        if post is None or not post.published:
+            del versions[slug]
+        else:
+            yield post
+
+
+def export(out_dir, full=False, workers=None):
+    """Export the published blog to `out_dir`.
+
+    Unless `full` is set, only posts whose version differs from the last
+    export's manifest are re-rendered. Posts are rendered across a pool of
+    `workers` processes (defaulting to the CPU count); pass 0 to render in
+    this process.
+    """
+    app = flask.current_app._get_current_object()
+    os.makedirs(out_dir, exist_ok=True)
+    result = ExportResult()
+    previous = {} if full else _load_manifest(out_dir)
+
+    summaries, result.list_pages = _export_list(app, out_dir)
+    tags = sorted({t.name for s in summaries for t in s.tags})
+    for tag in tags:
+        result.list_pages += _export_list(app, out_dir, tag=tag)[1]
+
+    versions = {s.slug: s.version for s in summaries}
+    changed = [slug for slug, version in versions.items()
+               if previous.get(slug) != version]
+    result.posts_unchanged = len(versions) - len(changed)
+
+    for slug in set(previous) - set(versions):
+        # only remove the page itself: a slug like 'page' or 'tags' shares
+        # its directory with list pages
+        try:
+            os.remove(os.path.join(out_dir, 'blog', slug, 'index.html'))
+            os.rmdir(os.path.join(out_dir, 'blog', slug))
+        except OSError:
+            pass
+        result.posts_removed += 1
+
+    posts = _current_posts(changed, versions)
+    if workers == 0:
+        for post in posts:
+            _export_post(out_dir, post, app=app)
+            result.posts_rendered += 1
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker) as pool:
+            futures = [pool.submit(_export_post, out_dir, post)
+                       for post in posts]
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+                result.posts_rendered += 1
+
+    with app.test_request_context('/'):
+        flask.g.static_export = True
+        with open(os.path.join(out_dir, '404.html'), 'w') as f:
+            f.write(flask.render_template('404.html'))
+        with open(os.path.join(out_dir, 'index.html'), 'w') as f:
+            f.write('<!doctype html><meta http-equiv="refresh" '
+                    'content="0; url=/blog/">')
+    shutil.copytree(app.static_folder, os.path.join(out_dir, 'static'),
+                    dirs_exist_ok=True)
+
+    _save_manifest(out_dir, versions)
+    return result
@@ -1,14 +1,73 @@
-import bleach
-import markdown
 import markupsafe
 
+from . import cache
+from . import timing
+
+
+# Bump whenever a change here alters the HTML produced for a given body, so
+# that stored renderings get regenerated (see `db.rerender_posts`).
+RENDERER_VERSION = 1
+
+render_cache = cache.RenderCache()
+
 
 def md_to_html(md):
+    # deferred, as only needed when a post is saved or rendered from a stale
+    # copy
+    import bleach
+    import markdown
+
     allowed_tags = ['p', 'a', 'strong', 'li', 'em', 'ol', 'ul', 'h1', 'h2',
                     'h3']
-    return markupsafe.Markup(bleach.clean(markdown.markdown(md),
-                                          tags=allowed_tags))
+    with timing.timed('markdown'):
+        return markupsafe.Markup(bleach.clean(markdown.markdown(md),
+                                              tags=allowed_tags))
 
 
 def first_para(html):
     return markupsafe.Markup(html[:html.find('</p>') + 4])
+
+
+def _stored_rendering(post):
+    rendered = getattr(post, 'rendered', None)
+    if rendered and rendered.version == RENDERER_VERSION:
+        return rendered
+    return None
+
+
+def post_html(post):
+    """Return the post's HTML, preferring the copy stored at write time and
+    falling back to rendering (and caching) it for this version."""
+    rendered = _stored_rendering(post)
+    if rendered:
+        return markupsafe.Markup(rendered.html)
+    html = render_cache.get_or_render(post.slug, post.version,
+                                      lambda: str(md_to_html(post.body)))
+    return markupsafe.Markup(html)
+
+
+def post_excerpt(post):
+    """Return the first paragraph of a post, or a post summary's stored
+    excerpt."""
+    if getattr(post, 'excerpt', None) is not None:
+        return markupsafe.Markup(post.excerpt)
+    rendered = _stored_rendering(post)
+    if rendered:
+        return markupsafe.Markup(rendered.excerpt)
+    return first_para(post_html(post))
+
+
+def evict_post_html(post, previous_version=None, **kwargs):
+    """Signal receiver that drops cached HTML for superseded versions."""
+    if previous_version is not None:
+        render_cache.invalidate(post.slug, previous_version)
+
+
+def evict_posts_html(posts, **kwargs):
+    """Signal receiver like evict_post_html, for posts updated together."""
+    for post in posts:
+        render_cache.invalidate(post.slug, post.version - 1)
+
+
+def evict_deleted_post_html(slug, **kwargs):
+    render_cache.invalidate(slug)
@@ -14,6 +14,9 @@ class SelectMultipleField(wtforms.SelectMultipleField):
     - doesn't override obj data when formdata isn't provided for a field
     """
 
+    def _acceptable(self):
+        return [self.coerce(c[0]) for c in self.iter_choices()]
+
     def pre_validate(self, form):
         if not self.validate_choice or not self.data:
             return
@@ -21,7 +24,7 @@ class SelectMultipleField(wtforms.SelectMultipleField):
         if self.choices is None:
             raise TypeError(self.gettext("Choices cannot be None."))
 
-        acceptable = [self.coerce(c[0]) for c in self.iter_choices()]
+        acceptable = self._acceptable()
         if any(d not in acceptable for d in self.data):
             raise wtforms.ValidationError('Not a valid choice')
 
@@ -47,6 +50,11 @@ class SelectMultipleObjectsField(SelectMultipleField):
         self.option_value_attr = option_value_attr
         self.option_text_attr = option_text_attr
 
+    def _acceptable(self):
+        # objects needn't be hashable, but their option values are
+        return _ValueSet({value for value, _ in self.choices},
+                         self.option_value_attr)
+
     def process(self, formdata, *args, **kwargs):
         objects = self.fetch_objects_fn()
         self.choices = [(
@@ -57,7 +65,10 @@ class SelectMultipleObjectsField(SelectMultipleField):
 
         def coerce_to_obj(s):
             if isinstance(s, str):
-                return mapping[s]
+                try:
+                    return mapping[s]
+                except KeyError:
+                    raise ValueError(f'Not a valid choice: {s}')
             # if it's not a string, assume it's already an object and just
             # return it
             return s
@@ -66,6 +77,17 @@ class SelectMultipleObjectsField(SelectMultipleField):
         super().process(formdata, *args, **kwargs)
 
 
+class _ValueSet:
+    """Tests objects for membership by one of their attributes."""
+
+    def __init__(self, values, attr):
+        self.values = values
+        self.attr = attr
+
+    def __contains__(self, obj):
+        return getattr(obj, self.attr, None) in self.values
+
+
 url_component_regexp = wtforms.validators.Regexp(
     r'^[a-zA-Z0-9_\-]+$',
     message='Only lowercase alphanumeric characters, underscores and dashes '
@@ -79,7 +101,7 @@ basic_string_regexp = wtforms.validators.Regexp(
 
 
 def _fetch_tags():
-    return db.get_all_tags(limit=100).items
+    return db.tag_catalogue.tags()
 
 
 class EditPostForm(wtforms.Form):
@@ -108,19 +130,13 @@ class EditPostForm(wtforms.Form):
     )
 
 
-def no_op():
-    pass
-
-
 def unique_post_check(form, field):
-    post = db.get_post(slug=field.data, on_not_found=no_op)
-    if post is not None:
+    if db.post_exists(field.data):
         raise wtforms.validators.ValidationError('Slug already exists')
 
 
 def unique_tag_check(form, field):
-    tag = db.get_tag(name=field.data, on_not_found=no_op)
-    if tag is not None:
+    if db.tag_exists(field.data):
         raise wtforms.validators.ValidationError('Tag already exists')
 
 
@@ -0,0 +1,159 @@
+"""Bulk import of posts and tags, e.g. to seed or restore a blog.
+
+Accepts a JSON file holding a list of records (like posts.json) or an object
+with "posts" and "tags" lists, or a JSON Lines file with one record per line.
+Records with a slug are posts; anything else is a tag. Tags referenced by
+posts are created too, unless the file defines them itself.
+"""
+import dataclasses
+import itertools
+import json
+import time
+
+from . import db
+from . import filters
+from . import search
+
+
+@dataclasses.dataclass
+class ImportResult:
+    posts: int = 0
+    tags: int = 0
+    skipped: int = 0
+    items: int = 0
+    seconds: float = 0
+
+    @property
+    def items_per_second(self):
+        return self.items / self.seconds if self.seconds else 0
+
+
+def read_records(path):
+    """Stream the records in a .json or .jsonl file."""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        data = json.load(f)
+    if isinstance(data, dict):
+        yield from data.get('tags', [])
+        yield from data.get('posts', [])
+    else:
+        yield from data
+
+
+def structure(records):
+    """Turn records into Posts and Tags via the db module's converter."""
+    for record in records:
+        if 'slug' in record:
+            yield db._convertor.structure(record, db.Post)
+        else:
+            yield db._convertor.structure(record, db.Tag)
+
+
+def _new_only(objects, result):
+    """Drop posts whose slug already exists, checking a batch at a time."""
+    objects = iter(objects)
+    while batch := list(itertools.islice(objects, db._batch_get_size)):
+        existing = db.posts_exist(o.slug for o in batch
+                                  if isinstance(o, db.Post))
+        for obj in batch:
+            if isinstance(obj, db.Post) and obj.slug in existing:
+                result.skipped += 1
+            else:
+                yield obj
+
+
+def _with_existing(objects, existing):
+    """Note the items of posts whose slug already exists, checking a batch
+    at a time."""
+    objects = iter(objects)
+    while batch := list(itertools.islice(objects, db._batch_get_size)):
+        for slug in db.posts_exist(o.slug for o in batch
+                                   if isinstance(o, db.Post)):
+            existing[slug] = list(db._get_items(f'post#{slug}'))
+        yield from batch
+
+
+class _Pipeline:
+    """Turns objects into items, counting them and noting the tags that
+    posts refer to, and what the posts replace."""
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.result = ImportResult()
+        self.tags = {}
+        # search index entries for the posts written
+        self.documents = {}
+        # the items of existing posts, by slug, and those of them that
+        # weren't overwritten
+        self.existing = {}
+        self.stale = []
+        # (post, previous) pairs, for the page index
+        self.moves = []
+
+    def _post_items(self, post):
+        items = db._post_items(post)
+        existing = self.existing.get(post.slug, [])
+        written = {(item['pk']['S'], item['sk']['S']) for item in items}
+        self.stale.extend(item for item in existing
+                          if (item['pk'], item['sk']) not in written)
+        self.moves.append((post, db._base_post(existing)))
+        return items
+
+    def items(self):
+        for obj in self.objects:
+            if isinstance(obj, db.Post):
+                self.result.posts += 1
+                for tag in obj.tags:
+                    self.tags.setdefault(tag.name, tag)
+                db._render(obj)
+                obj.modified = obj.modified or db._now()
+                self.documents[obj.slug] = search._post_document(obj) \
+                    if obj.published else None
+                yield from self._post_items(obj)
+            else:
+                self.result.tags += 1
+                # defined explicitly, so don't also create it from a post
+                self.tags[obj.name] = None
+                yield db._tag_item(obj)
+
+        for tag in self.tags.values():
+            if tag is not None:
+                self.result.tags += 1
+                yield db._tag_item(tag)
+
+
+def import_objects(objects, workers=8, skip_existing=False):
+    """Write Posts and Tags with batched, parallel writes.
+
+    Existing posts with the same slug are replaced, dropping any of their
+    published and tag items that the new version doesn't have, unless
+    `skip_existing` is set, in which case they are left alone. Existing
+    tags are overwritten.
+
+    Rather than sending a signal per post, the search and page indexes are
+    each updated once, from the posts written, when the writes are done.
+    """
+    pipeline = _Pipeline(objects)
+    if skip_existing:
+        pipeline.objects = _new_only(objects, pipeline.result)
+    else:
+        pipeline.objects = _with_existing(objects, pipeline.existing)
+    start = time.perf_counter()
+    pipeline.result.items = db.batch_put(pipeline.items(), workers=workers)
+    db.batch_delete(pipeline.stale, workers=workers)
+    for slug in pipeline.existing:
+        filters.render_cache.invalidate(slug)
+    search.index.update(pipeline.documents)
+    db._reindex_all(pipeline.moves)
+    db.tag_catalogue.invalidate()
+    pipeline.result.seconds = time.perf_counter() - start
+    return pipeline.result
+
+
+def import_file(path, workers=8, skip_existing=False):
+    return import_objects(structure(read_records(path)), workers=workers,
+                          skip_existing=skip_existing)
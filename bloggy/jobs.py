@@ -0,0 +1,165 @@
+"""Background jobs, for work too slow to do while an admin waits, such as
+updating every post with a tag.
+
+Jobs run on a thread pool in this process. Each one records its progress
+in the table as it goes, so that the admin can show it and, should the
+process die part way through, `Runner.resume` (or `flask resume-jobs`) can
+carry on from the last checkpoint, here or in another process.
+"""
+import concurrent.futures
+import random
+import threading
+import time
+import traceback
+import uuid
+
+from . import db
+
+
+_handlers = {}
+
+
+def handler(kind):
+    """Register a function to run jobs of `kind`.
+
+    It's called with the job, a `checkpoint(key, done, total)` function to
+    record progress, and the job's args. On a retry or resume,
+    `job.checkpoint` holds the last key recorded, so it should skip work up
+    to and including that key.
+    """
+    def register(fn):
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+class Runner:
+
+    def __init__(self, workers=2, max_attempts=5, lease=60):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.owner = uuid.uuid4().hex
+        self._executor = None
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def _start(self, job_id):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='bloggy-jobs'
+                )
+            future = self._executor.submit(self.run, job_id)
+            self._futures.add(future)
+        future.add_done_callback(self._futures.discard)
+
+    def submit(self, kind, **args):
+        """Record a new job and start it in the background."""
+        if kind not in _handlers:
+            raise ValueError(f'Unknown job kind: {kind}')
+        job = db.Job(id=uuid.uuid4().hex, kind=kind, args=args)
+        db.save_job(job)
+        self._start(job.id)
+        return job
+
+    def resume(self):
+        """Start every unfinished job in the background, returning how many
+        there were. Jobs still leased by a live process are left to it."""
+        jobs = db.get_unfinished_jobs()
+        for job in jobs:
+            self._start(job.id)
+        return len(jobs)
+
+    def join(self, timeout=None):
+        """Wait for the jobs started so far to finish."""
+        concurrent.futures.wait(list(self._futures), timeout=timeout)
+
+    def run(self, job_id):
+        """Run a job in this thread, retrying with backoff, and return it;
+        or return None if another process holds it."""
+        job = db.claim_job(job_id, self.owner, self.lease)
+        if job is None:
+            return None
+
+        def checkpoint(key, done, total):
+            job.checkpoint, job.done, job.total = key, done, total
+            db.save_job_progress(job, self.owner, self.lease)
+
+        while True:
+            try:
+                _handlers[job.kind](job, checkpoint, **job.args)
+                job.status = 'done'
+                job.error = None
+            except db.LeaseLostException:
+                return None
+            except Exception:
+                job.attempts += 1
+                job.error = traceback.format_exc(limit=3)
+                if job.attempts >= self.max_attempts:
+                    job.status = 'failed'
+                else:
+                    db.save_job_progress(job, self.owner, self.lease)
+                    time.sleep(min(0.5 * 2 ** job.attempts, 30) *
+                               random.uniform(0.5, 1))
+                    continue
+            db.save_job_progress(job, self.owner, self.lease)
+            return job
+
+
+runner = Runner()
+
+
+_batch_size = 25
+
+
+def _retag(job, checkpoint, name, change, workers=8):
+    """Apply `change` to the tags of every post tagged `name`, a batch at a
+    time in slug order, checkpointing after each batch."""
+    slugs = sorted(db._tagged_slugs(name))
+    # retagged posts may have dropped out of the list, but counting them
+    # would need the list as it was when the job started
+    remaining = [slug for slug in slugs
+                 if job.checkpoint is None or slug > job.checkpoint]
+    done = job.done
+    total = done + len(remaining)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        for i in range(0, len(remaining), _batch_size):
+            batch = remaining[i:i + _batch_size]
+            futures = [pool.submit(db._retag, slug, change)
+                       for slug in batch]
+            concurrent.futures.wait(futures)
+            # including the posts changed before any failure, which a
+            # rerun of the batch would find already changed
+            posts = [future.result() for future in futures
+                     if not future.exception() and future.result()]
+            if posts:
+                db.posts_updated.send(posts)
+            for future in futures:
+                future.result()
+            done += len(batch)
+            checkpoint(batch[-1], done, total)
+
+
+@handler('relabel_tag')
+def relabel_tag(job, checkpoint, name):
+    """Copy a tag's current label onto every post that has it."""
+    tag = db.get_tag(name, on_not_found=lambda: None)
+    if tag is None:
+        return
+    # leaving posts that a job for a later update has already reached
+    _retag(job, checkpoint, name,
+           lambda tags: [tag if t.name == name and t.version < tag.version
+                         else t for t in tags])
+
+
+@handler('delete_tag')
+def delete_tag(job, checkpoint, name):
+    """Like db.delete_tag, in batches."""
+    _retag(job, checkpoint, name, db._without_tag(name))
+    db._delete_tag_items(name)
+
+
+def relabel_on_update(tag, **kwargs):
+    """Signal receiver that starts copying an updated tag onto its posts."""
+    runner.submit('relabel_tag', name=tag.name)
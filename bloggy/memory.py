@@ -0,0 +1,1184 @@
+"""An in-memory stand-in for DynamoDB, for tests, benchmarks and local
+development without DynamoDB Local: `db.connect(backend='memory')`, or
+BLOGGY_DB_BACKEND=memory.
+
+It supports what `bloggy.db` uses, through both boto3's Table resource and
+the low-level client: get, put, update and delete (with condition
+expressions), query on the table or a global secondary index, scan (in
+segments), batch writes and gets, and transactions. Each table partition
+and index partition is a sorted list of keys, so a query finds where to
+start by binary search. Expressions are parsed and evaluated here, so they
+behave as DynamoDB's do; size limits, capacity and throttling are not
+modelled, and a page only stops early when `Limit` is reached.
+
+Tables live in `database`, shared by every connection in the process.
+`Database.snapshot` and `Database.restore` save and put back the contents
+of every table, e.g. to reset them between tests.
+"""
+import bisect
+import copy
+import decimal
+import functools
+import re
+import threading
+import time
+import zlib
+
+import botocore.exceptions
+
+from . import timing
+
+
+def _types():
+    import boto3.dynamodb.types
+    return boto3.dynamodb.types
+
+
+class _Error(botocore.exceptions.ClientError):
+    code = None
+
+    def __init__(self, message, operation_name, **response):
+        super().__init__(
+            dict(response, Error=dict(Code=self.code, Message=message)),
+            operation_name
+        )
+
+
+class ConditionalCheckFailedException(_Error):
+    code = 'ConditionalCheckFailedException'
+
+
+class TransactionCanceledException(_Error):
+    code = 'TransactionCanceledException'
+
+
+class ResourceNotFoundException(_Error):
+    code = 'ResourceNotFoundException'
+
+
+class ValidationException(_Error):
+    code = 'ValidationException'
+
+
+class _Exceptions:
+    """Like a botocore client's `exceptions`."""
+    ClientError = botocore.exceptions.ClientError
+    ConditionalCheckFailedException = ConditionalCheckFailedException
+    TransactionCanceledException = TransactionCanceledException
+    ResourceNotFoundException = ResourceNotFoundException
+    ValidationException = ValidationException
+
+
+# Expressions
+
+_MISSING = object()
+
+_token = re.compile(r'''
+    \s*(?:
+        (?P<number>\d+)
+      | (?P<name>[#:]?[A-Za-z_][A-Za-z0-9_\-]*)
+      | (?P<op><>|<=|>=|[=<>()\[\],.+\-])
+    )''', re.VERBOSE)
+
+_keywords = {'and', 'or', 'not', 'between', 'in', 'set', 'remove', 'add',
+             'delete'}
+
+
+def _tokens(expression):
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = _token.match(expression, pos)
+        if not match:
+            raise ValueError(f'Invalid expression at {expression[pos:]!r}')
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'name' and text.lower() in _keywords:
+            kind, text = 'keyword', text.lower()
+        tokens.append((kind, text))
+        pos = match.end()
+    return tokens
+
+
+def _kind(value):
+    if isinstance(value, bool):
+        return 'BOOL'
+    if isinstance(value, (decimal.Decimal, int)):
+        return 'N'
+    if isinstance(value, str):
+        return 'S'
+    if value is None:
+        return 'NULL'
+    if isinstance(value, dict):
+        return 'M'
+    if isinstance(value, list):
+        return 'L'
+    if isinstance(value, set):
+        return {'S': 'SS', 'N': 'NS'}.get(_kind(next(iter(value))), 'BS')
+    return 'B'
+
+
+def _equal(a, b):
+    return a is not _MISSING and b is not _MISSING and \
+        _kind(a) == _kind(b) and a == b
+
+
+def _ordered(a, b):
+    """Whether a and b can be compared with < and the like."""
+    return a is not _MISSING and b is not _MISSING and \
+        _kind(a) == _kind(b) and _kind(a) in ('S', 'N', 'B')
+
+
+_comparisons = {
+    '=': _equal,
+    '<>': lambda a, b: a is not _MISSING and b is not _MISSING and
+    not _equal(a, b),
+    '<': lambda a, b: _ordered(a, b) and a < b,
+    '<=': lambda a, b: _ordered(a, b) and a <= b,
+    '>': lambda a, b: _ordered(a, b) and a > b,
+    '>=': lambda a, b: _ordered(a, b) and a >= b,
+}
+
+
+def _get(item, path):
+    value = item
+    for part in path:
+        try:
+            value = value[part]
+        except (KeyError, IndexError, TypeError):
+            return _MISSING
+    return value
+
+
+def _size(value):
+    if value is _MISSING or _kind(value) in ('N', 'BOOL', 'NULL'):
+        return _MISSING
+    if isinstance(value, str):
+        return decimal.Decimal(len(value.encode('utf-8')))
+    return decimal.Decimal(len(value))
+
+
+def _begins_with(value, prefix):
+    return _ordered(value, prefix) and _kind(value) != 'N' and \
+        value[:len(prefix)] == prefix
+
+
+def _contains(value, operand):
+    if value is _MISSING or operand is _MISSING:
+        return False
+    if isinstance(value, str):
+        return isinstance(operand, str) and operand in value
+    if isinstance(value, (set, list)):
+        return any(_equal(v, operand) for v in value)
+    return False
+
+
+class _Parser:
+    """Parses condition, key condition, projection and update expressions
+    into functions of an item."""
+
+    def __init__(self, expression, names=None, values=None):
+        self.tokens = _tokens(expression)
+        self.pos = 0
+        self.names = names or {}
+        self.values = values or {}
+
+    def peek(self, offset=0):
+        pos = self.pos + offset
+        return self.tokens[pos] if pos < len(self.tokens) else (None, None)
+
+    def next(self):
+        token = self.peek()
+        if token[0] is None:
+            raise ValueError('Unexpected end of expression')
+        self.pos += 1
+        return token
+
+    def accept(self, text):
+        if self.peek()[1] == text:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, text):
+        if not self.accept(text):
+            raise ValueError(f'Expected {text!r}, got {self.peek()[1]!r}')
+
+    def done(self):
+        if self.peek()[0] is not None:
+            raise ValueError(f'Unexpected {self.peek()[1]!r}')
+
+    # paths and operands
+
+    def name(self, text):
+        if text.startswith('#'):
+            try:
+                return self.names[text]
+            except KeyError:
+                raise ValueError(f'No value for attribute name {text}')
+        return text
+
+    def path(self):
+        kind, text = self.next()
+        if kind != 'name' or text.startswith(':'):
+            raise ValueError(f'Expected an attribute, got {text!r}')
+        path = [self.name(text)]
+        while True:
+            if self.accept('.'):
+                path.append(self.name(self.next()[1]))
+            elif self.accept('['):
+                path.append(int(self.next()[1]))
+                self.expect(']')
+            else:
+                return tuple(path)
+
+    def value(self, text):
+        try:
+            value = self.values[text]
+        except KeyError:
+            raise ValueError(f'No value for {text}')
+        return lambda item: value
+
+    def operand(self):
+        kind, text = self.peek()
+        if kind == 'name' and text.startswith(':'):
+            self.pos += 1
+            return self.value(text)
+        if text == 'size' and self.peek(1)[1] == '(':
+            self.pos += 2
+            path = self.path()
+            self.expect(')')
+            return lambda item: _size(_get(item, path))
+        path = self.path()
+        return lambda item: _get(item, path)
+
+    # conditions
+
+    def condition(self):
+        left = self.conjunction()
+        while self.accept('or'):
+            right = self.conjunction()
+            left = (lambda a, b: lambda item: a(item) or b(item))(left, right)
+        return left
+
+    def conjunction(self):
+        left = self.negation()
+        while self.accept('and'):
+            right = self.negation()
+            left = (lambda a, b: lambda item: a(item) and b(item))(left, right)
+        return left
+
+    def negation(self):
+        if self.accept('not'):
+            inner = self.negation()
+            return lambda item: not inner(item)
+        return self.primary()
+
+    def primary(self):
+        if self.accept('('):
+            inner = self.condition()
+            self.expect(')')
+            return inner
+        kind, text = self.peek()
+        if kind == 'name' and self.peek(1)[1] == '(' and text != 'size':
+            return self.function()
+        left = self.operand()
+        if self.accept('between'):
+            low = self.operand()
+            self.expect('and')
+            high = self.operand()
+            return lambda item: _ordered(left(item), low(item)) and \
+                low(item) <= left(item) <= high(item)
+        if self.accept('in'):
+            self.expect('(')
+            options = [self.operand()]
+            while self.accept(','):
+                options.append(self.operand())
+            self.expect(')')
+            return lambda item: any(_equal(left(item), option(item))
+                                    for option in options)
+        op = self.next()[1]
+        if op not in _comparisons:
+            raise ValueError(f'Expected a comparison, got {op!r}')
+        compare = _comparisons[op]
+        right = self.operand()
+        return lambda item: compare(left(item), right(item))
+
+    def function(self):
+        name = self.next()[1]
+        self.expect('(')
+        if name in ('attribute_exists', 'attribute_not_exists'):
+            path = self.path()
+            self.expect(')')
+            exists = name == 'attribute_exists'
+            return lambda item: (_get(item, path) is not _MISSING) == exists
+        if name in ('begins_with', 'contains'):
+            a = self.operand()
+            self.expect(',')
+            b = self.operand()
+            self.expect(')')
+            test = _begins_with if name == 'begins_with' else _contains
+            return lambda item: test(a(item), b(item))
+        if name == 'attribute_type':
+            path = self.path()
+            self.expect(',')
+            type_ = self.operand()
+            self.expect(')')
+            return lambda item: _get(item, path) is not _MISSING and \
+                _kind(_get(item, path)) == type_(item)
+        raise ValueError(f'Unsupported function: {name}')
+
+    # key conditions: the hash key's equality and an optional range key
+    # condition, as (attribute, operator, values) triples
+
+    def key_conditions(self):
+        conditions = [self.key_condition()]
+        while self.accept('and'):
+            conditions.append(self.key_condition())
+        self.done()
+        return conditions
+
+    def key_condition(self):
+        if self.accept('('):
+            condition = self.key_condition()
+            self.expect(')')
+            return condition
+        if self.peek()[1] == 'begins_with':
+            self.pos += 2
+            path = self.path()
+            self.expect(',')
+            prefix = self.next()[1]
+            self.expect(')')
+            return path[0], 'begins_with', [self.values[prefix]]
+        path = self.path()
+        if self.accept('between'):
+            low = self.next()[1]
+            self.expect('and')
+            high = self.next()[1]
+            return path[0], 'between', [self.values[low], self.values[high]]
+        op = self.next()[1]
+        if op not in _comparisons or op == '<>':
+            raise ValueError(f'Invalid key condition operator: {op!r}')
+        return path[0], op, [self.values[self.next()[1]]]
+
+    # projections and updates
+
+    def paths(self):
+        paths = [self.path()]
+        while self.accept(','):
+            paths.append(self.path())
+        self.done()
+        return paths
+
+    def update_value(self):
+        kind, text = self.peek()
+        if text in ('if_not_exists', 'list_append') and \
+                self.peek(1)[1] == '(':
+            self.pos += 2
+            a = self.operand()
+            self.expect(',')
+            b = self.operand()
+            self.expect(')')
+            if text == 'if_not_exists':
+                value = (lambda a, b: lambda item: b(item)
+                         if a(item) is _MISSING else a(item))(a, b)
+            else:
+                value = (lambda a, b: lambda item: a(item) + b(item))(a, b)
+        else:
+            value = self.operand()
+        if self.peek()[1] in ('+', '-'):
+            op = self.next()[1]
+            right = self.operand()
+            left = value
+            if op == '+':
+                return lambda item: left(item) + right(item)
+            return lambda item: left(item) - right(item)
+        return value
+
+    def updates(self):
+        """A list of (action, path, value function) triples."""
+        actions = []
+        while self.peek()[0] is not None:
+            kind, action = self.next()
+            if action not in ('set', 'remove'):
+                raise ValueError(f'Unsupported update action: {action!r}')
+            while True:
+                path = self.path()
+                if action == 'set':
+                    self.expect('=')
+                    actions.append(('set', path, self.update_value()))
+                else:
+                    actions.append(('remove', path, None))
+                if not self.accept(','):
+                    break
+        return actions
+
+
+def _condition(expression, names, values):
+    if not expression:
+        return lambda item: True
+    parser = _Parser(expression, names, values)
+    condition = parser.condition()
+    parser.done()
+    return condition
+
+
+def _project(item, paths):
+    projected = {}
+    for path in paths:
+        value = _get(item, path)
+        if value is _MISSING:
+            continue
+        target = projected
+        source = item
+        for i, part in enumerate(path[:-1]):
+            source = source[part]
+            if part not in target:
+                target[part] = {} if isinstance(source, dict) else []
+            target = target[part]
+        if isinstance(target, list):
+            target.append(value)
+        else:
+            target[path[-1]] = value
+    return projected
+
+
+def _apply_updates(item, actions):
+    for action, path, value in actions:
+        parent = _get(item, path[:-1]) if len(path) > 1 else item
+        if parent is _MISSING:
+            raise ValueError('The document path provided in the update '
+                             'expression is invalid for update')
+        if action == 'set':
+            new = value(item)
+            if new is _MISSING:
+                raise ValueError('An operand in the update expression '
+                                 'refers to an attribute that does not exist')
+            if isinstance(parent, list) and path[-1] >= len(parent):
+                parent.append(new)
+            else:
+                parent[path[-1]] = new
+        else:
+            try:
+                del parent[path[-1]]
+            except (KeyError, IndexError):
+                pass
+
+
+# Tables
+
+class _Partitions:
+    """Keys grouped by hash key value, each group sorted; and the hash key
+    values, sorted, for scans."""
+
+    def __init__(self):
+        self.groups = {}
+        self.hashes = []
+
+    def add(self, hash_value, sort_value):
+        group = self.groups.get(hash_value)
+        if group is None:
+            group = self.groups[hash_value] = []
+            bisect.insort(self.hashes, hash_value)
+        i = bisect.bisect_left(group, sort_value)
+        if i == len(group) or group[i] != sort_value:
+            group.insert(i, sort_value)
+
+    def remove(self, hash_value, sort_value):
+        group = self.groups[hash_value]
+        del group[bisect.bisect_left(group, sort_value)]
+        if not group:
+            del self.groups[hash_value]
+            del self.hashes[bisect.bisect_left(self.hashes, hash_value)]
+
+    def copy(self):
+        partitions = _Partitions()
+        partitions.groups = {k: list(v) for k, v in self.groups.items()}
+        partitions.hashes = list(self.hashes)
+        return partitions
+
+
+class _TableData:
+    """A table's items by key, and its sorted partitions for the table and
+    each index.
+
+    Stored items are never changed in place, only replaced, so a snapshot
+    can share them.
+    """
+
+    def __init__(self, hash_key, range_key, indexes):
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.indexes = indexes
+        self.items = {}
+        self.partitions = _Partitions()
+        self.index_partitions = {name: _Partitions() for name in indexes}
+
+    def key(self, item):
+        try:
+            return (item[self.hash_key],
+                    item[self.range_key] if self.range_key else None)
+        except KeyError as e:
+            raise ValueError(f'Missing the key {e.args[0]} in the item')
+
+    def _index_entries(self, key, item):
+        for name, (hash_key, range_key) in self.indexes.items():
+            if hash_key in item and (range_key is None or range_key in item):
+                sort = item[range_key] if range_key else None
+                yield name, item[hash_key], (sort, key)
+
+    def put(self, item):
+        key = self.key(item)
+        self.delete(key)
+        self.items[key] = item
+        self.partitions.add(*key)
+        for name, hash_value, entry in self._index_entries(key, item):
+            self.index_partitions[name].add(hash_value, entry)
+
+    def delete(self, key):
+        item = self.items.pop(key, None)
+        if item is None:
+            return None
+        self.partitions.remove(*key)
+        for name, hash_value, entry in self._index_entries(key, item):
+            self.index_partitions[name].remove(hash_value, entry)
+        return item
+
+    def copy(self):
+        data = _TableData(self.hash_key, self.range_key, self.indexes)
+        data.items = dict(self.items)
+        data.partitions = self.partitions.copy()
+        data.index_partitions = {name: partitions.copy() for name, partitions
+                                 in self.index_partitions.items()}
+        return data
+
+
+def _validated(operation):
+    """Report invalid requests, such as malformed expressions, as DynamoDB
+    does."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            try:
+                return fn(*args, **kwargs)
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValidationException(str(e), operation) from e
+        return call
+    return decorate
+
+
+class Database:
+
+    def __init__(self):
+        self.tables = {}
+        self._lock = threading.RLock()
+
+    def create_table(self, name, hash_key, range_key=None, indexes=None):
+        """Create a table (if there isn't one called `name` already), with
+        `indexes` mapping index names to (hash key, range key) pairs."""
+        with self._lock:
+            if name not in self.tables:
+                self.tables[name] = _TableData(hash_key, range_key,
+                                               dict(indexes or {}))
+
+    def delete_table(self, name):
+        with self._lock:
+            self.tables.pop(name, None)
+
+    def snapshot(self):
+        """The contents of every table, to pass to `restore`."""
+        with self._lock:
+            return {name: data.copy() for name, data in self.tables.items()}
+
+    def restore(self, snapshot):
+        with self._lock:
+            self.tables = {name: data.copy()
+                           for name, data in snapshot.items()}
+
+    def _table(self, name, operation):
+        try:
+            return self.tables[name]
+        except KeyError:
+            raise ResourceNotFoundException(
+                'Requested resource not found', operation
+            )
+
+    # operations, on plain Python values (numbers as Decimals)
+
+    @_validated('GetItem')
+    def get_item(self, TableName, Key, ProjectionExpression=None,
+                 ExpressionAttributeNames=None, **kwargs):
+        with self._lock:
+            data = self._table(TableName, 'GetItem')
+            item = data.items.get(data.key(Key))
+        response = {}
+        if item is not None:
+            response['Item'] = self._output(item, ProjectionExpression,
+                                            ExpressionAttributeNames)
+        return response
+
+    def _output(self, item, projection, names):
+        if projection:
+            item = _project(item, _Parser(projection, names).paths())
+        return copy.deepcopy(item)
+
+    def _check(self, data, key, condition, names, values, operation):
+        if condition is None:
+            return
+        item = data.items.get(key, {})
+        if not _condition(condition, names, values)(item):
+            raise ConditionalCheckFailedException(
+                'The conditional request failed', operation
+            )
+
+    @_validated('PutItem')
+    def put_item(self, TableName, Item, ConditionExpression=None,
+                 ExpressionAttributeNames=None,
+                 ExpressionAttributeValues=None, ReturnValues=None,
+                 **kwargs):
+        with self._lock:
+            data = self._table(TableName, 'PutItem')
+            key = data.key(Item)
+            self._check(data, key, ConditionExpression,
+                        ExpressionAttributeNames, ExpressionAttributeValues,
+                        'PutItem')
+            old = data.items.get(key)
+            data.put(copy.deepcopy(Item))
+        if ReturnValues == 'ALL_OLD' and old is not None:
+            return dict(Attributes=copy.deepcopy(old))
+        return {}
+
+    @_validated('DeleteItem')
+    def delete_item(self, TableName, Key, ConditionExpression=None,
+                    ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ReturnValues=None,
+                    **kwargs):
+        with self._lock:
+            data = self._table(TableName, 'DeleteItem')
+            key = data.key(Key)
+            self._check(data, key, ConditionExpression,
+                        ExpressionAttributeNames, ExpressionAttributeValues,
+                        'DeleteItem')
+            old = data.delete(key)
+        if ReturnValues == 'ALL_OLD' and old is not None:
+            return dict(Attributes=copy.deepcopy(old))
+        return {}
+
+    def _updated(self, data, key, UpdateExpression, names, values):
+        """The item at `key` (or a new one) after an update expression."""
+        old = data.items.get(key)
+        item = copy.deepcopy(old) if old is not None else \
+            {name: value for name, value in zip(
+                (data.hash_key, data.range_key), key) if name is not None}
+        _apply_updates(item, _Parser(UpdateExpression, names,
+                                     values).updates())
+        if data.key(item) != key:
+            raise ValidationException('Cannot update attribute in the key',
+                                      'UpdateItem')
+        return item
+
+    @_validated('UpdateItem')
+    def update_item(self, TableName, Key, UpdateExpression,
+                    ConditionExpression=None, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ReturnValues=None,
+                    **kwargs):
+        with self._lock:
+            data = self._table(TableName, 'UpdateItem')
+            key = data.key(Key)
+            self._check(data, key, ConditionExpression,
+                        ExpressionAttributeNames, ExpressionAttributeValues,
+                        'UpdateItem')
+            old = data.items.get(key)
+            item = self._updated(data, key, UpdateExpression,
+                                 ExpressionAttributeNames,
+                                 ExpressionAttributeValues)
+            data.put(item)
+        if ReturnValues == 'ALL_NEW':
+            return dict(Attributes=copy.deepcopy(item))
+        if ReturnValues == 'ALL_OLD' and old is not None:
+            return dict(Attributes=copy.deepcopy(old))
+        return {}
+
+    def _candidates(self, data, index, conditions, forward, start_key):
+        """The keys of the items a query reads, in order."""
+        hash_key, range_key = data.indexes[index] if index else \
+            (data.hash_key, data.range_key)
+        hash_values = [values[0] for attribute, op, values in conditions
+                       if attribute == hash_key and op == '=']
+        if len(hash_values) != 1 or len(conditions) > 2:
+            raise ValueError('Query condition missed key schema element')
+        range_conditions = [c for c in conditions if c[0] != hash_key]
+        if range_conditions and range_conditions[0][0] != range_key:
+            raise ValueError('Query condition missed key schema element')
+
+        partitions = data.index_partitions[index] if index else \
+            data.partitions
+        group = partitions.groups.get(hash_values[0], [])
+        # index entries are (range value, table key) pairs, so compare
+        # range values against pairs that sort before or after any key
+        if index:
+            def low(v): return (v,)
+
+            def high(v): return (v, (_Top(), _Top()))
+        else:
+            def low(v): return v
+
+            def high(v): return v
+
+        lo, hi = 0, len(group)
+        if range_conditions:
+            _, op, values = range_conditions[0]
+            v = values[0]
+            if op == '=':
+                lo = bisect.bisect_left(group, low(v))
+                hi = bisect.bisect_right(group, high(v))
+            elif op == '<':
+                hi = bisect.bisect_left(group, low(v))
+            elif op == '<=':
+                hi = bisect.bisect_right(group, high(v))
+            elif op == '>':
+                lo = bisect.bisect_right(group, high(v))
+            elif op == '>=':
+                lo = bisect.bisect_left(group, low(v))
+            elif op == 'between':
+                lo = bisect.bisect_left(group, low(v))
+                hi = bisect.bisect_right(group, high(values[1]))
+            elif op == 'begins_with':
+                lo = bisect.bisect_left(group, low(v))
+                hi = lo
+                while hi < len(group) and \
+                        _begins_with(group[hi][0] if index else group[hi], v):
+                    hi += 1
+
+        if start_key is not None:
+            if index:
+                start = (start_key[range_key],
+                         (start_key[data.hash_key],
+                          start_key.get(data.range_key)))
+            else:
+                start = start_key[range_key]
+            if forward:
+                lo = max(lo, bisect.bisect_right(group, start))
+            else:
+                hi = min(hi, bisect.bisect_left(group, start))
+
+        entries = group[lo:hi] if forward else group[lo:hi][::-1]
+        if index:
+            return [key for _, key in entries]
+        return [(hash_values[0], sort) for sort in entries]
+
+    def _page(self, data, keys, index, Limit, FilterExpression,
+              ProjectionExpression, ExpressionAttributeNames,
+              ExpressionAttributeValues):
+        test = _condition(FilterExpression, ExpressionAttributeNames,
+                          ExpressionAttributeValues)
+        evaluated = keys[:Limit] if Limit else keys
+        items = [data.items[key] for key in evaluated]
+        matched = [item for item in items if test(item)]
+        response = dict(
+            Items=[self._output(item, ProjectionExpression,
+                                ExpressionAttributeNames)
+                   for item in matched],
+            Count=len(matched),
+            ScannedCount=len(items)
+        )
+        # like DynamoDB, stops at Limit whether or not anything is left, so
+        # the page after a full one can be empty
+        if Limit and len(evaluated) == Limit:
+            last = items[-1]
+            key_names = {data.hash_key, data.range_key}
+            if index:
+                key_names.update(data.indexes[index])
+            response['LastEvaluatedKey'] = {
+                name: copy.deepcopy(last[name]) for name in key_names
+                if name is not None
+            }
+        return response
+
+    @_validated('Query')
+    def query(self, TableName, KeyConditionExpression, IndexName=None,
+              FilterExpression=None, ProjectionExpression=None,
+              ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+              Limit=None, ScanIndexForward=True, ExclusiveStartKey=None,
+              **kwargs):
+        with self._lock:
+            data = self._table(TableName, 'Query')
+            if IndexName is not None and IndexName not in data.indexes:
+                raise ValidationException(
+                    'The table does not have the specified index: '
+                    f'{IndexName}', 'Query'
+                )
+            conditions = _Parser(KeyConditionExpression,
+                                 ExpressionAttributeNames,
+                                 ExpressionAttributeValues).key_conditions()
+            keys = self._candidates(data, IndexName, conditions,
+                                    ScanIndexForward, ExclusiveStartKey)
+            return self._page(data, keys, IndexName, Limit, FilterExpression,
+                              ProjectionExpression, ExpressionAttributeNames,
+                              ExpressionAttributeValues)
+
+    @_validated('Scan')
+    def scan(self, TableName, FilterExpression=None,
+             ProjectionExpression=None, ExpressionAttributeNames=None,
+             ExpressionAttributeValues=None, Limit=None,
+             ExclusiveStartKey=None, Segment=None, TotalSegments=None,
+             **kwargs):
+        with self._lock:
+            data = self._table(TableName, 'Scan')
+            partitions = data.partitions
+            hashes = partitions.hashes
+            start = 0
+            if ExclusiveStartKey is not None:
+                start = bisect.bisect_left(hashes,
+                                           ExclusiveStartKey[data.hash_key])
+            keys = []
+            for hash_value in hashes[start:]:
+                if TotalSegments and _segment(hash_value, TotalSegments) \
+                        != Segment:
+                    continue
+                group = partitions.groups[hash_value]
+                first = 0
+                if ExclusiveStartKey is not None and \
+                        hash_value == ExclusiveStartKey[data.hash_key]:
+                    first = bisect.bisect_right(
+                        group, ExclusiveStartKey.get(data.range_key)
+                    )
+                keys.extend((hash_value, sort) for sort in group[first:])
+                if Limit and len(keys) >= Limit:
+                    break
+            return self._page(data, keys, None, Limit, FilterExpression,
+                              ProjectionExpression, ExpressionAttributeNames,
+                              ExpressionAttributeValues)
+
+    @_validated('BatchWriteItem')
+    def batch_write_item(self, RequestItems, **kwargs):
+        with self._lock:
+            for name, requests in RequestItems.items():
+                data = self._table(name, 'BatchWriteItem')
+                keys = [data.key(r.get('PutRequest', {}).get('Item') or
+                                 r['DeleteRequest']['Key'])
+                        for r in requests]
+                if len(set(keys)) < len(keys):
+                    raise ValidationException(
+                        'Provided list of item keys contains duplicates',
+                        'BatchWriteItem'
+                    )
+                for request in requests:
+                    if 'PutRequest' in request:
+                        data.put(copy.deepcopy(request['PutRequest']['Item']))
+                    else:
+                        data.delete(data.key(request['DeleteRequest']['Key']))
+        return dict(UnprocessedItems={})
+
+    @_validated('BatchGetItem')
+    def batch_get_item(self, RequestItems, **kwargs):
+        responses = {}
+        with self._lock:
+            for name, request in RequestItems.items():
+                data = self._table(name, 'BatchGetItem')
+                found = (data.items.get(data.key(key))
+                         for key in request['Keys'])
+                responses[name] = [
+                    self._output(item, request.get('ProjectionExpression'),
+                                 request.get('ExpressionAttributeNames'))
+                    for item in found if item is not None
+                ]
+        return dict(Responses=responses, UnprocessedKeys={})
+
+    @_validated('TransactWriteItems')
+    def transact_write_items(self, TransactItems, **kwargs):
+        with self._lock:
+            keys = []
+            for action in TransactItems:
+                (kind, request), = action.items()
+                data = self._table(request['TableName'],
+                                   'TransactWriteItems')
+                keys.append(data.key(request.get('Item') or request['Key']))
+            if len(set(keys)) < len(keys):
+                raise ValidationException(
+                    'Transaction request cannot include multiple operations '
+                    'on one item', 'TransactWriteItems'
+                )
+
+            reasons = []
+            for action, key in zip(TransactItems, keys):
+                (kind, request), = action.items()
+                data = self.tables[request['TableName']]
+                try:
+                    self._check(data, key, request.get('ConditionExpression'),
+                                request.get('ExpressionAttributeNames'),
+                                request.get('ExpressionAttributeValues'),
+                                'TransactWriteItems')
+                    reasons.append(dict(Code='None'))
+                except ConditionalCheckFailedException:
+                    reasons.append(dict(
+                        Code='ConditionalCheckFailed',
+                        Message='The conditional request failed'
+                    ))
+            if any(reason['Code'] != 'None' for reason in reasons):
+                raise TransactionCanceledException(
+                    'Transaction cancelled, please refer cancellation '
+                    'reasons for specific reasons', 'TransactWriteItems',
+                    CancellationReasons=reasons
+                )
+
+            # work out every update before writing anything, so that an
+            # invalid one leaves no trace
+            writes = []
+            for action, key in zip(TransactItems, keys):
+                (kind, request), = action.items()
+                data = self.tables[request['TableName']]
+                if kind == 'Put':
+                    writes.append((data, key, copy.deepcopy(request['Item'])))
+                elif kind == 'Delete':
+                    writes.append((data, key, None))
+                elif kind == 'Update':
+                    writes.append((data, key, self._updated(
+                        data, key, request['UpdateExpression'],
+                        request.get('ExpressionAttributeNames'),
+                        request.get('ExpressionAttributeValues')
+                    )))
+            for data, key, item in writes:
+                if item is None:
+                    data.delete(key)
+                else:
+                    data.put(item)
+        return {}
+
+
+class _Top:
+    """Sorts after everything."""
+
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+    def __eq__(self, other):
+        return isinstance(other, _Top)
+
+
+def _segment(hash_value, segments):
+    return zlib.crc32(repr(hash_value).encode('utf-8')) % segments
+
+
+database = Database()
+
+
+# Clients
+
+def _timed(operation):
+    """Record calls against the current request's timings, as botocore's
+    hooks do for DynamoDB (see timing.instrument)."""
+    def decorate(fn):
+        def call(self, *args, **kwargs):
+            timings = timing.current()
+            if timings is None:
+                return fn(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                response = fn(self, *args, **kwargs)
+            except _Error as e:
+                timings.add_call(operation, time.perf_counter() - start,
+                                 error=e.code)
+                raise
+            timings.add_call(operation, time.perf_counter() - start,
+                             timing._items(response))
+            return response
+        return functools.wraps(fn)(call)
+    return decorate
+
+
+class Client:
+    """Like a boto3 DynamoDB client: attribute values are typed, e.g.
+    {'S': 'text'}."""
+
+    exceptions = _Exceptions
+
+    def __init__(self, database=database):
+        self.database = database
+        self._serializer = _types().TypeSerializer()
+        self._deserializer = _types().TypeDeserializer()
+
+    def _in(self, values):
+        if values is None:
+            return None
+        return {k: self._deserializer.deserialize(v)
+                for k, v in values.items()}
+
+    def _out(self, item):
+        return {k: self._serializer.serialize(v) for k, v in item.items()}
+
+    def _request(self, request):
+        request = dict(request)
+        for name in ('Item', 'Key', 'ExpressionAttributeValues',
+                     'ExclusiveStartKey'):
+            if name in request:
+                request[name] = self._in(request[name])
+        return request
+
+    def _response(self, response):
+        response = dict(response)
+        for name in ('Item', 'Attributes', 'LastEvaluatedKey'):
+            if name in response:
+                response[name] = self._out(response[name])
+        if 'Items' in response:
+            response['Items'] = [self._out(item)
+                                 for item in response['Items']]
+        return response
+
+    @_timed('GetItem')
+    def get_item(self, **kwargs):
+        return self._response(self.database.get_item(
+            **self._request(kwargs)
+        ))
+
+    @_timed('PutItem')
+    def put_item(self, **kwargs):
+        return self._response(self.database.put_item(
+            **self._request(kwargs)
+        ))
+
+    @_timed('DeleteItem')
+    def delete_item(self, **kwargs):
+        return self._response(self.database.delete_item(
+            **self._request(kwargs)
+        ))
+
+    @_timed('UpdateItem')
+    def update_item(self, **kwargs):
+        return self._response(self.database.update_item(
+            **self._request(kwargs)
+        ))
+
+    @_timed('Query')
+    def query(self, **kwargs):
+        return self._response(self.database.query(**self._request(kwargs)))
+
+    @_timed('Scan')
+    def scan(self, **kwargs):
+        return self._response(self.database.scan(**self._request(kwargs)))
+
+    @_timed('BatchWriteItem')
+    def batch_write_item(self, RequestItems, **kwargs):
+        request_items = {
+            name: [{kind: {k: self._in(v) for k, v in request.items()}
+                    for kind, request in r.items()} for r in requests]
+            for name, requests in RequestItems.items()
+        }
+        return self.database.batch_write_item(request_items)
+
+    @_timed('BatchGetItem')
+    def batch_get_item(self, RequestItems, **kwargs):
+        request_items = {
+            name: dict(request, Keys=[self._in(key)
+                                      for key in request['Keys']])
+            for name, request in RequestItems.items()
+        }
+        response = self.database.batch_get_item(request_items)
+        return dict(response, Responses={
+            name: [self._out(item) for item in items]
+            for name, items in response['Responses'].items()
+        })
+
+    @_timed('TransactWriteItems')
+    def transact_write_items(self, TransactItems, **kwargs):
+        return self.database.transact_write_items([
+            {kind: self._request(request)}
+            for action in TransactItems for kind, request in action.items()
+        ])
+
+
+class _BatchWriter:
+    """Like boto3's batch_writer: writes are sent in batches of 25, the
+    last when the block ends."""
+
+    def __init__(self, table):
+        self.table = table
+        self.requests = []
+
+    def put_item(self, Item):
+        self._add(dict(PutRequest=dict(Item=Item)))
+
+    def delete_item(self, Key):
+        self._add(dict(DeleteRequest=dict(Key=Key)))
+
+    def _add(self, request):
+        data = self.table.database._table(self.table.name, 'BatchWriteItem')
+        key = data.key(request.get('PutRequest', {}).get('Item') or
+                       request['DeleteRequest']['Key'])
+        # later writes to a key replace earlier ones, as boto3's can
+        self.requests = [r for r in self.requests
+                         if data.key(r.get('PutRequest', {}).get('Item') or
+                                     r['DeleteRequest']['Key']) != key]
+        self.requests.append(request)
+        if len(self.requests) >= 25:
+            self.flush()
+
+    def flush(self):
+        if self.requests:
+            self.table.database.batch_write_item(
+                {self.table.name: self.table._normalised(self.requests)}
+            )
+            self.requests = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+
+class Table:
+    """Like a boto3 Table resource: attribute values are plain Python
+    values, with numbers read back as Decimals."""
+
+    def __init__(self, name, database=database):
+        self.name = name
+        self.database = database
+        self._serializer = _types().TypeSerializer()
+        self._deserializer = _types().TypeDeserializer()
+
+    def _normalised(self, value):
+        # as boto3 would send and DynamoDB return it: ints become Decimals,
+        # and unsupported types (such as floats) are refused
+        return self._deserializer.deserialize(
+            self._serializer.serialize(value)
+        )
+
+    def _request(self, kwargs):
+        request = dict(kwargs, TableName=self.name)
+        for name in ('Item', 'Key', 'ExpressionAttributeValues',
+                     'ExclusiveStartKey'):
+            if name in request:
+                request[name] = self._normalised(request[name])
+        return request
+
+    @_timed('GetItem')
+    def get_item(self, **kwargs):
+        return self.database.get_item(**self._request(kwargs))
+
+    @_timed('PutItem')
+    def put_item(self, **kwargs):
+        return self.database.put_item(**self._request(kwargs))
+
+    @_timed('DeleteItem')
+    def delete_item(self, **kwargs):
+        return self.database.delete_item(**self._request(kwargs))
+
+    @_timed('UpdateItem')
+    def update_item(self, **kwargs):
+        return self.database.update_item(**self._request(kwargs))
+
+    @_timed('Query')
+    def query(self, **kwargs):
+        return self.database.query(**self._request(kwargs))
+
+    @_timed('Scan')
+    def scan(self, **kwargs):
+        return self.database.scan(**self._request(kwargs))
+
+    def batch_writer(self):
+        return _BatchWriter(self)
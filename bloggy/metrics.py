@@ -0,0 +1,391 @@
+"""Prometheus metrics, served at /metrics in Prometheus's text format:
+request latency by endpoint, requests in flight, DynamoDB latency, errors
+and consumed capacity by operation, Markdown rendering time and cache
+lookups.
+
+Each thread counts into a shard of its own, so counting takes no locks:
+shards are only added up when the metrics are collected. A deployment
+running several processes should set BLOGGY_METRICS_DIR to a directory
+they share, emptied when the deployment starts. Each thread's shard is
+then a memory-mapped file there, and collecting adds up every file, so any
+process can serve the metrics for all of them.
+
+The DynamoDB and Markdown metrics are taken from each request's timings
+(see `timing`), so they only cover work done for requests, and only while
+BLOGGY_TIMING is on.
+"""
+import bisect
+import collections
+import glob
+import itertools
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import weakref
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Prometheus's default buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75,
+                   1.0, 2.5, 5.0, 7.5, 10.0)
+
+_USED = struct.Struct('<Q')
+_KEY_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+_INITIAL_SIZE = 64 * 1024
+
+_shard_ids = itertools.count()
+
+
+class _Shard:
+    """One thread's counts. Only that thread writes to it."""
+
+    def __init__(self):
+        self.values = {}
+
+    def add(self, key, amount):
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def snapshot(self):
+        return dict(self.values)
+
+
+def _value_offset(offset, key_length):
+    end = offset + _KEY_LENGTH.size + key_length
+    return end + -end % _VALUE.size
+
+
+def _entries(data):
+    """The (key, value offset, value) of each entry in a shard file."""
+    used = min(_USED.unpack_from(data)[0], len(data))
+    offset = _USED.size
+    while offset < used:
+        length = _KEY_LENGTH.unpack_from(data, offset)[0]
+        start = offset + _KEY_LENGTH.size
+        name, part, labels = json.loads(bytes(data[start:start + length]))
+        offset = _value_offset(offset, length)
+        yield (name, part, tuple(labels)), offset, \
+            _VALUE.unpack_from(data, offset)[0]
+        offset += _VALUE.size
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < _USED.size:
+        return {}
+    return {key: value for key, _, value in _entries(data)}
+
+
+class _FileShard(_Shard):
+    """A shard that also keeps its counts in a memory-mapped file, for other
+    processes to read.
+
+    The file holds the number of bytes in use, then an entry per key: the
+    length of the key, the key as JSON, padding to a multiple of 8 bytes,
+    then the value as a double, all little-endian. An entry's value is
+    written before the count of bytes in use takes it in, so readers never
+    see half an entry.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self._offsets = {}
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size < _INITIAL_SIZE:
+            os.ftruncate(self._fd, _INITIAL_SIZE)
+        self._map = mmap.mmap(self._fd, 0)
+        # a file left by an earlier process with the same pid: carry on
+        # from its counts rather than have them go backwards
+        for key, offset, value in _entries(self._map):
+            self.values[key] = value
+            self._offsets[key] = offset
+        self._used = max(_USED.unpack_from(self._map)[0], _USED.size)
+
+    def add(self, key, amount):
+        value = self.values.get(key, 0) + amount
+        self.values[key] = value
+        offset = self._offsets.get(key)
+        if offset is None:
+            self._offsets[key] = self._append(key, value)
+        else:
+            _VALUE.pack_into(self._map, offset, value)
+
+    def _append(self, key, value):
+        encoded = json.dumps(key).encode('utf-8')
+        offset = _value_offset(self._used, len(encoded))
+        end = offset + _VALUE.size
+        if end > len(self._map):
+            self._grow(end)
+        _KEY_LENGTH.pack_into(self._map, self._used, len(encoded))
+        start = self._used + _KEY_LENGTH.size
+        self._map[start:start + len(encoded)] = encoded
+        _VALUE.pack_into(self._map, offset, value)
+        self._used = end
+        _USED.pack_into(self._map, 0, end)
+        return offset
+
+    def _grow(self, needed):
+        size = len(self._map)
+        while size < needed:
+            size *= 2
+        self._map.close()
+        os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+
+
+_registries = weakref.WeakSet()
+
+
+class Registry:
+
+    def __init__(self, directory=None):
+        self.metrics = []
+        self.directory = None
+        self._lock = threading.Lock()
+        self._forget_shards()
+        self.use_directory(directory)
+        _registries.add(self)
+
+    def _forget_shards(self):
+        self._local = threading.local()
+        self._shards = []
+
+    def use_directory(self, directory):
+        """Keep counts in shard files in `directory`, to be added up with
+        those of other processes using it, or in memory if it's None.
+        Counts made so far by this process aren't carried over."""
+        if directory == self.directory:
+            return
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self.directory = directory
+            self._forget_shards()
+
+    def _shard(self):
+        with self._lock:
+            if self.directory is None:
+                shard = _Shard()
+            else:
+                shard = _FileShard(os.path.join(
+                    self.directory, f'{os.getpid()}-{next(_shard_ids)}.metrics'
+                ))
+            self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def add(self, key, amount):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shard()
+        shard.add(key, amount)
+
+    def totals(self):
+        """Every key's value, added up across shards (and processes)."""
+        if self.directory is None:
+            snapshots = [shard.snapshot() for shard in list(self._shards)]
+        else:
+            snapshots = map(_read, glob.glob(
+                os.path.join(self.directory, '*.metrics')
+            ))
+        totals = collections.defaultdict(float)
+        for snapshot in snapshots:
+            for key, value in snapshot.items():
+                totals[key] += value
+        return totals
+
+    def exposition(self):
+        """Every metric, in Prometheus's text format."""
+        values = collections.defaultdict(dict)
+        for (name, part, labels), value in self.totals().items():
+            values[name][part, labels] = value
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.lines(values.get(metric.name, {})))
+        return '\n'.join(lines) + '\n'
+
+
+def _after_fork():
+    # a forked child mustn't go on writing into its parent's shards
+    for registry in list(_registries):
+        registry._lock = threading.Lock()
+        registry._forget_shards()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _number(value):
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"') \
+        .replace('\n', r'\n')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"'
+                          for name, value in zip(names, values)) + '}'
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labels=(), registry=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.registry = registry or default_registry
+        self.registry.metrics.append(self)
+
+    def lines(self, values):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        self.registry.add((self.name, '', labels), amount)
+
+    def lines(self, values):
+        if not values and not self.labels:
+            values = {('', ()): 0}
+        for (_, labels), value in sorted(values.items()):
+            yield f'{self.name}{_labels(self.labels, labels)} {_number(value)}'
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.registry.add((self.name, '', labels), -amount)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS,
+                 registry=None):
+        super().__init__(name, help, labels, registry)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        # counted in the first bucket it fits (the counts are made
+        # cumulative when collected) plus the sum: two updates per value
+        self.registry.add(
+            (self.name, bisect.bisect_left(self.buckets, value), labels), 1
+        )
+        self.registry.add((self.name, 'sum', labels), value)
+
+    def lines(self, values):
+        counts = collections.defaultdict(lambda: [0] * (len(self.buckets) + 1))
+        sums = collections.defaultdict(float)
+        for (part, labels), value in values.items():
+            if part == 'sum':
+                sums[labels] = value
+            else:
+                counts[labels][part] += value
+        names = self.labels + ('le',)
+        for labels in sorted(counts):
+            total = 0
+            for bound, count in zip(self.buckets + (math.inf,),
+                                    counts[labels]):
+                total += count
+                le = _labels(names, labels + (_number(bound),))
+                yield f'{self.name}_bucket{le} {_number(total)}'
+            yield f'{self.name}_sum{_labels(self.labels, labels)} ' \
+                f'{_number(sums[labels])}'
+            yield f'{self.name}_count{_labels(self.labels, labels)} ' \
+                f'{_number(total)}'
+
+
+default_registry = Registry()
+
+request_seconds = Histogram(
+    'bloggy_request_seconds', 'Time taken to handle requests, by endpoint.',
+    ['endpoint']
+)
+requests_total = Counter(
+    'bloggy_requests_total', 'Requests handled, by endpoint and status.',
+    ['endpoint', 'status']
+)
+requests_in_flight = Gauge(
+    'bloggy_requests_in_flight', 'Requests being handled.'
+)
+dynamodb_seconds = Histogram(
+    'bloggy_dynamodb_seconds', 'Time taken by DynamoDB calls, by operation.',
+    ['operation']
+)
+dynamodb_capacity = Counter(
+    'bloggy_dynamodb_consumed_capacity_total',
+    'Capacity units consumed by DynamoDB calls, by operation.',
+    ['operation']
+)
+dynamodb_errors = Counter(
+    'bloggy_dynamodb_errors_total', 'Failed DynamoDB calls, by operation.',
+    ['operation', 'error']
+)
+markdown_seconds = Histogram(
+    'bloggy_markdown_seconds', 'Time taken to render Markdown.',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+)
+cache_lookups = Counter(
+    'bloggy_cache_lookups_total', 'Cache lookups, by cache and result.',
+    ['cache', 'result']
+)
+
+
+def observe_timings(timings, **kwargs):
+    """Signal receiver that records a timed request's DynamoDB calls and
+    Markdown rendering."""
+    for operation, seconds, items, capacity, error in timings.calls:
+        dynamodb_seconds.observe(seconds, operation)
+        if capacity:
+            dynamodb_capacity.inc(operation, amount=capacity)
+        if error is not None:
+            dynamodb_errors.inc(operation, error)
+    for name, seconds in timings.spans:
+        if name == 'markdown':
+            markdown_seconds.observe(seconds)
+
+
+def init_app(app):
+    import flask
+
+    @app.before_request
+    def start_request():
+        requests_in_flight.inc()
+        flask.g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def note_status(response):
+        flask.g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def end_request(exc=None):
+        start = flask.g.pop('metrics_start', None)
+        if start is None:
+            return
+        requests_in_flight.dec()
+        # unmatched URLs share one label rather than one each
+        endpoint = flask.request.endpoint or 'none'
+        request_seconds.observe(time.perf_counter() - start, endpoint)
+        requests_total.inc(endpoint, str(flask.g.pop('metrics_status', 500)))
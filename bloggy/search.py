@@ -0,0 +1,532 @@
+"""Full-text search over published posts' titles, bodies and tag labels,
+ranked with BM25.
+
+The index is one file: a sorted term dictionary and, for each term, an
+array of (document, term frequency) postings, all as fixed-width integers
+so that the file can be memory-mapped and searched in place without being
+loaded.
+
+Changes are appended to a log beside the file, under a lock shared with
+other processes, and merged in at query time; other processes read the new
+lines when they next check the log. `compact` (`flask compact-search-index`)
+folds the log into the file, and `build` replaces both. An index without a
+file keeps its changes in memory.
+"""
+import array
+import collections
+import contextlib
+import heapq
+import itertools
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+
+from . import db
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads in this process are locked out
+    fcntl = None
+
+
+_MAGIC = b'BLGS'
+_FORMAT_VERSION = 1
+# magic, format version, documents, terms, postings, total document length,
+# slug bytes, term bytes
+_HEADER = struct.Struct('<4sIIIIQII')
+
+TITLE_WEIGHT = 2
+TAG_WEIGHT = 2
+K1 = 1.2
+B = 0.75
+
+_word = re.compile(r'\w+')
+
+
+def tokens(text):
+    return _word.findall(text.lower())
+
+
+def document(title, body, tag_labels):
+    """The term frequencies to index for a post, counting terms in the
+    title and tag labels more than those in the body."""
+    terms = collections.Counter(tokens(body))
+    for text, weight in [(title, TITLE_WEIGHT)] + \
+            [(label, TAG_WEIGHT) for label in tag_labels]:
+        for term in tokens(text):
+            terms[term] += weight
+    return terms
+
+
+def _u32s(buffer):
+    """Unsigned 32-bit integers stored little-endian in `buffer`."""
+    if sys.byteorder == 'little':
+        return buffer.cast('I')
+    values = array.array('I', buffer)
+    values.byteswap()
+    return values
+
+
+def _u32_bytes(values):
+    values = array.array('I', values)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.tobytes()
+
+
+class _Segment:
+    """An index file, memory-mapped; or an empty index if there's no file.
+
+    After the header come, as little-endian 32-bit integers: each
+    document's length, the offsets of each slug and then each term in their
+    blobs, the offset of each term's postings, and the postings as flat
+    (document, frequency) pairs. Then the slug and term blobs, in UTF-8.
+    Terms are sorted by their encoded bytes.
+    """
+
+    def __init__(self, path=None):
+        self.docs = self.terms = self.total_length = 0
+        self.identity = None
+        self._doc_ids = None
+        if path is None or not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            self.identity = _identity(os.fstat(f.fileno()))
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        (magic, version, self.docs, self.terms, postings, self.total_length,
+         slug_bytes, term_bytes) = _HEADER.unpack_from(view)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            raise ValueError(f'{path} is not a search index')
+
+        offset = _HEADER.size
+
+        def u32s(count):
+            nonlocal offset
+            values = _u32s(view[offset:offset + count * 4])
+            offset += count * 4
+            return values
+
+        self._lengths = u32s(self.docs)
+        self._slug_offsets = u32s(self.docs + 1)
+        self._term_offsets = u32s(self.terms + 1)
+        self._posting_offsets = u32s(self.terms + 1)
+        self._postings = u32s(postings * 2)
+        self._slugs = view[offset:offset + slug_bytes]
+        self._terms = view[offset + slug_bytes:
+                           offset + slug_bytes + term_bytes]
+
+    def slug(self, doc):
+        start, end = self._slug_offsets[doc], self._slug_offsets[doc + 1]
+        return str(self._slugs[start:end], 'utf-8')
+
+    def length(self, doc):
+        return self._lengths[doc]
+
+    def doc_id(self, slug):
+        if self._doc_ids is None:
+            self._doc_ids = {self.slug(doc): doc for doc in range(self.docs)}
+        return self._doc_ids.get(slug)
+
+    def _term(self, i):
+        start, end = self._term_offsets[i], self._term_offsets[i + 1]
+        return self._terms[start:end].tobytes()
+
+    def _term_postings(self, i):
+        start, end = self._posting_offsets[i], self._posting_offsets[i + 1]
+        return self._postings[start * 2:end * 2]
+
+    def postings(self, term):
+        """The flat (document, frequency) pairs for `term`, found by binary
+        search of the term dictionary."""
+        term = term.encode('utf-8')
+        lo, hi = 0, self.terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.terms and self._term(lo) == term:
+            return self._term_postings(lo)
+        return ()
+
+    def items(self):
+        """Every (term, postings) pair, in term order."""
+        for i in range(self.terms):
+            yield self._term(i), self._term_postings(i)
+
+
+def _identity(stat):
+    # a rewrite is renamed into place, so it's a new inode
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _file_identity(path):
+    try:
+        return _identity(os.stat(path))
+    except FileNotFoundError:
+        return None
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """Hold an exclusive lock, shared with other processes, on the index
+    file at `path`."""
+    with open(f'{path}.lock', 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _write_segment(path, slugs, lengths, postings):
+    """Write an index file for documents `slugs`, with `postings` mapping
+    each encoded term to a flat array of (document, frequency) pairs."""
+    terms = sorted(postings)
+    slug_blob = [s.encode('utf-8') for s in slugs]
+
+    def offsets(parts):
+        values = [0]
+        for part in parts:
+            values.append(values[-1] + len(part))
+        return values
+
+    posting_offsets = [n // 2 for n in offsets(postings[t] for t in terms)]
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, len(slugs), len(terms),
+                             posting_offsets[-1], sum(lengths),
+                             sum(map(len, slug_blob)), sum(map(len, terms))))
+        f.write(_u32_bytes(lengths))
+        f.write(_u32_bytes(offsets(slug_blob)))
+        f.write(_u32_bytes(offsets(terms)))
+        f.write(_u32_bytes(posting_offsets))
+        for term in terms:
+            f.write(_u32_bytes(postings[term]))
+        f.write(b''.join(slug_blob))
+        f.write(b''.join(terms))
+    os.replace(tmp, path)
+
+
+class _State:
+    """The index file plus changes since: `changes` maps slugs to their new
+    term frequencies (or None, if no longer indexed), and `masked` holds
+    the file's documents that `changes` supersedes."""
+
+    def __init__(self, segment, changes=None, masked=frozenset()):
+        self.segment = segment
+        self.changes = changes or {}
+        self.masked = masked
+        self.changed = {slug: terms for slug, terms in self.changes.items()
+                        if terms}
+        self.docs = segment.docs - len(masked) + len(self.changed)
+        total_length = segment.total_length + \
+            sum(sum(terms.values()) for terms in self.changed.values()) - \
+            sum(segment.length(doc) for doc in masked)
+        self.average_length = total_length / self.docs if self.docs else 0
+        self._norms = None
+
+    def norm(self, length):
+        """The part of BM25's term weight that depends on document length."""
+        return K1 * (1 - B + B * length / self.average_length)
+
+    def norms(self):
+        """norm() for each of the file's documents, computed on first use."""
+        if self._norms is None:
+            self._norms = [self.norm(self.segment.length(doc))
+                           for doc in range(self.segment.docs)]
+        return self._norms
+
+
+def _log_path(path):
+    return f'{path}.log'
+
+
+def _read_log(f, offset):
+    """The changes in the log file `f` after `offset`, and the offset after
+    them. A line still being appended is left for next time."""
+    f.seek(offset)
+    data = f.read()
+    end = data.rfind(b'\n') + 1
+    changes = {}
+    for line in data[:end].splitlines():
+        entry = json.loads(line)
+        changes[entry['slug']] = entry['terms']
+    return changes, offset + end
+
+
+def _log_lines(changes):
+    return b''.join(
+        json.dumps(dict(slug=slug, terms=terms),
+                   separators=(',', ':')).encode('utf-8') + b'\n'
+        for slug, terms in changes.items()
+    )
+
+
+def _write_log(path, changes):
+    """Replace the change log of the index file at `path`."""
+    tmp = f'{_log_path(path)}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_log_lines(changes))
+    os.replace(tmp, _log_path(path))
+
+
+class SearchIndex:
+
+    def __init__(self, path=None, reload_interval=5):
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self.open(path)
+
+    def open(self, path):
+        """Use the index file at `path` (which needn't exist yet), or keep
+        the index in memory if it's None."""
+        with self._lock:
+            self.path = path
+            self._state = _State(_Segment())
+            # the inode of the change log, and how far it's been read
+            self._log_inode, self._log_offset = None, 0
+            if path is not None:
+                self._refresh()
+            self._checked = time.monotonic()
+
+    def _refresh(self):
+        """Catch up with the index file and its change log, as they are now.
+        The caller holds self._lock."""
+        try:
+            log = open(_log_path(self.path), 'rb')
+        except FileNotFoundError:
+            log = None
+        with log or contextlib.nullcontext():
+            inode = os.fstat(log.fileno()).st_ino if log else None
+            state = self._state
+            segment, changes, offset = \
+                state.segment, state.changes, self._log_offset
+            if inode != self._log_inode or \
+                    _file_identity(self.path) != segment.identity:
+                # compacted or rebuilt since last read: both are replaced by
+                # renaming, the file first, and replaying an old log over a
+                # new file changes nothing
+                segment, changes, offset = _Segment(self.path), {}, 0
+            logged = {}
+            if log:
+                logged, offset = _read_log(log, offset)
+        if logged or segment is not state.segment:
+            self._state = self._with_changes(segment, {**changes, **logged})
+        self._log_inode, self._log_offset = inode, offset
+
+    def _current(self):
+        state = self._state
+        if self.path is None or \
+                time.monotonic() - self._checked < self.reload_interval:
+            return state
+        with self._lock:
+            self._checked = time.monotonic()
+            self._refresh()
+            return self._state
+
+    @staticmethod
+    def _with_changes(segment, changes):
+        masked = frozenset(doc for doc in map(segment.doc_id, changes)
+                           if doc is not None)
+        return _State(segment, changes, masked)
+
+    def update(self, changes):
+        """Apply `changes`, mapping slugs to their documents' term
+        frequencies, or to None to stop indexing them.
+
+        With a file, they're appended to its change log in one write, so
+        the cost doesn't grow with the size of the index.
+        """
+        with self._lock:
+            if self.path is None:
+                self._state = self._with_changes(
+                    self._state.segment, {**self._state.changes, **changes}
+                )
+                return
+            with _file_lock(self.path):
+                # start from the files as they are now, not as last seen
+                self._refresh()
+                state = self._state
+                changes = {slug: terms for slug, terms in changes.items()
+                           if terms or state.changes.get(slug) or
+                           state.segment.doc_id(slug) is not None}
+                if changes:
+                    with open(_log_path(self.path), 'ab') as f:
+                        f.write(_log_lines(changes))
+                    self._refresh()
+                self._checked = time.monotonic()
+
+    def add(self, slug, terms):
+        """Index (or re-index) a document's term frequencies."""
+        self.update({slug: terms})
+
+    def remove(self, slug):
+        self.update({slug: None})
+
+    def compact(self):
+        """Fold the change log into the index file, returning how many
+        changes it held.
+
+        Searches merge the log in as it is, so this only keeps it short:
+        it rewrites the whole file, so run it outside requests, e.g.
+        periodically with `flask compact-search-index`.
+        """
+        if self.path is None:
+            return 0
+        with self._lock, _file_lock(self.path):
+            self._refresh()
+            count = len(self._state.changes)
+            if count:
+                self._write()
+                _write_log(self.path, {})
+                self._refresh()
+            return count
+
+    def _write(self):
+        state = self._state
+        segment = state.segment
+        slugs, lengths, renumbered = [], [], {}
+        for doc in range(segment.docs):
+            if doc not in state.masked:
+                renumbered[doc] = len(slugs)
+                slugs.append(segment.slug(doc))
+                lengths.append(segment.length(doc))
+
+        postings = {}
+        for term, pairs in segment.items():
+            kept = array.array('I')
+            for i in range(0, len(pairs), 2):
+                if pairs[i] in renumbered:
+                    kept.extend((renumbered[pairs[i]], pairs[i + 1]))
+            if kept:
+                postings[term] = kept
+        for slug, terms in state.changes.items():
+            if terms:
+                self._append(slugs, lengths, postings, slug, terms)
+
+        _write_segment(self.path, slugs, lengths, postings)
+
+    @staticmethod
+    def _append(slugs, lengths, postings, slug, terms):
+        doc = len(slugs)
+        slugs.append(slug)
+        lengths.append(sum(terms.values()))
+        for term, frequency in terms.items():
+            postings.setdefault(term.encode('utf-8'),
+                                array.array('I')).extend((doc, frequency))
+
+    def build(self, documents):
+        """Replace the index with one of `documents`, an iterable of (slug,
+        term frequencies) pairs, writing it to the index file.
+
+        Changes logged while `documents` is read may be newer than them, so
+        they're kept in the new log.
+        """
+        if self.path is None:
+            documents = dict(documents)
+            with self._lock:
+                self._state = self._with_changes(_Segment(), documents)
+            return len(documents)
+        with self._lock:
+            self._refresh()
+            started = self._log_inode, self._log_offset
+        slugs, lengths, postings = [], [], {}
+        for slug, terms in documents:
+            self._append(slugs, lengths, postings, slug, terms)
+        with self._lock, _file_lock(self.path):
+            logged = {}
+            if started[0] is not None:
+                with contextlib.suppress(FileNotFoundError), \
+                        open(_log_path(self.path), 'rb') as log:
+                    if os.fstat(log.fileno()).st_ino == started[0]:
+                        logged, _ = _read_log(log, started[1])
+            _write_segment(self.path, slugs, lengths, postings)
+            _write_log(self.path, logged)
+            self._refresh()
+        return len(slugs)
+
+    def search(self, query, offset=0, limit=10):
+        """Return the slugs of the best `limit` matches for `query` after the
+        first `offset`, and the number of matching documents."""
+        state = self._current()
+        segment, changed, masked = state.segment, state.changed, state.masked
+        if not state.docs:
+            return [], 0
+        norms = state.norms()
+
+        scores = collections.defaultdict(float)
+        changed_scores = collections.defaultdict(float)
+        for term in set(tokens(query)):
+            pairs = segment.postings(term)
+            matches = zip(pairs[0::2], pairs[1::2])
+            if masked:
+                matches = [(doc, frequency) for doc, frequency in matches
+                           if doc not in masked]
+            else:
+                matches = list(matches)
+            changed_matches = [(slug, terms[term])
+                               for slug, terms in changed.items()
+                               if term in terms]
+            matching = len(matches) + len(changed_matches)
+            if not matching:
+                continue
+            idf = math.log(1 + (state.docs - matching + 0.5) /
+                           (matching + 0.5))
+            for doc, frequency in matches:
+                scores[doc] += idf * frequency * (K1 + 1) / \
+                    (frequency + norms[doc])
+            for slug, frequency in changed_matches:
+                changed_scores[slug] += idf * frequency * (K1 + 1) / \
+                    (frequency + state.norm(sum(changed[slug].values())))
+
+        ranked = heapq.nlargest(
+            offset + limit,
+            itertools.chain(
+                ((score, doc) for doc, score in scores.items()),
+                ((score, slug) for slug, score in changed_scores.items())
+            ),
+            key=lambda match: match[0]
+        )
+        return ([match if isinstance(match, str) else segment.slug(match)
+                 for _, match in ranked[offset:]],
+                len(scores) + len(changed_scores))
+
+
+index = SearchIndex()
+
+
+def _post_document(post):
+    return document(post.title, post.body, [tag.label for tag in post.tags])
+
+
+def build(progress=None):
+    """Rebuild the index from every published post, returning how many
+    were indexed."""
+    return index.build(
+        (post['slug'], document(post['title'], post['body'],
+                                [tag['label'] for tag in post['tags']]))
+        for post in db.get_published_post_texts(progress=progress)
+    )
+
+
+def index_post(post, **kwargs):
+    """Signal receiver that keeps a saved or updated post's entry current."""
+    index_posts([post])
+
+
+def index_posts(posts, **kwargs):
+    """Signal receiver for posts updated together, e.g. by retagging, that
+    makes one change to the index for all of them."""
+    index.update({post.slug: _post_document(post) if post.published else None
+                  for post in posts})
+
+
+def unindex_post(slug, **kwargs):
+    index.remove(slug)
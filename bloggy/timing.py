@@ -0,0 +1,218 @@
+"""Per-request timing of DynamoDB calls, cattrs structuring, Markdown
+rendering and template rendering.
+
+Each request's timings are reported in a Server-Timing header and logged
+as one JSON line to the `bloggy.timing` logger, with every DynamoDB call
+listed when the request takes longer than BLOGGY_TIMING_SLOW_MS (500 by
+default). Set BLOGGY_TIMING=false to turn it off.
+
+Timings are collected in a context variable, so code running outside a
+request costs one lookup. Thread pools doing work for a request should run
+it in a copy of the request's context (see `submit`).
+"""
+import collections
+import contextlib
+import contextvars
+import json
+import logging
+import time
+
+import blinker
+
+
+logger = logging.getLogger('bloggy.timing')
+
+_current = contextvars.ContextVar('bloggy_timings', default=None)
+
+_signals = blinker.Namespace()
+# sent with each request's Timings once it's been handled
+request_timed = _signals.signal('request-timed')
+
+# the operations that can report the capacity they consume
+_CAPACITY_OPERATIONS = {
+    'GetItem', 'PutItem', 'UpdateItem', 'DeleteItem', 'Query', 'Scan',
+    'BatchGetItem', 'BatchWriteItem', 'TransactGetItems', 'TransactWriteItems'
+}
+
+
+class Timings:
+    """What one request spent its time on.
+
+    Work can be recorded from several threads: appending to a list is
+    atomic, so nothing is added up until `summary`.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.calls = []
+        self.spans = []
+        self._render_starts = []
+
+    def add_call(self, operation, seconds, items=0, capacity=0, error=None):
+        self.calls.append((operation, seconds, items, capacity, error))
+
+    def add_span(self, name, seconds):
+        self.spans.append((name, seconds))
+
+    def summary(self):
+        spans = collections.defaultdict(float)
+        for name, seconds in self.spans:
+            spans[name] += seconds
+        return dict(
+            total_ms=_ms(time.perf_counter() - self.start),
+            db=dict(
+                calls=len(self.calls),
+                ms=_ms(sum(call[1] for call in self.calls)),
+                items=sum(call[2] for call in self.calls),
+                capacity=sum(call[3] for call in self.calls)
+            ),
+            spans={name: _ms(seconds) for name, seconds in spans.items()}
+        )
+
+    def details(self):
+        return [dict(operation=operation, ms=_ms(seconds), items=items,
+                     capacity=capacity, error=error)
+                for operation, seconds, items, capacity, error in self.calls]
+
+    def server_timing(self):
+        summary = self.summary()
+        db = summary['db']
+        metrics = [f'db;dur={db["ms"]};desc="{db["calls"]} calls, '
+                   f'{db["capacity"]:g} capacity units"']
+        metrics += [f'{name};dur={ms}'
+                    for name, ms in summary['spans'].items()]
+        metrics.append(f'total;dur={summary["total_ms"]}')
+        return ', '.join(metrics)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def current():
+    """The timings of the request being handled, if it's being timed."""
+    return _current.get()
+
+
+@contextlib.contextmanager
+def timed(name):
+    """Record the time spent in a block against the current request."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_span(name, time.perf_counter() - start)
+
+
+def submit(pool, fn, *args):
+    """Submit `fn` to an executor to run in a copy of the current context,
+    so that its work is timed against the current request."""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _ask_for_capacity(params, model, **kwargs):
+    if _current.get() is not None and model.name in _CAPACITY_OPERATIONS:
+        params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+
+def _before_call(model, context, **kwargs):
+    if _current.get() is not None:
+        context['bloggy_call'] = (model.name, time.perf_counter())
+
+
+def _items(parsed):
+    if 'Count' in parsed:
+        return parsed['Count']
+    if 'Responses' in parsed:
+        return sum(len(items) for items in parsed['Responses'].values())
+    return int('Item' in parsed or 'Attributes' in parsed)
+
+
+def _capacity(parsed):
+    consumed = parsed.get('ConsumedCapacity') or []
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    return sum(c.get('CapacityUnits', 0) for c in consumed)
+
+
+def _after_call(context, parsed=None, exception=None, **kwargs):
+    # after-call-error, sent when no response was received, doesn't pass
+    # the model, so the operation's name comes from before-call
+    timings = _current.get()
+    call = context.pop('bloggy_call', None)
+    if timings is None or call is None:
+        return
+    operation, start = call
+    seconds = time.perf_counter() - start
+    if exception is not None:
+        timings.add_call(operation, seconds, error=type(exception).__name__)
+    elif 'Error' in parsed:
+        timings.add_call(operation, seconds, capacity=_capacity(parsed),
+                         error=parsed['Error'].get('Code'))
+    else:
+        timings.add_call(operation, seconds, _items(parsed),
+                         _capacity(parsed))
+
+
+def instrument(client):
+    """Time every call made by a botocore (or aiobotocore) DynamoDB
+    client, asking for consumed capacity while a request is timed."""
+    events = client.meta.events
+    events.register('provide-client-params.dynamodb.*', _ask_for_capacity)
+    events.register('before-call.dynamodb.*', _before_call)
+    events.register('after-call.dynamodb.*', _after_call)
+    events.register('after-call-error.dynamodb.*', _after_call)
+
+
+def init_app(app):
+    import flask
+
+    def enabled():
+        return app.config.get('TIMING', True)
+
+    @app.before_request
+    def start_timing():
+        if enabled():
+            flask.g.timing_token = _current.set(Timings())
+
+    @app.after_request
+    def add_server_timing(response):
+        timings = _current.get()
+        if timings is not None:
+            response.headers['Server-Timing'] = timings.server_timing()
+        return response
+
+    @app.teardown_request
+    def log_timing(exc=None):
+        token = flask.g.pop('timing_token', None)
+        if token is None:
+            return
+        timings = _current.get()
+        _current.reset(token)
+
+        summary = dict(timings.summary(), method=flask.request.method,
+                       path=flask.request.path,
+                       endpoint=flask.request.endpoint)
+        if summary['total_ms'] >= app.config.get('TIMING_SLOW_MS', 500):
+            summary['calls'] = timings.details()
+            logger.warning(json.dumps(summary))
+        else:
+            logger.info(json.dumps(summary))
+        request_timed.send(timings)
+
+    @flask.before_render_template.connect_via(app)
+    def start_render(sender, **kwargs):
+        timings = _current.get()
+        if timings is not None:
+            timings._render_starts.append(time.perf_counter())
+
+    @flask.template_rendered.connect_via(app)
+    def end_render(sender, **kwargs):
+        timings = _current.get()
+        if timings is not None and timings._render_starts:
+            timings.add_span('render', time.perf_counter() -
+                             timings._render_starts.pop())
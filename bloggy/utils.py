@@ -1,5 +1,6 @@
 import base64
 import functools
+import hashlib
 import json
 
 import flask
@@ -28,35 +29,121 @@ def abort_404():
     return flask.abort(404)
 
 
-def pageable(template):
+def make_etag(*parts):
+    """Derive a strong entity tag from the given parts."""
+    s = json.dumps(parts, default=str).encode('utf-8')
+    return hashlib.sha1(s).hexdigest()[:32]
+
+
+def _is_fresh(etag, last_modified):
+    request = flask.request
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= \
+            request.if_modified_since
+    return False
+
+
+def conditional(render, etag, last_modified=None):
+    """Respond with 304 Not Modified if the client's cached copy matches the
+    given validators, and otherwise with the result of calling `render`."""
+    if _is_fresh(etag, last_modified):
+        response = flask.Response(status=304)
+    else:
+        response = flask.make_response(render())
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    return response
+
+
+def _cursor_serializer():
+    import itsdangerous
+    return itsdangerous.URLSafeSerializer(flask.current_app.secret_key,
+                                          salt='bloggy.cursor')
+
+
+def make_cursor(page, paging_key, backward=False):
+    """Create a signed URL token for reading `page` of a list from
+    `paging_key`, forwards or backwards.
+
+    Its size depends only on the paging key, not on how deep the page is.
+    """
+    data = dict(p=page, k=paging_key)
+    if backward:
+        data['b'] = 1
+    return _cursor_serializer().dumps(data)
+
+
+def read_cursor(token):
+    """Return the (page, paging_key, backward) in a cursor token, or None if
+    the token is missing or invalid."""
+    if not token:
+        return None
+    try:
+        data = _cursor_serializer().loads(token)
+        return int(data['p']), data['k'], bool(data.get('b'))
+    except Exception:
+        return None
+
+
+def pageable(template, validators=None, page_start=None):
+    """Render a paged list view with `template`.
+
+    The view is called with `paging_key` and `backward` arguments for the
+    page to read, and returns a context dict and the db.PageableList read.
+    Pages link to each other with cursors (see make_cursor) given in the
+    template context as `cursors`, keyed by page number, alongside `prev`
+    and `next` page numbers. Page 1 needs no cursor.
+
+    If given, `page_start(page)` returns the paging key that starts a page,
+    e.g. from a page index, so that requests can ask for `?page=N`, or None
+    if there is no such page, which is a 404.
+    `validators(ctx, next_paging_key)` returns an (etag, last_modified)
+    pair used to answer conditional requests.
+    """
     def decorator(fn):
         @functools.wraps(fn)
         def decorated_fn(*args, **kwargs):
-            paging_tokens = flask.request.args.get('pt', None)
-            try:
-                page = int(flask.request.args.get('page', 1))
-            except ValueError:
-                page = 1
-            paging_keys = from_url_token(paging_tokens, {})
-            paging_key = None
-            if paging_keys and page > 1 and str(page) in paging_keys:
-                paging_key = paging_keys[str(page)]
+            page, paging_key, backward = \
+                read_cursor(flask.request.args.get('c')) or (1, None, False)
+            if page_start and not paging_key:
+                try:
+                    page = int(flask.request.args.get('page', 1))
+                except ValueError:
+                    page = 1
+                paging_key = page_start(page) if page > 1 else None
+                if page > 1 and paging_key is None:
+                    flask.abort(404)
 
             # if paging_key is None, make sure page = 1
             if paging_key is None:
-                page = 1
+                page, backward = 1, False
 
-            kwargs['paging_key'] = paging_key
-            ctx, next_paging_key = fn(*args, **kwargs)
+            kwargs.update(paging_key=paging_key, backward=backward)
+            ctx, pageable = fn(*args, **kwargs)
+            if backward and not pageable.prev_key:
+                # went back as far as the start
+                page = 1
 
-            if next_paging_key:
-                paging_keys[page + 1] = next_paging_key
+            prev = page - 1 if page > 1 else None
+            next = page + 1 if pageable.paging_key else None
+            cursors = {}
+            if prev and prev > 1 and pageable.prev_key:
+                cursors[prev] = make_cursor(prev, pageable.prev_key,
+                                            backward=True)
+            if next:
+                cursors[next] = make_cursor(next, pageable.paging_key)
+            ctx.update(prev=prev, next=next, cursors=cursors)
 
-            new_paging_tokens = to_url_token(paging_keys)
+            def render():
+                return flask.render_template(template, **ctx)
 
-            ctx['prev'] = page - 1 if page > 0 else None
-            ctx['next'] = page + 1 if next_paging_key else None
-            ctx['paging_tokens'] = new_paging_tokens
-            return flask.render_template(template, **ctx)
+            if validators is None:
+                return render()
+            etag, last_modified = validators(ctx, pageable.paging_key)
+            return conditional(render, etag, last_modified)
         return decorated_fn
     return decorator
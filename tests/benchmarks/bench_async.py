@@ -0,0 +1,92 @@
+"""Compare requests/sec for list page and post reads through the sync db
+module on a thread pool (as under Waitress) and through aiodb on one event
+loop (as under an ASGI server).
+
+    python -m tests.benchmarks.bench_async --requests 2000 --concurrency 64
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import datetime
+import time
+
+import bloggy.aiodb as aiodb
+import bloggy.db as db
+from .. import factories
+from . import common
+
+
+def _reads(n, posts):
+    """Alternate list page and post reads, as a browsing reader would."""
+    for i in range(n):
+        if i % 2:
+            yield 'post', f'bench-{i % posts}'
+        else:
+            yield 'list', None
+
+
+def _sync_read(kind, slug):
+    if kind == 'list':
+        return db.get_published_posts()
+    return db.get_post(slug, on_not_found=lambda: None)
+
+
+async def _async_read(kind, slug):
+    if kind == 'list':
+        return await aiodb.get_published_posts()
+    return await aiodb.get_post(slug, on_not_found=lambda: None)
+
+
+def bench_sync(reads, concurrency):
+    db.connect(use_local=True, max_pool_connections=concurrency)
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(lambda r: _sync_read(*r), reads))
+    return time.perf_counter() - start
+
+
+async def bench_async(reads, concurrency):
+    await aiodb.connect(use_local=True, max_pool_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def read(kind, slug):
+        async with semaphore:
+            return await _async_read(kind, slug)
+
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(read(*r) for r in reads))
+        return time.perf_counter() - start
+    finally:
+        await aiodb.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--posts', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    args = parser.parse_args()
+
+    common.connect_local()
+    db.truncate()
+    for i in range(args.posts):
+        db.save_post(factories.PostFactory(
+            slug=f'bench-{i}', published=True,
+            created=datetime.datetime(2023, 1, 1) + datetime.timedelta(i)
+        ))
+
+    reads = list(_reads(args.requests, args.posts))
+    print(f'{"stack":<32} {"seconds":>8} {"req/s":>8}')
+    for name, seconds in [
+        (f'sync, {args.concurrency} threads',
+         bench_sync(reads, args.concurrency)),
+        (f'asyncio, {args.concurrency} in flight',
+         asyncio.run(bench_async(reads, args.concurrency))),
+    ]:
+        print(f'{name:<32} {seconds:>8.2f} {len(reads) / seconds:>8.0f}')
+    db.truncate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Compare the time to encode and decode a post's item, and the item's size
+and capacity units, in the previous format (plain cattrs hooks, text
+bodies) and the current one (generated hooks, compressed bodies).
+
+    python -m tests.benchmarks.bench_encoding --body-kb 1 4 16 64
+
+Doesn't need DynamoDB: items are only built and read back.
+"""
+import argparse
+import datetime
+
+import cattrs
+
+import bloggy.db as db
+from . import bench_suite
+from . import common
+
+
+# the converter posts were stored with before
+_legacy = cattrs.Converter()
+_legacy.register_unstructure_hook(datetime.datetime, lambda dt: dt.isoformat())
+_legacy.register_structure_hook(
+    datetime.datetime, lambda ts, _: datetime.datetime.fromisoformat(ts)
+)
+
+
+def _legacy_item(post):
+    return db._serialized(
+        pk=f'post#{post.slug}',
+        sk='#post',
+        data=post.created.isoformat(),
+        version=post.version,
+        renderer=post.rendered.version,
+        post=_legacy.unstructure(post)
+    )
+
+
+def _decode(item, converter):
+    post = db._deserializer.deserialize(item['post'])
+    return converter.structure(post, db.Post)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--body-kb', type=int, nargs='+',
+                        default=[1, 4, 16, 64])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f'{"body":>6} {"format":<8} {"encode":>10} {"decode":>10} '
+          f'{"bytes":>9} {"WCU":>5} {"RCU":>5}')
+    for kb in args.body_kb:
+        post = bench_suite._post(0, body_size=kb * 1024)
+        for name, encode, converter in [('before', _legacy_item, _legacy),
+                                        ('after', db._post_item,
+                                         db._convertor)]:
+            item = encode(post)
+            assert _decode(item, converter) == post
+            encoding = common.timed(lambda: encode(post), args.repeat)
+            decoding = common.timed(lambda: _decode(item, converter),
+                                    args.repeat)
+            print(f'{kb:>4}KB {name:<8} '
+                  f'{bench_suite._format(encoding):>10} '
+                  f'{bench_suite._format(decoding):>10} '
+                  f'{common.item_size(item):>9,} '
+                  f'{common.write_units([item]):>5} '
+                  f'{common.read_units([item]):>5}')
+
+
+if __name__ == '__main__':
+    main()
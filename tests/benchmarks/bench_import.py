@@ -0,0 +1,76 @@
+"""Measure the cold-start cost of importing bloggy and creating the app,
+using `python -X importtime` in fresh interpreters.
+
+    python -m tests.benchmarks.bench_import --runs 5 --top 10
+    python -m tests.benchmarks.bench_import --max-ms 400  # fail if slower
+"""
+import argparse
+import collections
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+_code = 'import bloggy; bloggy.create_app()'
+
+
+def _importtime():
+    """Return {module: cumulative microseconds} for one fresh run, and the
+    total."""
+    env = dict(os.environ)
+    env.setdefault('BLOGGY_SECRET_KEY', 'bench')
+    env.setdefault('BLOGGY_SEARCH_INDEX',
+                   os.path.join(tempfile.gettempdir(),
+                                'bloggy-bench-search.idx'))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', _code],
+                          capture_output=True, text=True, check=True,
+                          env=env)
+    times = {}
+    total = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # top-level imports are those with no indentation
+        if not name[1:].startswith(' '):
+            total += int(cumulative)
+        times[name.strip()] = int(cumulative)
+    return times, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='Exit with an error if the median total is '
+                             'slower than this.')
+    args = parser.parse_args()
+
+    runs = [_importtime() for _ in range(args.runs)]
+    totals = [total for _, total in runs]
+    modules = collections.defaultdict(list)
+    for times, _ in runs:
+        for name, us in times.items():
+            modules[name].append(us)
+
+    median = statistics.median(totals) / 1000
+    print(f'{_code!r}: median {median:.1f} ms over {args.runs} runs '
+          f'(min {min(totals) / 1000:.1f} ms)')
+    print('\nslowest modules (median cumulative ms):')
+    slowest = sorted(modules.items(), key=lambda kv: -statistics.median(kv[1]))
+    for name, us in slowest[:args.top]:
+        print(f'  {statistics.median(us) / 1000:>8.1f}  {name}')
+    for heavy in ['boto3', 'botocore', 'wtforms', 'markdown', 'bleach']:
+        if heavy in modules:
+            print(f'\nwarning: {heavy} is imported at start-up')
+
+    if args.max_ms is not None and median > args.max_ms:
+        sys.exit(f'import took {median:.1f} ms, over the {args.max_ms} ms '
+                 f'budget')
+
+
+if __name__ == '__main__':
+    main()
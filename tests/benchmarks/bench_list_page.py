@@ -0,0 +1,73 @@
+"""Compare bytes read and read capacity per list page for full post items
+and the summary items/projection used by the list views.
+
+    python -m tests.benchmarks.bench_list_page --posts 20 --body-kb 128
+"""
+import argparse
+import datetime
+
+import bloggy.db as db
+from .. import factories
+from . import common
+
+
+def _query(sk, **kwargs):
+    return db._conn.client.query(
+        TableName=db._table_name,
+        IndexName='GSI',
+        KeyConditionExpression='sk = :sk',
+        ExpressionAttributeValues={':sk': {'S': sk}},
+        Limit=10,
+        ScanIndexForward=False,
+        ReturnConsumedCapacity='TOTAL',
+        **kwargs
+    )
+
+
+def _report(name, response):
+    items = response['Items']
+    consumed = response.get('ConsumedCapacity', {}).get('CapacityUnits')
+    print(f'{name:<36} {len(items):>5} '
+          f'{sum(common.item_size(i) for i in items):>12,} '
+          f'{common.read_units(items):>10} '
+          f'{consumed if consumed is not None else "n/a":>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--posts', type=int, default=20)
+    parser.add_argument('--body-kb', type=int, default=128)
+    args = parser.parse_args()
+
+    common.connect_local()
+    db.truncate()
+    body = ('Lorem ipsum dolor sit amet. ' * 40 + '\n\n') * \
+        (args.body_kb * 1024 // 1122 + 1)
+    for i in range(args.posts):
+        db.save_post(factories.PostFactory(
+            slug=f'bench-{i}',
+            body=body[:args.body_kb * 1024],
+            published=True,
+            tags=[factories.TagFactory(name='bench')],
+            created=datetime.datetime(2023, 1, 1) + datetime.timedelta(i)
+        ))
+
+    print(f'{"query (10 items/page)":<36} {"items":>5} {"bytes":>12} '
+          f'{"est. RCU":>10} {"reported":>10}')
+    # before: list partitions held complete posts, as base items still do
+    _report('before: full post items', _query('#post'))
+    _report('after: /blog/ summaries', _query('#post#published'))
+    _report('after: /blog/?tag= summaries',
+            _query('#post#published#tag#bench'))
+    # a projection trims what's sent and deserialised, but DynamoDB still
+    # bills the read on full item size
+    _report('after: /admin/posts/ projection', _query(
+        '#post',
+        ProjectionExpression=db._summary_projection,
+        ExpressionAttributeNames={'#data': 'data'}
+    ))
+    db.truncate()
+
+
+if __name__ == '__main__':
+    main()
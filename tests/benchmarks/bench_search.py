@@ -0,0 +1,86 @@
+"""Measure search index build time, size and query latency over synthetic
+posts, with words drawn from a Zipf-like distribution so that some terms
+match most posts and others very few.
+
+    python -m tests.benchmarks.bench_search --posts 10000 100000
+
+Doesn't need DynamoDB: documents are indexed directly.
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from bloggy import search
+
+
+def _vocabulary(size):
+    return [f'w{i}' for i in range(size)]
+
+
+def _documents(count, words, body_words):
+    weights = list(itertools.accumulate(1 / (rank + 1)
+                                        for rank in range(len(words))))
+    rng = random.Random(count)
+    documents = []
+    for i in range(count):
+        title = ' '.join(rng.choices(words, cum_weights=weights, k=6))
+        body = ' '.join(rng.choices(words, cum_weights=weights,
+                                    k=body_words))
+        documents.append((f'post-{i}',
+                          search.document(title, body, ['bench'])))
+    return documents
+
+
+def _latencies(index, query, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        index.search(query)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--posts', type=int, nargs='+',
+                        default=[10000, 100000])
+    parser.add_argument('--vocabulary', type=int, default=50000)
+    parser.add_argument('--body-words', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    words = _vocabulary(args.vocabulary)
+    queries = {
+        'common term': words[0],
+        'mid term': words[200],
+        'rare term': words[-1],
+        'three terms': ' '.join([words[5], words[50], words[500]]),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.posts:
+            path = os.path.join(tmp, f'search-{count}.idx')
+            index = search.SearchIndex(path)
+            documents = _documents(count, words, args.body_words)
+            start = time.perf_counter()
+            index.build(documents)
+            del documents
+            built = time.perf_counter() - start
+            print(f'{count:,} posts: built in {built:.1f}s, '
+                  f'{os.path.getsize(path) / 2 ** 20:.1f} MiB')
+            print(f'  {"query":<12} {"matches":>8} {"p50 ms":>8} '
+                  f'{"p95 ms":>8}')
+            for name, query in queries.items():
+                matches = index.search(query)[1]
+                times = sorted(_latencies(index, query, args.repeat))
+                p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+                print(f'  {name:<12} {matches:>8,} '
+                      f'{statistics.median(times) * 1000:>8.1f} '
+                      f'{p95 * 1000:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+"""Time bloggy's hot paths, saving the results as JSON, or comparing them
+with a saved run and failing if any got slower than a threshold.
+
+    python -m tests.benchmarks.bench_suite --save before.json
+    python -m tests.benchmarks.bench_suite --compare before.json
+    python -m tests.benchmarks.bench_suite -k md_to_html  # just some
+
+Each benchmark is run in batches big enough to take about 0.2s, and the
+fastest and median time per call over `--repeat` batches are recorded.
+Comparisons use the fastest, which other work on the machine inflates
+least. Inputs are built deterministically, so runs of the same code are
+comparable. Doesn't need DynamoDB: the page benchmarks read from a fake
+table of canned posts.
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import timeit
+import unittest.mock
+
+import bloggy
+import bloggy.db as db
+import bloggy.filters as filters
+import bloggy.utils as utils
+
+
+_benchmarks = {}
+
+
+def benchmark(name):
+    """Register a function that sets up a benchmark and returns the
+    callable to time."""
+    def register(setup):
+        _benchmarks[name] = setup
+        return setup
+    return register
+
+
+_words = ('the of and to in is that for it as was with be by on not he this '
+          'are or his from at which but have an they you were her she there '
+          'been one all we their has would when if so no will more').split()
+
+
+def _markdown(size, seed=0):
+    """Markdown of about `size` bytes: paragraphs with emphasis and links,
+    headings and lists."""
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < size:
+        kind = rng.random()
+        if kind < 0.1:
+            part = '## ' + ' '.join(rng.choices(_words, k=5)).title()
+        elif kind < 0.25:
+            part = '\n'.join('- ' + ' '.join(rng.choices(_words, k=8))
+                             for _ in range(4))
+        else:
+            words = rng.choices(_words, k=80)
+            words[10] = f'**{words[10]}**'
+            words[30] = f'[{words[30]}](https://example.com/{words[31]})'
+            part = ' '.join(words) + '.'
+        parts.append(part)
+        length += len(part) + 2
+    return '\n\n'.join(parts)
+
+
+def _post(i, body_size=2048):
+    post = db.Post(
+        slug=f'bench-{i}',
+        title=f'Benchmark post {i}',
+        body=_markdown(body_size, seed=i),
+        published=True,
+        tags=[db.Tag(name='bench', label='Bench'),
+              db.Tag(name=f'tag-{i % 5}', label=f'Tag {i % 5}')],
+        main_image=db.Image(src=f'https://example.com/{i}.jpg',
+                            alt='An image', title='An image'),
+        created=datetime.datetime(2024, 1, 1) + datetime.timedelta(days=i),
+        modified=datetime.datetime(2024, 6, 1, tzinfo=datetime.timezone.utc)
+    )
+    db._render(post)
+    return post
+
+
+@benchmark('md_to_html small')
+def _md_small():
+    body = _markdown(2 * 1024)
+    return lambda: filters.md_to_html(body)
+
+
+@benchmark('md_to_html 128KB')
+def _md_large():
+    body = _markdown(128 * 1024)
+    return lambda: filters.md_to_html(body)
+
+
+@benchmark('first_para small')
+def _first_para_small():
+    html = str(filters.md_to_html(_markdown(2 * 1024)))
+    return lambda: filters.first_para(html)
+
+
+@benchmark('first_para 128KB')
+def _first_para_large():
+    html = str(filters.md_to_html(_markdown(128 * 1024)))
+    return lambda: filters.first_para(html)
+
+
+@benchmark('cattrs unstructure Post')
+def _unstructure():
+    post = _post(0)
+    return lambda: db._convertor.unstructure(post)
+
+
+@benchmark('cattrs structure Post')
+def _structure():
+    unstructured = db._convertor.unstructure(_post(0))
+    return lambda: db._convertor.structure(unstructured, db.Post)
+
+
+@benchmark('_post_item')
+def _post_item():
+    post = _post(0)
+    return lambda: db._post_item(post)
+
+
+@benchmark('_post_items')
+def _post_items():
+    post = _post(0)
+    return lambda: db._post_items(post)
+
+
+@benchmark('decode Post item')
+def _decode_post_item():
+    item = db._post_item(_post(0))
+    return lambda: db._convertor.structure(
+        db._deserializer.deserialize(item['post']), db.Post
+    )
+
+
+@benchmark('_serialized summary')
+def _serialized():
+    post = _post(0)
+    summary = db._convertor.unstructure(post.summary())
+    return lambda: db._serialized(pk='post#bench-0', sk='#post#published',
+                                  data=post.created.isoformat(),
+                                  summary=summary)
+
+
+@benchmark('cursor round trip')
+def _cursor_round_trip():
+    app = _app()
+    key = dict(created='2024-01-01T00:00:00', slug='bench-0')
+
+    def round_trip():
+        with app.app_context():
+            return utils.read_cursor(utils.make_cursor(3, key))
+    return round_trip
+
+
+@contextlib.contextmanager
+def _fake_table(posts):
+    """Serve the blog's reads from `posts` rather than DynamoDB."""
+    by_slug = {post.slug: post for post in posts}
+    summaries = [post.summary() for post in posts[:10]]
+    tags = {tag.name: tag for post in posts for tag in post.tags}
+
+    def get_published_post(slug, on_not_found):
+        return by_slug[slug] if slug in by_slug else on_not_found()
+
+    def get_published_post_version(slug):
+        post = by_slug.get(slug)
+        return db.PostVersion(post.version, post.modified) if post else None
+
+    with contextlib.ExitStack() as stack:
+        for name, fake in dict(
+            get_published_posts=lambda **kwargs: db.PageableList(
+                items=summaries, paging_key=dict(pk='post#bench-9'),
+                prev_key=None
+            ),
+            get_published_post=get_published_post,
+            get_published_post_version=get_published_post_version,
+            page_index_enabled=lambda: False
+        ).items():
+            stack.enter_context(unittest.mock.patch.object(db, name, fake))
+        stack.enter_context(unittest.mock.patch.object(
+            db.tag_catalogue, 'load', lambda: list(tags.values())
+        ))
+        db.tag_catalogue.invalidate()
+        yield
+    db.tag_catalogue.invalidate()
+
+
+def _app():
+    os.environ.setdefault('BLOGGY_SECRET_KEY', 'bench')
+    os.environ.setdefault('BLOGGY_SEARCH_INDEX',
+                          os.path.join(tempfile.gettempdir(),
+                                       'bloggy-bench-search.idx'))
+    return bloggy.create_app()
+
+
+def _client():
+    return _app().test_client()
+
+
+@benchmark('GET /blog/')
+def _list_page():
+    client = _client()
+    return lambda: client.get('/blog/')
+
+
+@benchmark('GET /blog/<slug>/')
+def _post_page():
+    client = _client()
+    return lambda: client.get('/blog/bench-0/')
+
+
+def _time(fn, repeat):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    number = max(1, number)
+    times = [t / number for t in timer.repeat(repeat, number)]
+    return dict(number=number, min=min(times),
+                median=statistics.median(times))
+
+
+def run(names, repeat):
+    results = {}
+    posts = [_post(i) for i in range(20)]
+    with _fake_table(posts):
+        for name in names:
+            fn = _benchmarks[name]()
+            fn()
+            results[name] = _time(fn, repeat)
+            print(f'{name:<28} {_format(results[name]["min"]):>10}',
+                  file=sys.stderr)
+    return results
+
+
+def _format(seconds):
+    for unit, scale in [('s', 1), ('ms', 1e-3), ('us', 1e-6)]:
+        if seconds >= scale:
+            return f'{seconds / scale:.2f}{unit}'
+    return f'{seconds / 1e-9:.0f}ns'
+
+
+def compare(baseline, results, threshold):
+    """Print each benchmark's change from `baseline`, returning the names
+    of those more than `threshold` (a fraction) slower."""
+    regressions = []
+    print(f'{"benchmark":<28} {"before":>10} {"after":>10} {"change":>8}')
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f'{name:<28} {"-":>10} {_format(result["min"]):>10}')
+            continue
+        change = result['min'] / before['min'] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f'{name:<28} {_format(before["min"]):>10} '
+              f'{_format(result["min"]):>10} {change:>+8.1%}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('-k', dest='keyword',
+                        help='only run benchmarks whose names contain this')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--save', help='write the results to this file')
+    parser.add_argument('--compare', help='compare with results saved in '
+                        'this file, exiting with status 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='the slowdown counted as a regression, as a '
+                        'fraction (default 0.2)')
+    args = parser.parse_args()
+
+    names = [name for name in _benchmarks
+             if not args.keyword or args.keyword in name]
+    results = run(names, args.repeat)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(dict(python=platform.python_version(),
+                           machine=platform.machine(),
+                           created=datetime.datetime.now(
+                               datetime.timezone.utc).isoformat(),
+                           results=results), f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s) beyond '
+                  f'{args.threshold:.0%}: {", ".join(regressions)}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Compare the write capacity used to update a published post's title when
+each tag item carries a copy of the post summary (as it used to) and when
+tag items only record membership (as they do now).
+
+    python -m tests.benchmarks.bench_tag_items --tags 1 5 20
+"""
+import argparse
+
+import bloggy.db as db
+from .. import factories
+from . import common
+
+
+def _summary_tag_item(post, tag):
+    # the previous implementation of db._published_post_tag_item
+    return db._serialized(
+        pk=f'post#{post.slug}',
+        sk=f'#post#published#tag#{tag.name}',
+        data=post.created.isoformat(),
+        version=post.version,
+        renderer=post.rendered.version,
+        summary=db._convertor.unstructure(post.summary())
+    )
+
+
+def _units(transact_items):
+    items = [w['Put']['Item'] for w in transact_items if 'Put' in w]
+    deletes = sum('Delete' in w for w in transact_items)
+    return common.write_units(items, transactional=True) + deletes * 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tags', type=int, nargs='+', default=[1, 5, 20])
+    parser.add_argument('--body-kb', type=int, default=4)
+    args = parser.parse_args()
+
+    common.connect_local()
+    db.truncate()
+    print(f'{"tags":>4} {"before WCU":>11} {"after WCU":>10} '
+          f'{"tag item bytes before/after":>28}')
+    for count in args.tags:
+        post = factories.PostFactory(
+            slug=f'bench-{count}', published=True,
+            body='x' * args.body_kb * 1024,
+            tags=[factories.TagFactory(name=f'bench-tag-{i}')
+                  for i in range(count)]
+        )
+        db.save_post(post)
+        post.title = 'A new title'
+        after = db._update_post_request(
+            post, db._get_published_items(post.slug)
+        )
+        # before, every item was rewritten: base, published and tag items
+        before = after[:2] + [
+            dict(Put=dict(Item=_summary_tag_item(post, tag)))
+            for tag in post.tags
+        ]
+        tag = post.tags[0]
+        print(f'{count:>4} {_units(before):>11} {_units(after):>10} '
+              f'{common.item_size(_summary_tag_item(post, tag)):>17,}/'
+              f'{common.item_size(db._published_post_tag_item(post, tag)):,}')
+    db.truncate()
+
+
+if __name__ == '__main__':
+    main()
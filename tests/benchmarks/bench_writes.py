@@ -0,0 +1,52 @@
+"""Compare per-call latency of single-item writes sent as a one-item
+TransactWriteItems (as save_tag/update_tag used to) and as a conditional
+PutItem (as they do now).
+
+    python -m tests.benchmarks.bench_writes --repeat 200
+"""
+import argparse
+
+import bloggy.db as db
+from .. import factories
+from . import common
+
+
+def _transact_update_tag(tag):
+    # the previous implementation of db.update_tag
+    tag.version += 1
+    db._conn.client.transact_write_items(TransactItems=[dict(
+        Put=dict(
+            TableName=db._table_name,
+            Item=db._tag_item(tag),
+            ConditionExpression='version = :version',
+            ExpressionAttributeValues={
+                ':version': db._serializer.serialize(tag.version - 1)
+            }
+        )
+    )])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    common.connect_local()
+    db.truncate()
+    tag = factories.TagFactory(name='bench')
+    db.save_tag(tag)
+
+    before = common.timed(lambda: _transact_update_tag(tag), args.repeat)
+    after = common.timed(lambda: db.update_tag(tag), args.repeat)
+    item = db._tag_item(tag)
+
+    print(f'{"update_tag":<28} {"ms/call":>8} {"WCU/call":>9}')
+    print(f'{"before: TransactWriteItems":<28} {before * 1000:>8.2f} '
+          f'{common.write_units([item], transactional=True):>9}')
+    print(f'{"after: conditional PutItem":<28} {after * 1000:>8.2f} '
+          f'{common.write_units([item]):>9}')
+    db.truncate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Shared helpers for the benchmark scripts in this package.
+
+The scripts talk to DynamoDB Local (see `make startddb createtable`), or
+with BLOGGY_DB_BACKEND=memory to an in-memory table, and are run as modules
+from the repository root, e.g. `python -m tests.benchmarks.bench_list_page`.
+"""
+import math
+import os
+import time
+
+import bloggy.db as db
+
+
+def connect_local():
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'foo')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bar')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    if os.environ.get('BLOGGY_DB_BACKEND') == 'memory':
+        db.connect(backend='memory')
+    else:
+        db.connect(use_local=True)
+
+
+def _value_size(value):
+    (type_, v), = value.items()
+    if type_ == 'S':
+        return len(v.encode('utf-8'))
+    if type_ == 'N':
+        return math.ceil(len(v.lstrip('-').replace('.', '')) / 2) + 1
+    if type_ == 'B':
+        return len(v)
+    if type_ in ('BOOL', 'NULL'):
+        return 1
+    if type_ == 'M':
+        return 3 + sum(len(k.encode('utf-8')) + _value_size(x) + 1
+                       for k, x in v.items())
+    if type_ == 'L':
+        return 3 + sum(_value_size(x) + 1 for x in v)
+    if type_ in ('SS', 'NS', 'BS'):
+        return sum(_value_size({type_[0]: x}) for x in v)
+    raise ValueError(f'Unknown attribute type: {type_}')
+
+
+def item_size(item):
+    """Approximate the size DynamoDB bills for a low-level (typed) item."""
+    return sum(len(k.encode('utf-8')) + _value_size(v)
+               for k, v in item.items())
+
+
+def read_units(items):
+    """Eventually consistent read units for a query returning `items`."""
+    return math.ceil(sum(item_size(i) for i in items) / 4096) * 0.5
+
+
+def write_units(items, transactional=False):
+    units = sum(math.ceil(item_size(i) / 1024) for i in items)
+    return units * 2 if transactional else units
+
+
+def timed(fn, repeat=20):
+    """Run `fn` `repeat` times and return the mean seconds per call."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
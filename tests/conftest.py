@@ -1,15 +1,26 @@
 import datetime
+import os
 import unittest.mock
 
 import pytest
 
 import bloggy
+import bloggy.memory
 from . import factories
 
 
+@pytest.fixture(autouse=True)
+def app_env(monkeypatch):
+    """The settings create_app needs, so that the tests don't rely on the
+    environment (.envrc) for them."""
+    monkeypatch.setenv('BLOGGY_ENV', 'dev')
+    monkeypatch.setenv('BLOGGY_SECRET_KEY', 'test-secret-key')
+
+
 @pytest.fixture
-def app():
+def app(tmp_path):
     app = bloggy.create_app()
+    bloggy.search.index.open(str(tmp_path / 'search.idx'))
     return app
 
 
@@ -36,16 +47,44 @@ def mock_get_published_posts():
         yield mock
 
 
+# BLOGGY_DB_BACKEND=memory runs the tests against bloggy.memory rather
+# than DynamoDB Local, as it does the app
+db_backend = os.environ.get('BLOGGY_DB_BACKEND', 'dynamodb')
+
+
+@pytest.fixture()
+def requires_dynamodb():
+    if db_backend == 'memory':
+        pytest.skip('needs boto3 talking to DynamoDB Local')
+
+
+@pytest.fixture()
+def connect_db():
+    """Reconnect to the test table, with other `db.connect` options."""
+    def connect(**kwargs):
+        if db_backend == 'memory':
+            bloggy.db.connect(backend='memory', **kwargs)
+        else:
+            bloggy.db.connect(use_local=True, **kwargs)
+    return connect
+
+
 @pytest.fixture()
-def use_local_dynamodb(monkeypatch):
+def use_local_dynamodb(monkeypatch, connect_db):
     monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'foo')
     monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'bar')
-    bloggy.db.connect(use_local=True)
+    connect_db()
 
 
 @pytest.fixture()
 def empty_blog_table(use_local_dynamodb):
-    bloggy.db.truncate()
+    # don't let a previous test's background jobs write into this one
+    bloggy.jobs.runner.join()
+    if db_backend == 'memory':
+        # no tables at all: the connection creates the table when it opens
+        bloggy.memory.database.restore({})
+    else:
+        bloggy.db.truncate()
 
 
 @pytest.fixture()
@@ -1,6 +1,7 @@
 import os
 
 import bloggy.db as db
+import bloggy.importer as importer
 import factories
 
 
@@ -10,13 +11,8 @@ db.connect(use_local=True)
 
 db.truncate()
 
-tags = []
-for _ in range(5):
-    tag = factories.TagFactory()
-    tags.append(tag)
-    db.save_tag(tag)
+tags = [factories.TagFactory() for _ in range(5)]
+posts = [factories.PostFactory(tags=tags) for _ in range(100)]
 
-
-for _ in range(100):
-    post = factories.PostFactory(tags=tags)
-    db.save_post(post)
+result = importer.import_objects(tags + posts)
+print(f'Created {result.items} items in {result.seconds:.2f}s')
@@ -0,0 +1,211 @@
+import asyncio
+import datetime
+import threading
+
+import pytest
+
+pytest.importorskip('aiobotocore')
+
+import bloggy.aiodb as aiodb  # noqa: E402
+import bloggy.jobs  # noqa: E402
+import bloggy.db as db  # noqa: E402
+from . import factories  # noqa: E402
+
+# aiodb talks to DynamoDB itself, with no in-memory backend
+pytestmark = pytest.mark.usefixtures('requires_dynamodb')
+
+
+def run(coro):
+    async def connected():
+        await aiodb.connect(use_local=True)
+        try:
+            return await coro
+        finally:
+            await aiodb.close()
+    return asyncio.run(connected())
+
+
+def test_save_then_get_post(empty_blog_table):
+    post = factories.PostFactory(published=True)
+    run(aiodb.save_post(post))
+
+    assert run(aiodb.get_post(post.slug, on_not_found=pytest.fail)) == post
+    # written exactly as the sync module would write it
+    assert db.get_post(post.slug, on_not_found=pytest.fail) == post
+
+
+def test_get_post_not_found(empty_blog_table):
+    not_found = []
+    assert run(aiodb.get_post('missing',
+                              on_not_found=lambda: not_found.append(1))) \
+        is None
+    assert not_found == [1]
+
+
+def test_get_published_posts_pages(empty_blog_table):
+    for i in range(5):
+        db.save_post(factories.PostFactory(
+            slug=f'post{i}', published=True,
+            tags=[factories.TagFactory(name='t')],
+            created=datetime.datetime(2022, 1, 1 + i)
+        ))
+
+    first = run(aiodb.get_published_posts(tag='t', limit=3))
+    second = run(aiodb.get_published_posts(tag='t', limit=3,
+                                           paging_key=first.paging_key))
+
+    assert [p.slug for p in first.items] == ['post4', 'post3', 'post2']
+    assert [p.slug for p in second.items] == ['post1', 'post0']
+    assert first == db.get_published_posts(tag='t', limit=3)
+
+
+def test_concurrent_reads(empty_blog_table):
+    post = factories.PostFactory(published=True)
+    db.save_post(post)
+
+    async def read_many():
+        return await asyncio.gather(*(
+            aiodb.get_published_post_version(post.slug) for _ in range(50)
+        ))
+
+    assert {v.version for v in run(read_many())} == {1}
+
+
+def test_update_post(empty_blog_table):
+    post = factories.PostFactory(published=True, tags=[
+        factories.TagFactory(name='a'), factories.TagFactory(name='b')
+    ])
+    db.save_post(post)
+    post.tags = post.tags[:1]
+    post.published = True
+    run(aiodb.update_post(post))
+
+    assert db.get_post(post.slug, on_not_found=pytest.fail).version == 2
+    assert db.get_published_posts(tag='b').items == []
+    assert [p.slug for p in db.get_published_posts(tag='a').items] == \
+        [post.slug]
+
+
+def test_signals_are_sent_off_the_event_loop(empty_blog_table):
+    threads = []
+
+    def receiver(sender, **kwargs):
+        threads.append(threading.get_ident())
+    post = factories.PostFactory(published=True)
+    with db.post_created.connected_to(receiver), \
+            db.post_updated.connected_to(receiver), \
+            db.post_deleted.connected_to(receiver):
+        run(aiodb.save_post(post))
+        run(aiodb.update_post(post))
+        run(aiodb.delete_post(post.slug))
+
+    assert len(threads) == 3
+    assert threading.get_ident() not in threads
+
+
+def test_update_post_conflict(empty_blog_table):
+    post = factories.PostFactory()
+    db.save_post(post)
+    db.update_post(db.get_post(post.slug, on_not_found=pytest.fail))
+
+    with pytest.raises(db.ConcurrentUpdateException):
+        run(aiodb.update_post(post))
+
+
+def test_save_duplicate_tag(empty_blog_table):
+    run(aiodb.save_tag(db.Tag(name='t', label='T')))
+
+    with pytest.raises(db.DuplicateKeyException):
+        run(aiodb.save_tag(db.Tag(name='t', label='T')))
+
+
+def test_tags(empty_blog_table):
+    tag = db.Tag(name='t', label='T')
+    run(aiodb.save_tag(tag))
+    tag.label = 'New'
+    run(aiodb.update_tag(tag))
+
+    assert run(aiodb.get_tag('t', on_not_found=pytest.fail)) == \
+        db.Tag(name='t', label='New', version=2)
+    assert run(aiodb.get_all_tags()).items == [tag]
+
+
+def test_update_tag_records_relabel_job(empty_blog_table):
+    tag = db.Tag(name='t', label='T')
+    db.save_tag(tag)
+    db.save_post(factories.PostFactory(slug='post1', tags=[tag]))
+    tag.label = 'New'
+    run(aiodb.update_tag(tag))
+
+    [job] = db.get_jobs()
+    assert (job.kind, job.args, job.status) == \
+        ('relabel_tag', dict(name='t'), 'pending')
+    assert bloggy.jobs.runner.resume() == 1
+    bloggy.jobs.runner.join()
+    assert db.get_post('post1', pytest.fail).tags[0].label == 'New'
+
+
+def test_delete_post(empty_blog_table):
+    post = factories.PostFactory(published=True)
+    db.save_post(post)
+    run(aiodb.delete_post(post.slug))
+
+    assert list(db._get_items(f'post#{post.slug}')) == []
+
+
+def test_sharded_get_published_posts(empty_blog_table):
+    db.connect(use_local=True, published_shards=4)
+    try:
+        for i in range(5):
+            db.save_post(factories.PostFactory(
+                slug=f'post{i}', published=True,
+                created=datetime.datetime(2022, 1, 1 + i)
+            ))
+
+        first = run(aiodb.get_published_posts(limit=3))
+        second = run(aiodb.get_published_posts(limit=3,
+                                               paging_key=first.paging_key))
+    finally:
+        db.connect(use_local=True)
+
+    assert [p.slug for p in first.items] == ['post4', 'post3', 'post2']
+    assert [p.slug for p in second.items] == ['post1', 'post0']
+
+
+def test_page_index(empty_blog_table):
+    db.connect(use_local=True, page_index=True)
+    try:
+        for i in range(12):
+            run(aiodb.save_post(factories.PostFactory(
+                slug=f'post{i:02}', published=True,
+                created=datetime.datetime(2022, 1, 1 + i)
+            )))
+        run(aiodb.delete_post('post11'))
+
+        assert run(aiodb.get_page_start(2)) == \
+            dict(created='2022-01-02T00:00:00', slug='post01')
+        assert run(aiodb.get_page_start(3)) is None
+        assert db.get_page_start(2) == run(aiodb.get_page_start(2))
+    finally:
+        db.connect(use_local=True)
+
+
+def test_exists(empty_blog_table):
+    db.save_post(factories.PostFactory(slug='post1'))
+
+    assert run(aiodb.post_exists('post1'))
+    assert not run(aiodb.tag_exists('post1'))
+    assert run(aiodb.posts_exist(['post1', 'post2'])) == {'post1'}
+
+
+def test_delete_tag(empty_blog_table):
+    tag = factories.TagFactory(name='tag1')
+    db.save_tag(tag)
+    db.save_post(factories.PostFactory(slug='post1', published=True,
+                                       tags=[tag]))
+    db.save_post(factories.PostFactory(slug='post2', published=False,
+                                       tags=[tag]))
+
+    assert run(aiodb.delete_tag('tag1')) == 2
+    assert not db.tag_exists('tag1')
+    assert db.get_post('post2', on_not_found=pytest.fail).tags == []
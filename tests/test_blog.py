@@ -1,3 +1,12 @@
+import datetime
+import re
+
+import pytest
+
+import bloggy
+from bloggy import search
+from . import factories
+
 
 
 def test_index_redirect(client):
@@ -6,6 +15,11 @@ def test_index_redirect(client):
     assert 'http://localhost/blog/' == response.headers['location']
 
 
+def _link(response, text):
+    match = re.search(r'<a href="([^"]*)">\s*' + text, response.text)
+    return match and match.group(1)
+
+
 def test_index(client, saved_posts):
     response = client.get('/blog/')
     assert response.status_code == 200
@@ -14,9 +28,8 @@ def test_index(client, saved_posts):
     assert b'Post 12!!' in response.data  # last one before paging
     assert b'Post 11!!' not in response.data
 
-    paging_link = b'<a href="/blog/?pt=eyIyIjogeyJjcmVhdGVkIjogIjIwMjMtMDEt' \
-        b'MTJUMDA6MDA6MDAiLCAic2x1ZyI6ICJwb3N0LTEyIn19&page=2"'
-    assert paging_link in response.data
+    assert _link(response, 'Older posts').startswith('/blog/?c=')
+    assert _link(response, 'Newer posts') is None
 
 
 def test_filter_by_tag(client, saved_posts):
@@ -24,53 +37,89 @@ def test_filter_by_tag(client, saved_posts):
     assert response.status_code == 200
     assert b'Post 21!!' not in response.data
     assert b'Post 20!!' in response.data
-    paging_link = b'<a href="/blog/?tag=even&pt=eyIyIjogeyJjcmVhdGVkIjogIjIw' \
-        b'MjMtMDEtMDRUMDA6MDA6MDAiLCAic2x1ZyI6ICJwb3N0LTQifX0&page=2"'
-    assert paging_link in response.data
+    assert _link(response, 'Older posts').startswith('/blog/?tag=even&c=')
 
 
 def test_paginate_with_filter(client, saved_posts):
-    response = client.get('/blog/?tag=even&pt=eyIyIjogeyJjcmVhdGVkIjogIjIw'
-                          'MjMtMDEtMDRUMDA6MDA6MDAiLCAic2x1ZyI6ICJwb3N0LTQ'
-                          'ifX0&page=2')
+    first = client.get('/blog/?tag=even')
+    response = client.get(_link(first, 'Older posts'))
     assert response.status_code == 200
     assert b'Post 2!!' in response.data
+    assert b'Post 20!!' not in response.data
 
-    prev_link = b'<a href="/blog/?tag=even&pt=eyIyIjogeyJjcmVhdGVkIjogIjIw' \
-        b'MjMtMDEtMDRUMDA6MDA6MDAiLCAic2x1ZyI6ICJwb3N0LTQifX0&page=1'
-    assert prev_link in response.data
-
-
-def test_prev_page_with_filter(client, saved_posts):
-    response = client.get('/blog/?tag=even&pt=eyIyIjogeyJjcmVhdGVkIjogIjIw'
-                          'MjMtMDEtMDRUMDA6MDA6MDAiLCAic2x1ZyI6ICJwb3N0LTQ'
-                          'ifX0&page=1')
-    assert b'Post 2!!' not in response.data
-    assert b'Post 20!!' in response.data
-    assert response.status_code == 200
+    assert _link(response, 'Newer posts') == '/blog/?tag=even'
 
 
 def test_paginate_no_filter(client, saved_posts):
-    response = client.get('/blog/?pt=eyIyIjogeyJjcmVhdGVkIjogIjIwMjMtMDEtMTJUM'
-                          'DA6MDA6MDAiLCAic2x1ZyI6ICJwb3N0LTEyIn19&page=2')
+    first = client.get('/blog/')
+    response = client.get(_link(first, 'Older posts'))
     assert response.status_code == 200
     assert b'Post 2!!' in response.data
     assert b'Post 21!!' not in response.data
 
-    prev_link = b'<a href="/blog/?pt=eyIyIjogeyJjcmVhdGVkIjogIjIwMjMtMDEtMTJ' \
-        b'UMDA6MDA6MDAiLCAic2x1ZyI6ICJwb3N0LTEyIn0sICIzIjogeyJjcmVhdGVkIjogI' \
-        b'jIwMjMtMDEtMDFUMDA6MDA6MDAiLCAic2x1ZyI6ICJwb3N0LTEifX0&page=1"'
-    assert prev_link in response.data
+    assert _link(response, 'Newer posts') == '/blog/'
 
 
-def test_prev_page_no_filter(client, saved_posts):
-    prev_link = '/blog/?pt=eyIyIjogeyJjcmVhdGVkIjogIjIwMjMtMDEtMTJ' \
-        'UMDA6MDA6MDAiLCAic2x1ZyI6ICJwb3N0LTEyIn0sICIzIjogeyJjcmVhdGVkIjogI' \
-        'jIwMjMtMDEtMDFUMDA6MDA6MDAiLCAic2x1ZyI6ICJwb3N0LTEifX0&page=1'
-    response = client.get(prev_link)
-    assert b'Post 2!!' not in response.data
-    assert b'Post 20!!' in response.data
+@pytest.fixture
+def more_odd_posts(saved_posts):
+    # enough older posts for three pages of odd ones
+    for i in range(1, 13):
+        bloggy.db.save_post(factories.PostFactory(
+            title=f'Old {i}!!', slug=f'old-{i}', published=True,
+            tags=[factories.TagFactory(name='odd', label='Odd')],
+            created=datetime.datetime(2022, 1, i)
+        ))
+
+
+def test_paginate_back_with_cursor(client, more_odd_posts):
+    page = client.get('/blog/?tag=odd')
+    for _ in range(2):
+        page = client.get(_link(page, 'Older posts'))
+    assert b'Old 1!!' in page.data
+    assert b'Old 2!!' not in page.data
+
+    prev = client.get(_link(page, 'Newer posts'))
+    assert b'Old 11!!' in prev.data
+    assert b'Old 2!!' in prev.data
+    assert b'Old 12!!' not in prev.data
+    assert _link(prev, 'Newer posts') == '/blog/?tag=odd'
+
+
+def test_cursor_stays_small(client, more_odd_posts):
+    first = client.get('/blog/?tag=odd')
+    second = client.get(_link(first, 'Older posts'))
+    assert len(_link(second, 'Older posts')) <= \
+        len(_link(first, 'Older posts'))
+
+
+@pytest.fixture
+def page_index(empty_blog_table, connect_db):
+    connect_db(page_index=True)
+    yield
+    connect_db()
+
+
+def test_page_index(client, page_index, more_odd_posts):
+    response = client.get('/blog/?tag=odd&page=3')
+    assert b'Old 1!!' in response.data
+    assert b'Old 2!!' not in response.data
+    assert _link(response, 'Newer posts') == '/blog/?tag=odd&page=2'
+
+    response = client.get('/blog/?page=2')
+    assert b'Post 11!!' in response.data
+    assert b'Post 12!!' not in response.data
+
+
+def test_page_index_beyond_last_page(client, page_index, saved_posts):
+    response = client.get('/blog/?page=9')
+    assert response.status_code == 404
+
+
+def test_tampered_cursor(client, saved_posts):
+    link = _link(client.get('/blog/'), 'Older posts')
+    response = client.get(link[:-2] + 'xx')
     assert response.status_code == 200
+    assert b'Post 21!!' in response.data
 
 
 def test_show_post(client, saved_posts):
@@ -83,3 +132,83 @@ def test_dodgy_pagination_token(client, saved_posts):
     response = client.get('/blog/?paging_token=xyz')
     assert response.status_code == 200
     assert b'Post 21!!' in response.data
+
+
+def test_show_post_not_modified(client, saved_posts):
+    response = client.get('/blog/post-11/')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    last_modified = response.headers['Last-Modified']
+    assert response.headers['Cache-Control'] == \
+        'public, max-age=60, s-maxage=300'
+
+    response = client.get('/blog/post-11/',
+                          headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    response = client.get('/blog/post-11/', headers={
+        'If-Modified-Since': last_modified
+    })
+    assert response.status_code == 304
+
+
+def test_show_post_modified(client, saved_posts):
+    etag = client.get('/blog/post-11/').headers['ETag']
+
+    post = bloggy.db.get_post('post-11', on_not_found=None)
+    post.title = 'Changed'
+    bloggy.db.update_post(post)
+
+    response = client.get('/blog/post-11/',
+                          headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert b'Changed' in response.data
+
+
+def test_show_unpublished_post(client, saved_posts):
+    response = client.get('/blog/post-19/')
+    assert response.status_code == 404
+    assert 'ETag' not in response.headers
+
+
+def test_list_not_modified(client, saved_posts):
+    etag = client.get('/blog/?tag=even').headers['ETag']
+
+    response = client.get('/blog/?tag=even',
+                          headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    response = client.get('/blog/?tag=odd',
+                          headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+
+def test_cache_control_is_configurable(app, saved_posts):
+    app.config['CACHE_MAX_AGE'] = 0
+    app.config['CACHE_S_MAXAGE'] = 3600
+    response = app.test_client().get('/blog/')
+    assert response.headers['Cache-Control'] == \
+        'public, max-age=0, s-maxage=3600'
+
+
+def test_search(client, saved_posts):
+    search.build()
+
+    response = client.get('/blog/search/?q=post')
+    assert b'20 posts found' in response.data
+    assert response.text.count('<h2>') == 10
+    assert _link(response, 'Better matches') is None
+
+    response = client.get(_link(response, 'More matches'))
+    assert response.text.count('<h2>') == 10
+    assert b'Post 19!!' not in response.data  # un-published
+    assert _link(response, 'More matches') is None
+    assert _link(response, 'Better matches') == '/blog/search/?q=post'
+
+
+def test_search_without_query(client, saved_posts):
+    response = client.get('/blog/search/')
+    assert response.status_code == 200
+    assert b'found' not in response.data
@@ -0,0 +1,86 @@
+import collections
+import time
+
+import bloggy.cache as cache
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = cache.MemoryBackend(maxsize=2)
+    backend.set(('a', '1'), 'A')
+    backend.set(('b', '1'), 'B')
+    assert backend.get(('a', '1')) == 'A'
+
+    backend.set(('c', '1'), 'C')
+    assert backend.get(('b', '1')) is None
+    assert backend.get(('a', '1')) == 'A'
+    assert backend.get(('c', '1')) == 'C'
+    assert len(backend) == 2
+
+
+def test_disk_backend(tmp_path):
+    backend = cache.DiskBackend(str(tmp_path), maxsize=2)
+    backend.set(('a', '1'), 'A')
+    backend.set(('a', '2'), 'A2')
+    backend.set(('b', '1'), 'B')
+    assert len(backend) == 2
+    assert backend.get(('b', '1')) == 'B'
+
+    backend.delete_group('a')
+    assert backend.get(('a', '2')) is None
+    assert len(backend) == 1
+
+    # entries survive a new backend over the same directory
+    assert cache.DiskBackend(str(tmp_path)).get(('b', '1')) == 'B'
+
+
+def test_render_cache_counts_hits_and_misses():
+    render_cache = cache.RenderCache()
+    calls = []
+
+    def render():
+        calls.append(1)
+        return '<p>Body</p>'
+
+    assert render_cache.get_or_render('post', 1, render) == '<p>Body</p>'
+    assert render_cache.get_or_render('post', 1, render) == '<p>Body</p>'
+    assert len(calls) == 1
+    assert render_cache.stats() == dict(hits=1, misses=1, size=1)
+
+    render_cache.get_or_render('post', 2, render)
+    assert len(calls) == 2
+
+
+def test_render_cache_invalidate():
+    render_cache = cache.RenderCache()
+    render_cache.get_or_render('post', 1, lambda: 'v1')
+    render_cache.get_or_render('post', 2, lambda: 'v2')
+
+    render_cache.invalidate('post', 1)
+    assert render_cache.stats()['size'] == 1
+
+    render_cache.invalidate('post')
+    assert render_cache.stats()['size'] == 0
+
+
+def test_tag_catalogue_reloads_when_invalidated_or_expired():
+    Tag = collections.namedtuple('Tag', 'name label')
+    loads = []
+
+    def load():
+        loads.append(1)
+        return [Tag('foo', f'Foo {len(loads)}')]
+
+    catalogue = cache.TagCatalogue(load, ttl=60)
+    assert catalogue.label('foo') == 'Foo 1'
+    assert catalogue.get('bar') is None
+    assert catalogue.label('bar', 'Bar') == 'Bar'
+    version = catalogue.version()
+    assert len(loads) == 1
+
+    catalogue.invalidate()
+    assert catalogue.label('foo') == 'Foo 2'
+    assert catalogue.version() != version
+
+    catalogue.ttl = 0
+    time.sleep(0.01)
+    assert catalogue.tags() == [Tag('foo', 'Foo 3')]
@@ -0,0 +1,47 @@
+import bloggy
+from . import factories
+from .test_importer import posts_json
+
+
+def test_backfill(app, empty_blog_table):
+    bloggy.db.save_post(factories.PostFactory(published=False))
+
+    result = app.test_cli_runner().invoke(args=['backfill', '--all'])
+    assert 'Re-rendered 1 items' in result.output
+
+
+def test_import(app, empty_blog_table):
+    result = app.test_cli_runner().invoke(args=['import', posts_json])
+    assert 'Imported 2 posts and 2 tags (9 items)' in result.output
+
+
+def test_reshard(app, empty_blog_table):
+    bloggy.db.save_post(factories.PostFactory(published=True))
+
+    result = app.test_cli_runner().invoke(args=['reshard', '--shards', '2'])
+    assert 'Moved 1 posts' in result.output
+    bloggy.db.reshard_published(shards=1)
+
+
+def test_replay_pending(app, empty_blog_table):
+    result = app.test_cli_runner().invoke(args=['replay-pending'])
+    assert 'Finished 0 updates' in result.output
+
+
+def test_rebuild_page_index(app, empty_blog_table):
+    bloggy.db.save_post(factories.PostFactory(
+        published=True, tags=[factories.TagFactory(name='t')]
+    ))
+    bloggy.db.save_tag(factories.TagFactory(name='t'))
+
+    result = app.test_cli_runner().invoke(args=['rebuild-page-index'])
+    assert 'Indexed 2 lists' in result.output
+
+
+def test_delete_tag(app, empty_blog_table):
+    tag = factories.TagFactory(name='tag1')
+    bloggy.db.save_tag(tag)
+    bloggy.db.save_post(factories.PostFactory(tags=[tag]))
+
+    result = app.test_cli_runner().invoke(args=['delete-tag', 'tag1'])
+    assert 'Deleted tag1, removing it from 1 posts' in result.output
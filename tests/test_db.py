@@ -1,8 +1,14 @@
+import concurrent.futures
+import copy
 import datetime
+import random
+import threading
+import unittest.mock
 
 import pytest
 
 import bloggy.db as db
+import bloggy.filters as filters
 from . import factories
 
 
@@ -177,7 +183,7 @@ def test_retag_post(empty_blog_table):
     assert updated.tags == [tag2, tag3]
 
     assert db.get_posts(tag=tag1).items == []
-    assert db.get_posts(tag='tag3').items == [updated]
+    assert db.get_posts(tag='tag3').items == [updated.summary()]
 
 
 def test_publish_post(empty_blog_table):
@@ -193,7 +199,7 @@ def test_publish_post(empty_blog_table):
 
     db.update_post(post)
 
-    assert db.get_posts(tag='tag1').items == [post]
+    assert db.get_posts(tag='tag1').items == [post.summary()]
 
 
 def test_unpublish_post(empty_blog_table):
@@ -222,6 +228,47 @@ def test_delete_post(empty_blog_table):
         db.get_post(slug=post.slug, on_not_found=raise_exception)
 
 
+def test_delete_post_over_several_pages(empty_blog_table, monkeypatch):
+    post = factories.PostFactory(published=True, tags=[
+        factories.TagFactory(name=f'tag{i}') for i in range(5)
+    ])
+    db.save_post(post)
+    items_query = db._items_query
+    monkeypatch.setattr(db, '_items_query',
+                        lambda pk: dict(items_query(pk), Limit=2))
+
+    db.delete_post(post.slug)
+
+    assert list(db._get_items(f'post#{post.slug}')) == []
+    assert db.get_published_posts(tag='tag4').items == []
+
+
+def test_delete_tag_removes_it_from_posts(sharded_blog_table):
+    tag = factories.TagFactory(name='doomed')
+    other = factories.TagFactory(name='other')
+    db.save_tag(tag)
+    for i, published in enumerate([True, True, False]):
+        db.save_post(factories.PostFactory(slug=f'post{i}',
+                                           published=published,
+                                           tags=[tag, other]))
+    db.save_post(factories.PostFactory(slug='untagged', published=True,
+                                       tags=[other]))
+    progress = []
+
+    assert db.delete_tag('doomed', workers=2,
+                         progress=lambda *p: progress.append(p)) == 3
+
+    assert sorted(progress) == [(1, 3), (2, 3), (3, 3)]
+    assert not db.tag_exists('doomed')
+    assert db.get_published_posts(tag='doomed').items == []
+    for slug in ['post0', 'post1', 'post2']:
+        post = post_or_fail(slug)
+        assert [t.name for t in post.tags] == ['other']
+        assert post.version == 2
+    assert post_or_fail('untagged').version == 1
+    assert len(db.get_published_posts(tag='other').items) == 3
+
+
 def test_duplicate_slug(empty_blog_table):
     db.save_post(factories.PostFactory(slug='post1'))
 
@@ -246,3 +293,649 @@ def test_concurrent_updates(empty_blog_table):
 
     updated = post_or_fail(slug=post.slug)
     assert updated.title == 'New title'
+
+
+def test_update_post_evicts_rendered_html(app, empty_blog_table):
+    post = factories.PostFactory(body='Original')
+    db.save_post(post)
+    filters.render_cache.clear()
+    filters.post_html(post)
+
+    post.body = 'Updated'
+    db.update_post(post)
+
+    assert filters.render_cache.stats()['size'] == 0
+    assert '<p>Updated</p>' == filters.post_html(post)
+
+
+def test_save_post_stores_rendered_html(empty_blog_table):
+    post = factories.PostFactory(body='First para\n\nSecond para',
+                                 published=True)
+    db.save_post(post)
+
+    saved = post_or_fail(slug=post.slug)
+    assert saved.rendered == db.Rendered(
+        html='<p>First para</p>\n<p>Second para</p>',
+        excerpt='<p>First para</p>',
+        version=filters.RENDERER_VERSION
+    )
+    assert db.get_published_posts().items[0].excerpt == '<p>First para</p>'
+
+
+def test_long_bodies_are_stored_compressed(empty_blog_table):
+    post = factories.PostFactory(body='A long paragraph. ' * 200,
+                                 published=True)
+    db.save_post(post)
+
+    item = db._conn.table.get_item(
+        Key={'pk': f'post#{post.slug}', 'sk': '#post'}
+    )['Item']
+    assert not isinstance(item['post']['body'], str)
+    assert not isinstance(item['post']['rendered']['html'], str)
+    assert post_or_fail(slug=post.slug) == post
+    assert [p['body'] for p in db.get_published_post_texts()] == [post.body]
+    assert db._pack('A short body') == 'A short body'
+
+
+def test_get_post_stored_in_legacy_format(empty_blog_table):
+    post = factories.PostFactory(body='A long paragraph. ' * 200)
+    db._render(post)
+    stored = db._convertor.unstructure(post)
+    # as posts were stored before bodies were compressed and defaults
+    # left out
+    stored.update(body=post.body, version=post.version,
+                  rendered=dict(stored['rendered'], html=post.rendered.html))
+    stored.setdefault('modified', None)
+    db._conn.client.put_item(TableName=db._table_name, Item=db._serialized(
+        pk=f'post#{post.slug}', sk='#post', data=post.created.isoformat(),
+        version=post.version, renderer=post.rendered.version, post=stored
+    ))
+
+    assert post_or_fail(slug=post.slug) == post
+
+
+def test_rerender_posts(empty_blog_table, monkeypatch):
+    post = factories.PostFactory(body='Body', published=True,
+                                 tags=[factories.TagFactory()])
+    db.save_post(post)
+    assert db.rerender_posts() == 0
+
+    monkeypatch.setattr(filters, 'RENDERER_VERSION', 2)
+    assert db.rerender_posts() == 1
+    assert post_or_fail(slug=post.slug).rendered.version == 2
+    assert db.rerender_posts() == 0
+
+
+def test_list_items_do_not_carry_bodies(empty_blog_table):
+    post = factories.PostFactory(slug='post1', published=True,
+                                 tags=[factories.TagFactory(name='tag1')])
+    db.save_post(post)
+
+    item = db._conn.table.get_item(
+        Key={'pk': 'post#post1', 'sk': '#post#published'}
+    )['Item']
+    assert 'post' not in item
+    assert item['summary']['title'] == post.title
+    item = db._conn.table.get_item(
+        Key={'pk': 'post#post1', 'sk': '#post#published#tag#tag1'}
+    )['Item']
+    assert set(item) == {'pk', 'sk', 'data'}
+
+    assert db.get_all_posts().items == [post.summary()]
+    assert db.get_published_posts().items == [post.summary()]
+    assert db.get_published_posts(tag='tag1').items == [post.summary()]
+
+
+def _write_keys(transactions):
+    return [[(op, w['Key' if op == 'Delete' else 'Item']['sk']['S'])
+             for w in transact_items for op, w in w.items()]
+            for transact_items in transactions]
+
+
+def test_update_writes_only_changed_items(empty_blog_table):
+    post = factories.PostFactory(published=True, tags=[
+        factories.TagFactory(name='a'), factories.TagFactory(name='b')
+    ])
+    db.save_post(post)
+    previous = copy.deepcopy(post)
+    post.title = 'New title'
+
+    assert _write_keys(db._update_post_request(post, previous)) == [[
+        ('Put', '#post'),
+        ('Put', '#post#published'),
+    ]]
+
+    previous = copy.deepcopy(post)
+    post.tags = [factories.TagFactory(name='a'),
+                 factories.TagFactory(name='c')]
+
+    assert _write_keys(db._update_post_request(post, previous)) == [[
+        ('Put', '#post'),
+        ('Delete', '#post#published#tag#b'),
+        ('Put', '#post#published'),
+        ('Put', '#post#published#tag#c'),
+    ]]
+
+    previous = copy.deepcopy(post)
+    post.published = False
+
+    assert _write_keys(db._update_post_request(post, previous)) == [[
+        ('Put', '#post'),
+        ('Delete', '#post#published'),
+        ('Delete', '#post#published#tag#a'),
+        ('Delete', '#post#published#tag#c'),
+        ('Put', '#post#tag#a'),
+        ('Put', '#post#tag#c'),
+    ]]
+
+
+def test_update_post_with_previous_skips_read(empty_blog_table):
+    post = factories.PostFactory(published=True)
+    db.save_post(post)
+    previous = copy.deepcopy(post)
+    post.title = 'New title'
+
+    with unittest.mock.patch.object(db._conn.table, 'query') as query, \
+            unittest.mock.patch.object(db._conn.table, 'get_item') as get:
+        db.update_post(post, previous=previous)
+    query.assert_not_called()
+    get.assert_not_called()
+    assert post_or_fail(post.slug).title == 'New title'
+
+
+def _tag_item_names(slug):
+    return sorted(item['sk'].split('#')[4]
+                  for item in db._get_published_items(slug)
+                  if '#tag#' in item['sk'])
+
+
+def _pending(slug):
+    return [item for item in db._get_items(f'post#{slug}')
+            if item['sk'] == '#post#pending']
+
+
+def test_update_post_with_many_tag_changes(empty_blog_table):
+    post = factories.PostFactory(published=True, tags=[
+        factories.TagFactory(name=f'old{i}') for i in range(60)
+    ])
+    db.save_post(post)
+    post.tags = [factories.TagFactory(name=f'new{i}') for i in range(60)]
+    db.update_post(post)
+
+    assert _tag_item_names(post.slug) == sorted(t.name for t in post.tags)
+    assert _pending(post.slug) == []
+
+
+def test_replay_interrupted_update(empty_blog_table):
+    post = factories.PostFactory(published=True, tags=[
+        factories.TagFactory(name=f'old{i}') for i in range(60)
+    ])
+    db.save_post(post)
+    post.tags = [factories.TagFactory(name=f'new{i}') for i in range(60)]
+    write = db._write
+
+    def fail_after_first(transact_items, on_conflict):
+        if fail_after_first.calls:
+            raise RuntimeError('interrupted')
+        fail_after_first.calls += 1
+        write(transact_items, on_conflict)
+    fail_after_first.calls = 0
+
+    with unittest.mock.patch.object(db, '_write', fail_after_first):
+        with pytest.raises(RuntimeError):
+            db.update_post(post)
+    assert len(_pending(post.slug)) == 1
+
+    assert db.replay_pending_updates() == 1
+    assert _tag_item_names(post.slug) == sorted(t.name for t in post.tags)
+    assert _pending(post.slug) == []
+    assert db.replay_pending_updates() == 0
+
+
+def test_tag_page_with_legacy_tag_items(empty_blog_table):
+    post = factories.PostFactory(slug='post1', published=True,
+                                 tags=[factories.TagFactory(name='tag1')])
+    db.save_post(post)
+    db._conn.client.put_item(TableName=db._table_name, Item=db._serialized(
+        pk='post#post1', sk='#post#published#tag#tag1',
+        data=post.created.isoformat(),
+        summary=db._convertor.unstructure(post.summary())
+    ))
+
+    assert db.get_published_posts(tag='tag1').items == [post.summary()]
+
+    # its copy of the summary goes stale, so isn't what's shown
+    post.title = 'New title'
+    db.update_post(post)
+    assert db.get_published_posts(tag='tag1').items[0].title == 'New title'
+
+
+def test_summary_from_legacy_published_item():
+    post = factories.PostFactory()
+    item = dict(post=db._convertor.unstructure(post))
+    assert db._summary_from_item(item) == post.summary()
+
+
+def test_unpublish_post_removes_it_from_listing(empty_blog_table):
+    post = factories.PostFactory(slug='post1', published=True)
+    db.save_post(post)
+    assert db.get_published_post_version('post1').version == 1
+
+    post.published = False
+    db.update_post(post)
+
+    assert db.get_published_posts().items == []
+    assert db.get_published_post_version('post1') is None
+
+
+def test_duplicate_tag(empty_blog_table):
+    db.save_tag(factories.TagFactory(name='tag1'))
+
+    with pytest.raises(db.DuplicateKeyException,
+                       match=r'Item already exists'):
+        db.save_tag(factories.TagFactory(name='tag1'))
+
+
+def test_concurrent_tag_updates(empty_blog_table):
+    tag = factories.TagFactory(name='tag1', label='Tag 1')
+    db.save_tag(tag)
+    stale = db.get_tag(name='tag1', on_not_found=pytest.fail)
+
+    tag.label = 'New label'
+    db.update_tag(tag)
+
+    stale.label = 'Another label'
+    with pytest.raises(db.ConcurrentUpdateException,
+                       match=r'Concurrent update exception'):
+        db.update_tag(stale)
+    assert db.get_tag(name='tag1', on_not_found=pytest.fail) == tag
+
+
+def test_single_item_writes_skip_transactions(empty_blog_table):
+    with unittest.mock.patch.object(db._conn.client, 'transact_write_items',
+                                    side_effect=AssertionError):
+        tag = factories.TagFactory()
+        db.save_tag(tag)
+        db.update_tag(tag)
+        db.save_post(factories.PostFactory(published=False, tags=[]))
+
+
+def test_client_config(requires_dynamodb, use_local_dynamodb):
+    config = db.client_config(max_pool_connections=32, read_timeout=3,
+                              retry_mode='adaptive')
+    db.connect(use_local=True, config=config)
+
+    client_config = db._conn.client.meta.config
+    assert client_config.max_pool_connections == 32
+    assert client_config.read_timeout == 3
+    assert client_config.retries['mode'] == 'adaptive'
+    assert client_config.tcp_keepalive
+    # plain and typed calls go through the same client and connection pool
+    assert db._conn.table.client is db._conn.client
+
+
+def test_concurrent_reads(saved_posts, connect_db):
+    expected = post_or_fail('post-11')
+
+    def read(i):
+        if i % 50 == 0:
+            # reconnecting mid-flight must not break in-progress reads
+            connect_db()
+        return post_or_fail('post-11')
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(read, range(200)))
+
+    assert all(post == expected for post in results)
+
+
+@pytest.fixture()
+def sharded_blog_table(empty_blog_table, connect_db):
+    connect_db(published_shards=4)
+    yield
+    connect_db()
+
+
+def _save_dated_posts(count, **kwargs):
+    for i in range(count):
+        db.save_post(factories.PostFactory(
+            slug=f'post{i}', published=True,
+            created=datetime.datetime(2022, 1, 1) + datetime.timedelta(i),
+            **kwargs
+        ))
+
+
+def _all_pages(limit, **kwargs):
+    slugs = []
+    paging_key = None
+    while True:
+        page = db.get_published_posts(limit=limit, paging_key=paging_key,
+                                      **kwargs)
+        slugs.append([p.slug for p in page.items])
+        if not page.paging_key:
+            return slugs
+        paging_key = page.paging_key
+
+
+def test_sharded_items_spread_over_partitions(sharded_blog_table):
+    _save_dated_posts(12)
+
+    partitions = {item['sk'] for item in db.scan()
+                  if item['sk'].startswith('#post#published')}
+    assert len(partitions) > 1
+    assert '#post#published' not in partitions
+    assert db.get_published_post_version('post3').version == 1
+
+
+def test_full_last_page_leads_nowhere(empty_blog_table):
+    _save_dated_posts(6, tags=[factories.TagFactory(name='t')])
+    for i in range(4):
+        db.save_tag(factories.TagFactory(name=f'tag{i}'))
+    expected = [[f'post{i}' for i in range(5, 2, -1)],
+                [f'post{i}' for i in range(2, -1, -1)]]
+
+    assert _all_pages(3) == expected
+    assert _all_pages(3, tag='t') == expected
+    assert db.get_all_tags(limit=4).paging_key is None
+
+
+def test_sharded_full_last_page_leads_nowhere(sharded_blog_table):
+    _save_dated_posts(6)
+
+    assert _all_pages(3) == [[f'post{i}' for i in range(5, 2, -1)],
+                             [f'post{i}' for i in range(2, -1, -1)]]
+
+
+def test_sharded_get_published_posts_pages(sharded_blog_table):
+    _save_dated_posts(12, tags=[factories.TagFactory(name='t')])
+    expected = [[f'post{i}' for i in range(11, 6, -1)],
+                [f'post{i}' for i in range(6, 1, -1)],
+                ['post1', 'post0']]
+
+    assert _all_pages(5) == expected
+    assert _all_pages(5, tag='t') == expected
+
+
+def test_sharded_pages_split_equal_created_times(sharded_blog_table):
+    for i in range(6):
+        db.save_post(factories.PostFactory(
+            slug=f'post{i}', published=True,
+            created=datetime.datetime(2022, 1, 1)
+        ))
+
+    pages = _all_pages(4)
+    assert sorted(sum(pages, [])) == [f'post{i}' for i in range(6)]
+    assert [len(p) for p in pages] == [4, 2]
+
+
+def test_sharded_unpublish(sharded_blog_table):
+    _save_dated_posts(3, tags=[factories.TagFactory(name='t')])
+    post = post_or_fail('post1')
+    post.published = False
+    db.update_post(post)
+
+    assert _all_pages(10) == [['post2', 'post0']]
+    assert _all_pages(10, tag='t') == [['post2', 'post0']]
+    assert db.get_published_post_version('post1') is None
+
+
+def test_tagged_slugs(empty_blog_table):
+    tag = factories.TagFactory(name='t')
+    db.save_post(factories.PostFactory(slug='published', published=True,
+                                       tags=[tag]))
+    db.save_post(factories.PostFactory(slug='draft', published=False,
+                                       tags=[tag]))
+    db.save_post(factories.PostFactory(slug='other', published=False,
+                                       tags=[factories.TagFactory()]))
+    assert db._tagged_slugs('t') == {'published', 'draft'}
+
+    post = post_or_fail('published')
+    post.published = False
+    db.update_post(post)
+    post = post_or_fail('draft')
+    post.tags = []
+    db.update_post(post)
+    assert db._tagged_slugs('t') == {'published'}
+
+
+def test_reshard_adds_missing_draft_tag_items(empty_blog_table):
+    db.save_post(factories.PostFactory(
+        slug='draft', published=False, tags=[factories.TagFactory(name='t')]
+    ))
+    # as saved before unpublished posts had tag items
+    db._conn.table.delete_item(Key=dict(pk='post#draft', sk='#post#tag#t'))
+    assert db._tagged_slugs('t') == set()
+
+    assert db.reshard_published() == 1
+    assert db._tagged_slugs('t') == {'draft'}
+
+
+def test_reshard_published(empty_blog_table, connect_db):
+    _save_dated_posts(6, tags=[factories.TagFactory(name='t')])
+    db.save_post(factories.PostFactory(slug='draft', published=False))
+
+    assert db.reshard_published(shards=4) == 6
+    connect_db(published_shards=4)
+    try:
+        assert _all_pages(10, tag='t') == \
+            [[f'post{i}' for i in range(5, -1, -1)]]
+        assert db.reshard_published() == 0
+        assert db.reshard_published(shards=1) == 6
+    finally:
+        connect_db()
+    assert _all_pages(10) == [[f'post{i}' for i in range(5, -1, -1)]]
+
+
+def test_get_published_posts_backward(empty_blog_table):
+    _save_dated_posts(7)
+    first = db.get_published_posts(limit=3)
+    second = db.get_published_posts(limit=3, paging_key=first.paging_key)
+
+    back = db.get_published_posts(limit=3, paging_key=second.prev_key,
+                                  backward=True)
+    assert [p.slug for p in back.items] == ['post6', 'post5', 'post4']
+    assert back.prev_key is None
+    assert back.paging_key == first.paging_key
+
+
+def test_sharded_get_published_posts_backward(sharded_blog_table):
+    _save_dated_posts(7)
+    first = db.get_published_posts(limit=3)
+    second = db.get_published_posts(limit=3, paging_key=first.paging_key)
+    third = db.get_published_posts(limit=3, paging_key=second.paging_key)
+
+    back = db.get_published_posts(limit=3, paging_key=third.prev_key,
+                                  backward=True)
+    assert [p.slug for p in back.items] == ['post3', 'post2', 'post1']
+    assert back.prev_key is not None
+
+
+def test_get_all_tags_backward(empty_blog_table):
+    for name in 'abcde':
+        db.save_tag(db.Tag(name=name, label=name.upper()))
+    first = db.get_all_tags(limit=2)
+    second = db.get_all_tags(limit=2, paging_key=first.paging_key)
+
+    back = db.get_all_tags(limit=2, paging_key=second.prev_key,
+                           backward=True)
+    assert [t.name for t in back.items] == ['a', 'b']
+
+
+
+def test_exists(empty_blog_table):
+    db.save_post(factories.PostFactory(slug='post1'))
+    db.save_tag(factories.TagFactory(name='tag1'))
+
+    assert db.post_exists('post1')
+    assert not db.post_exists('post2')
+    assert db.tag_exists('tag1')
+    assert not db.tag_exists('post1')
+    assert db.posts_exist(['post1', 'post2', 'post1']) == {'post1'}
+
+
+def test_segmented_scan(empty_blog_table):
+    for i in range(30):
+        db.save_tag(db.Tag(name=f'tag{i}', label=f'Tag {i}'))
+    counts = []
+
+    names = [item['pk'] for item in db.scan(segments=3, progress=counts.append,
+                                            Limit=4)]
+    assert sorted(names) == sorted(f'tag#tag{i}' for i in range(30))
+    assert counts == sorted(counts) and counts[-1] == 30
+
+    # stopping early stops the scanning threads too
+    items = db.scan(segments=3, Limit=1)
+    next(items)
+    items.close()
+    for thread in threading.enumerate():
+        if thread.name.startswith('bloggy-scan'):
+            thread.join(timeout=5)
+            assert not thread.is_alive()
+
+    assert db.truncate() == 30
+    assert list(db.scan()) == []
+
+
+def test_scan_raises_segment_errors(empty_blog_table):
+    with pytest.raises(Exception, match='ValidationException'):
+        list(db.scan(FilterExpression='nonsense ='))
+
+
+def test_tag_catalogue_follows_tag_writes(empty_blog_table):
+    for name in 'abc':
+        db.save_tag(db.Tag(name=name, label=name.upper()))
+    assert [t.name for t in db.tag_catalogue.tags()] == ['a', 'b', 'c']
+
+    tag = db.get_tag(name='b', on_not_found=pytest.fail)
+    tag.label = 'Bee'
+    db.update_tag(tag)
+    assert db.tag_catalogue.label('b') == 'Bee'
+
+    db.delete_tag('c')
+    assert db.tag_catalogue.get('c') is None
+
+
+@pytest.fixture()
+def page_index(empty_blog_table, connect_db):
+    connect_db(page_index=True)
+    yield
+    connect_db()
+
+
+def test_page_index_follows_publishing(page_index):
+    for i in range(25):
+        db.save_post(factories.PostFactory(
+            slug=f'post{i:02}', published=True,
+            tags=[factories.TagFactory(name='t')],
+            created=datetime.datetime(2022, 1, 1) + datetime.timedelta(i)
+        ))
+    assert db.get_page_start(3, tag='t') == \
+        dict(created='2022-01-06T00:00:00', slug='post05')
+
+    post = post_or_fail('post24')
+    post.published = False
+    db.update_post(post)
+    assert db.get_page_start(3) == \
+        dict(created='2022-01-05T00:00:00', slug='post04')
+
+    db.delete_post('post23')
+    assert db.get_page_start(3) == \
+        dict(created='2022-01-04T00:00:00', slug='post03')
+    assert db.get_page_start(4) is None
+
+
+def test_page_index_follows_the_post_written(page_index, monkeypatch):
+    for i in range(11):
+        db.save_post(factories.PostFactory(
+            slug=f'post{i:02}', published=True,
+            created=datetime.datetime(2022, 1, 1) + datetime.timedelta(i)
+        ))
+    # once the index exists, saves don't read the (eventually consistent)
+    # GSI, which may not have the post yet
+    monkeypatch.setattr(db, '_list_key_queries', lambda tag=None: [])
+    db.save_post(factories.PostFactory(
+        slug='post11', published=True, created=datetime.datetime(2022, 1, 12)
+    ))
+
+    assert db.get_page_start(2) == \
+        dict(created='2022-01-03T00:00:00', slug='post02')
+
+
+def test_page_index_retries_a_concurrent_change(page_index, monkeypatch):
+    for i in range(10):
+        db.save_post(factories.PostFactory(
+            slug=f'post{i:02}', published=True,
+            created=datetime.datetime(2022, 1, 1) + datetime.timedelta(i)
+        ))
+    # another save updates the index between this one's read and write
+    request = db._page_index_request
+    other = factories.PostFactory(slug='other', published=True,
+                                  created=datetime.datetime(2022, 2, 1))
+
+    def interleaved(*args):
+        monkeypatch.setattr(db, '_page_index_request', request)
+        db.save_post(other)
+        return request(*args)
+    monkeypatch.setattr(db, '_page_index_request', interleaved)
+    db.save_post(factories.PostFactory(
+        slug='post10', published=True, created=datetime.datetime(2022, 1, 11)
+    ))
+
+    assert db.get_page_start(2) == \
+        dict(created='2022-01-03T00:00:00', slug='post02')
+
+
+def test_missing_page_index_is_built_on_read(page_index):
+    for i in range(11):
+        db.save_post(factories.PostFactory(
+            slug=f'post{i:02}', published=True,
+            created=datetime.datetime(2022, 1, 1) + datetime.timedelta(i)
+        ))
+    db._conn.table.delete_item(Key=db._page_index_key())
+
+    assert db.get_page_start(2) == \
+        dict(created='2022-01-02T00:00:00', slug='post01')
+    assert db.get_page_start(3) is None
+
+
+def test_page_index_from_before_chunking_is_rebuilt(page_index):
+    for i in range(11):
+        db.save_post(factories.PostFactory(
+            slug=f'post{i:02}', published=True,
+            created=datetime.datetime(2022, 1, 1) + datetime.timedelta(i)
+        ))
+    db._conn.table.put_item(Item=dict(db._page_index_key(), limit=10,
+                                      starts=[]))
+    db._conn.table.put_item(Item=dict(db._page_index_key(),
+                                      sk='#pages#keys', keys=[], version=1))
+
+    assert db.get_page_start(2) == \
+        dict(created='2022-01-02T00:00:00', slug='post01')
+    assert [item['sk'] for item in db._get_items('pages')
+            if item['sk'] == '#pages#keys'] == []
+
+
+def test_page_index_keeps_keys_in_small_chunks(page_index, monkeypatch):
+    monkeypatch.setattr(db, '_page_chunk_size', 2)
+    days = list(range(30))
+    random.Random(1).shuffle(days)
+    for i in days:
+        db.save_post(factories.PostFactory(
+            slug=f'post{i:02}', published=True,
+            created=datetime.datetime(2022, 1, 1) + datetime.timedelta(i)
+        ))
+    for i in days[:10]:
+        db.delete_post(f'post{i:02}')
+    left = sorted(days[10:], reverse=True)
+
+    chunks = [item for item in db._get_items('pages')
+              if item['sk'] != '#pages']
+    assert max(len(chunk['keys']) for chunk in chunks) <= 4
+    assert sum(len(chunk['keys']) for chunk in chunks) == len(left)
+    for page in range(2, 6):
+        assert db.get_page_start(page, limit=4) == dict(
+            created=(datetime.datetime(2022, 1, 1) + datetime.timedelta(
+                left[(page - 1) * 4 - 1])).isoformat(),
+            slug=f'post{left[(page - 1) * 4 - 1]:02}'
+        )
+    assert db.get_page_start(6, limit=4) is None
@@ -0,0 +1,78 @@
+import os
+
+import bloggy
+from bloggy import export
+
+
+def _read(out_dir, *path):
+    with open(os.path.join(out_dir, *path, 'index.html')) as f:
+        return f.read()
+
+
+def test_export(app, saved_posts, tmp_path):
+    with app.app_context():
+        result = export.export(str(tmp_path), workers=0)
+
+    assert result.posts_rendered == 20
+    assert result.list_pages == 2 + 2 + 1  # home page, even, odd
+
+    home = _read(tmp_path, 'blog')
+    assert 'Post 21!!' in home
+    assert '<a href="/blog/page/2/">' in home
+    assert 'href="/blog/tags/even/"' in home
+    assert 'Post 2!!' in _read(tmp_path, 'blog', 'page', '2')
+    assert 'Post 20!!' in _read(tmp_path, 'blog', 'tags', 'even')
+    assert 'Post 11!!' in _read(tmp_path, 'blog', 'post-11')
+    assert not os.path.exists(tmp_path / 'blog' / 'post-19')
+    assert os.path.exists(tmp_path / 'static' / 'css' / 'main.css')
+
+
+def test_incremental_export(app, saved_posts, tmp_path):
+    with app.app_context():
+        export.export(str(tmp_path), workers=0)
+
+        post = bloggy.db.get_post('post-11', on_not_found=None)
+        post.title = 'Changed'
+        bloggy.db.update_post(post)
+        bloggy.db.delete_post('post-12')
+
+        result = export.export(str(tmp_path), workers=0)
+
+    assert result.posts_rendered == 1
+    assert result.posts_unchanged == 18
+    assert result.posts_removed == 1
+    assert 'Changed' in _read(tmp_path, 'blog', 'post-11')
+    assert not os.path.exists(tmp_path / 'blog' / 'post-12')
+
+
+def test_export_skips_posts_removed_meanwhile(app, saved_posts, tmp_path,
+                                             monkeypatch):
+    get_post = bloggy.db.get_post
+
+    def removed_meanwhile(slug, on_not_found):
+        if slug == 'post-11':
+            return on_not_found()
+        post = get_post(slug, on_not_found)
+        if slug == 'post-13':
+            post.published = False
+        return post
+    monkeypatch.setattr(bloggy.db, 'get_post', removed_meanwhile)
+    with app.app_context():
+        result = export.export(str(tmp_path), workers=0)
+
+    assert result.posts_rendered == 18
+    assert not os.path.exists(tmp_path / 'blog' / 'post-11')
+    assert not os.path.exists(tmp_path / 'blog' / 'post-13')
+    # not in the manifest, so the next export tries again
+    monkeypatch.setattr(bloggy.db, 'get_post', get_post)
+    with app.app_context():
+        result = export.export(str(tmp_path), workers=0)
+    assert result.posts_rendered == 2
+
+
+def test_export_command(app, saved_posts, tmp_path):
+    result = app.test_cli_runner().invoke(
+        args=['export', str(tmp_path), '--workers', '2']
+    )
+    assert 'Wrote 5 list pages and 20 posts' in result.output
+    assert 'Post 11!!' in _read(tmp_path, 'blog', 'post-11')
@@ -1,3 +1,8 @@
+import subprocess
+import sys
+
+import pytest
+
 import bloggy
 
 
@@ -25,3 +30,39 @@ def test_handler_500(client, mock_get_published_posts):
     response = client.get('/blog/')
     assert response.status_code == 500
     assert b'Server Error' in response.data
+
+
+def test_db_config_from_app_config(monkeypatch):
+    monkeypatch.delenv('BLOGGY_DB_BACKEND', raising=False)
+    # the client is only built, never called, but boto3 needs a region
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.setenv('BLOGGY_DB_MAX_POOL_CONNECTIONS', '24')
+    monkeypatch.setenv('BLOGGY_DB_CONNECT_TIMEOUT', '1')
+    bloggy.create_app()
+
+    config = bloggy.db._conn.client.meta.config
+    assert config.max_pool_connections == 24
+    assert config.connect_timeout == 1
+
+
+def test_create_app_needs_a_secret_key(monkeypatch):
+    monkeypatch.delenv('BLOGGY_SECRET_KEY')
+    with pytest.raises(RuntimeError, match='BLOGGY_SECRET_KEY'):
+        bloggy.create_app()
+
+
+def test_create_app_needs_a_search_index_outside_dev(monkeypatch):
+    monkeypatch.setenv('BLOGGY_ENV', 'production')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.delenv('BLOGGY_SEARCH_INDEX', raising=False)
+    with pytest.raises(RuntimeError, match='BLOGGY_SEARCH_INDEX'):
+        bloggy.create_app()
+
+
+def test_create_app_defers_heavy_imports():
+    code = 'import sys, bloggy; bloggy.create_app(); ' \
+        'print(",".join(m for m in ["boto3", "wtforms", "markdown", ' \
+        '"bleach"] if m in sys.modules))'
+    proc = subprocess.run([sys.executable, '-c', code], check=True,
+                          capture_output=True, text=True)
+    assert proc.stdout.strip() == ''
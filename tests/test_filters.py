@@ -1,4 +1,5 @@
 import bloggy.filters as filters
+from . import factories
 
 
 def test_md_to_html_empty_string():
@@ -27,3 +28,16 @@ def test_first_para_returns_first_para():
 
 def test_first_para_empty_string():
     assert '' == filters.first_para('')
+
+
+def test_post_html_renders_once_per_version():
+    filters.render_cache.clear()
+    post = factories.PostFactory(body='#Title\nBody', version=1)
+
+    assert '<h1>Title</h1>\n<p>Body</p>' == filters.post_html(post)
+    post.body = 'Changed'
+    assert '<h1>Title</h1>\n<p>Body</p>' == filters.post_html(post)
+
+    post.version = 2
+    assert '<p>Changed</p>' == filters.post_html(post)
+    assert filters.render_cache.stats()['hits'] == 1
@@ -51,3 +51,19 @@ def test_select_multiple_objects_field():
 
     form.populate_obj(obj)
     assert obj.tags == [bar, foo]
+
+
+def test_select_multiple_objects_field_unknown_choice():
+    tags = [Tag('foo', 'Foo')]
+
+    class F(wtforms.Form):
+        tags = forms.SelectMultipleObjectsField(
+            "Tags",
+            fetch_objects_fn=lambda: tags,
+            option_value_attr='name',
+            option_text_attr='label'
+        )
+
+    form = F(MultiDict([('tags', 'foo'), ('tags', 'nope')]))
+    assert not form.validate()
+    assert 'tags' in form.errors
@@ -0,0 +1,115 @@
+import datetime
+import json
+import os
+
+import pytest
+
+import bloggy.db as db
+from bloggy import importer
+from bloggy import search
+from . import factories
+
+
+posts_json = os.path.join(os.path.dirname(__file__), '..', 'posts.json')
+
+
+def test_import_posts_json(app, empty_blog_table):
+    result = importer.import_file(posts_json)
+
+    assert result.posts == 2
+    assert result.tags == 2
+    # each post has a base, published and per-tag items, plus two tags
+    assert result.items == 3 + 4 + 2
+
+    post = db.get_post('saundersfest-2023', on_not_found=pytest.fail)
+    assert post.title == 'SaundersFEST 2023'
+    assert post.rendered.html.startswith('<p>')
+    assert [p.slug for p in db.get_published_posts(tag='flask').items] == \
+        ['saundersfest-2023']
+    assert db.get_tag('python', on_not_found=pytest.fail).label == 'Python'
+    assert search.index.search('saundersfest')[0] == ['saundersfest-2023']
+
+
+def test_import_jsonl(empty_blog_table, tmp_path):
+    path = tmp_path / 'posts.jsonl'
+    tag = dict(name='tag1', label='Explicit label')
+    posts = [
+        db._convertor.unstructure(factories.PostFactory(
+            slug=f'post-{i}', published=False,
+            tags=[db.Tag(name='tag1', label='Tag 1')]
+        )) for i in range(60)
+    ]
+    path.write_text('\n'.join(json.dumps(r) for r in [tag] + posts))
+
+    result = importer.import_file(str(path), workers=4)
+
+    assert result.posts == 60
+    assert result.tags == 1
+    # each post and its tag item, and the tag
+    assert result.items == 121
+    assert len(db.get_all_posts(limit=100).items) == 60
+    assert db.get_tag('tag1', on_not_found=pytest.fail).label == \
+        'Explicit label'
+
+
+def test_batch_put_retries_unprocessed_items(empty_blog_table, monkeypatch):
+    batch_write_item = db._conn.client.batch_write_item
+    calls = []
+
+    def flaky_batch_write_item(RequestItems):
+        calls.append(RequestItems)
+        if len(calls) == 1:
+            requests = RequestItems[db._table_name]
+            batch_write_item(RequestItems={db._table_name: requests[:1]})
+            return dict(UnprocessedItems={db._table_name: requests[1:]})
+        return batch_write_item(RequestItems=RequestItems)
+
+    monkeypatch.setattr(db._conn.client, 'batch_write_item',
+                        flaky_batch_write_item)
+    tags = [factories.TagFactory() for _ in range(3)]
+    assert db.batch_put([db._tag_item(t) for t in tags], workers=1) == 3
+
+    assert len(calls) == 2
+    assert len(db.get_all_tags().items) == 3
+
+
+def test_import_skip_existing(empty_blog_table):
+    db.save_post(factories.PostFactory(slug='saundersfest-2023',
+                                       title='Kept'))
+
+    result = importer.import_file(posts_json, skip_existing=True)
+
+    assert result.posts == 1
+    assert result.skipped == 1
+    assert db.get_post('saundersfest-2023',
+                       on_not_found=pytest.fail).title == 'Kept'
+
+
+def test_import_replaces_existing_posts(app, empty_blog_table, connect_db):
+    connect_db(page_index=True)
+    try:
+        for i in range(11):
+            db.save_post(factories.PostFactory(
+                slug=f'post-{i:02}', published=True,
+                tags=[db.Tag(name='old', label='Old')],
+                created=datetime.datetime(2022, 1, 1 + i)
+            ))
+        db.get_page_start(2, tag='old')
+        assert db.tag_catalogue.get('new') is None
+        post = db.get_post('post-10', on_not_found=pytest.fail)
+        post.tags = [db.Tag(name='new', label='New')]
+        post.created = datetime.datetime(2021, 1, 1)
+
+        result = importer.import_objects([post])
+
+        assert result.posts == 1
+        assert [p.slug for p in db.get_published_posts(tag='new').items] \
+            == ['post-10']
+        assert 'post-10' not in \
+            [p.slug for p in db.get_published_posts(tag='old').items]
+        assert db.get_page_start(2, tag='old') is None
+        assert db.get_page_start(2) == \
+            dict(created='2022-01-01T00:00:00', slug='post-00')
+        assert db.tag_catalogue.label('new') == 'New'
+    finally:
+        connect_db()
@@ -0,0 +1,116 @@
+import pytest
+
+import bloggy.db as db
+from bloggy import jobs
+from . import factories
+
+
+def _tag_names(slug):
+    post = db.get_post(slug, on_not_found=pytest.fail)
+    return [tag.name for tag in post.tags]
+
+
+def _new_job(kind, **kwargs):
+    job = db.Job(id=kind, kind=kind, args=kwargs.pop('args', {}), **kwargs)
+    db.save_job(job)
+    return job
+
+
+def test_edit_tag_relabels_posts(client, empty_blog_table):
+    tag = factories.TagFactory(name='tag1', label='Old')
+    db.save_tag(tag)
+    for i, published in enumerate([True, True, False]):
+        db.save_post(factories.PostFactory(slug=f'post{i}', tags=[tag],
+                                           published=published))
+
+    response = client.post('/admin/tags/tag1/edit/',
+                           data=dict(label='New', version=1))
+    assert response.status_code == 302
+    jobs.runner.join()
+
+    for i in range(3):
+        post = db.get_post(f'post{i}', on_not_found=pytest.fail)
+        assert [t.label for t in post.tags] == ['New']
+    assert [t.label for t in db.get_published_posts(tag='tag1').items[0]
+            .tags] == ['New']
+
+    response = client.get('/admin/jobs/')
+    assert b'relabel_tag' in response.data
+    assert b'done' in response.data
+    assert b'3/3' in response.data
+
+
+def test_relabel_leaves_later_labels(empty_blog_table):
+    tag = factories.TagFactory(name='tag1', label='Old')
+    db.save_tag(tag)
+    tag.label = 'New'
+    db.update_tag(tag)
+    jobs.runner.join()
+    # as if relabelled by the job for a later update, which overtook this
+    # one
+    newer = db.Tag(name='tag1', label='Newer', version=tag.version + 1)
+    db.save_post(factories.PostFactory(slug='post1', tags=[newer]))
+    job = _new_job('relabel_tag', args=dict(name='tag1'))
+
+    assert jobs.Runner().run(job.id).status == 'done'
+    post = db.get_post('post1', on_not_found=pytest.fail)
+    assert [t.label for t in post.tags] == ['Newer']
+
+
+def test_delete_tag_in_background(client, empty_blog_table):
+    tag = factories.TagFactory(name='tag1')
+    db.save_tag(tag)
+    db.save_post(factories.PostFactory(slug='post1', tags=[tag]))
+
+    response = client.delete('/admin/tags/tag1/')
+    assert response.headers['Location'] == '/admin/jobs/'
+    jobs.runner.join()
+
+    assert not db.tag_exists('tag1')
+    assert _tag_names('post1') == []
+
+
+def test_resume_from_checkpoint(empty_blog_table):
+    tag = factories.TagFactory(name='tag1')
+    db.save_tag(tag)
+    for i in range(5):
+        db.save_post(factories.PostFactory(slug=f'post{i}', tags=[tag]))
+    # as if a process died after retagging the first three posts
+    job = _new_job('delete_tag', args=dict(name='tag1'), status='running',
+                   checkpoint='post2', done=3)
+
+    job = jobs.Runner().run(job.id)
+
+    assert job.status == 'done'
+    assert (job.done, job.total) == (5, 5)
+    assert [_tag_names(f'post{i}') for i in range(5)] == \
+        [['tag1']] * 3 + [[]] * 2
+    assert db.get_unfinished_jobs() == []
+
+
+def test_leased_job_is_left_alone(empty_blog_table):
+    job = _new_job('delete_tag', args=dict(name='tag1'))
+    assert db.claim_job(job.id, owner='other') is not None
+
+    assert jobs.Runner().run(job.id) is None
+    assert jobs.Runner().resume() == 1
+
+
+def test_failing_job_is_retried_then_failed(empty_blog_table, monkeypatch):
+    calls = []
+
+    def flaky(job, checkpoint):
+        calls.append(job.attempts)
+        checkpoint('a', 1, 2)
+        raise RuntimeError('Broken')
+
+    monkeypatch.setitem(jobs._handlers, 'flaky', flaky)
+    monkeypatch.setattr(jobs.time, 'sleep', lambda seconds: None)
+    job = _new_job('flaky')
+
+    job = jobs.Runner(max_attempts=3).run(job.id)
+
+    assert calls == [0, 1, 2]
+    assert job.status == 'failed'
+    assert 'RuntimeError: Broken' in job.error
+    assert db.get_job(job.id, on_not_found=pytest.fail) == job
@@ -0,0 +1,286 @@
+import decimal
+
+import botocore.exceptions
+import pytest
+
+import bloggy
+import bloggy.db as db
+import bloggy.memory as memory
+from . import factories
+
+
+@pytest.fixture
+def database():
+    database = memory.Database()
+    database.create_table('Blog', 'pk', 'sk', indexes={'GSI': ('sk', 'data')})
+    return database
+
+
+@pytest.fixture
+def table(database):
+    return memory.Table('Blog', database)
+
+
+@pytest.fixture
+def client(database):
+    return memory.Client(database)
+
+
+def _put_posts(table, count):
+    with table.batch_writer() as batch:
+        for i in range(count):
+            batch.put_item(Item=dict(pk=f'post#{i:02}', sk='#post',
+                                     data=f'2024-01-{i + 1:02}', n=i))
+
+
+def test_get_put_and_numbers(table):
+    table.put_item(Item=dict(pk='a', sk='b', n=1, nested=dict(xs=[1, 'x'])))
+
+    item = table.get_item(Key=dict(pk='a', sk='b'))['Item']
+    assert item == dict(pk='a', sk='b', n=decimal.Decimal(1),
+                        nested=dict(xs=[decimal.Decimal(1), 'x']))
+    assert table.get_item(Key=dict(pk='a', sk='c')) == {}
+    # like boto3, refuses floats
+    with pytest.raises(TypeError):
+        table.put_item(Item=dict(pk='a', sk='b', n=1.5))
+
+
+def test_returned_items_are_copies(table):
+    table.put_item(Item=dict(pk='a', sk='b', xs=[1]))
+    table.get_item(Key=dict(pk='a', sk='b'))['Item']['xs'].append(2)
+
+    assert table.get_item(Key=dict(pk='a', sk='b'))['Item']['xs'] == [1]
+
+
+def test_projection(table):
+    table.put_item(Item=dict(pk='a', sk='b', post=dict(slug='s', title='t'),
+                             other=1))
+
+    item = table.get_item(Key=dict(pk='a', sk='b'),
+                          ProjectionExpression='pk, #post.slug',
+                          ExpressionAttributeNames={'#post': 'post'})['Item']
+    assert item == dict(pk='a', post=dict(slug='s'))
+
+
+def test_condition_expressions(table):
+    table.put_item(Item=dict(pk='a', sk='b', version=1),
+                   ConditionExpression='attribute_not_exists(pk)')
+    with pytest.raises(memory.ConditionalCheckFailedException):
+        table.put_item(Item=dict(pk='a', sk='b'),
+                       ConditionExpression='attribute_not_exists(pk)')
+
+    table.put_item(Item=dict(pk='a', sk='b', version=2),
+                   ConditionExpression='version = :v and not (version > :v)'
+                   ' and version in (:v, :w) and version between :v and :w',
+                   ExpressionAttributeValues={':v': 1, ':w': 5})
+    with pytest.raises(botocore.exceptions.ClientError,
+                       match='ConditionalCheckFailed'):
+        table.delete_item(Key=dict(pk='a', sk='b'),
+                          ConditionExpression='version = :v',
+                          ExpressionAttributeValues={':v': 1})
+    # a string is never equal to a number
+    with pytest.raises(memory.ConditionalCheckFailedException):
+        table.delete_item(Key=dict(pk='a', sk='b'),
+                          ConditionExpression='version = :v',
+                          ExpressionAttributeValues={':v': '2'})
+
+
+def test_update_item(table):
+    table.put_item(Item=dict(pk='a', sk='b', job=dict(status='pending'),
+                             done=1, gone=True))
+
+    response = table.update_item(
+        Key=dict(pk='a', sk='b'),
+        UpdateExpression='set job.#status = :running, done = done + :one, '
+        'added = if_not_exists(added, :one) remove gone',
+        ConditionExpression='job.#status in (:pending, :running)',
+        ExpressionAttributeNames={'#status': 'status'},
+        ExpressionAttributeValues={':pending': 'pending',
+                                   ':running': 'running', ':one': 1},
+        ReturnValues='ALL_NEW'
+    )
+
+    assert response['Attributes'] == dict(
+        pk='a', sk='b', job=dict(status='running'), done=2, added=1
+    )
+
+
+def test_query_range_conditions(table):
+    for sk in ['tag#a', 'tag#b', 'post#a', 'post#b', 'post#c']:
+        table.put_item(Item=dict(pk='p', sk=sk))
+    table.put_item(Item=dict(pk='q', sk='post#a'))
+
+    def sks(condition, **values):
+        response = table.query(
+            KeyConditionExpression=f'pk = :pk and {condition}',
+            ExpressionAttributeValues=dict(
+                {':pk': 'p'}, **{f':{k}': v for k, v in values.items()}
+            )
+        )
+        return [item['sk'] for item in response['Items']]
+
+    assert sks('begins_with(sk, :p)', p='post#') == \
+        ['post#a', 'post#b', 'post#c']
+    assert sks('sk = :s', s='post#b') == ['post#b']
+    assert sks('sk < :s', s='post#b') == ['post#a']
+    assert sks('sk <= :s', s='post#b') == ['post#a', 'post#b']
+    assert sks('sk > :s', s='post#c') == ['tag#a', 'tag#b']
+    assert sks('sk >= :s', s='tag#b') == ['tag#b']
+    assert sks('sk between :a and :b', a='post#b', b='tag#a') == \
+        ['post#b', 'post#c', 'tag#a']
+
+
+def test_query_index_pages(table):
+    _put_posts(table, 10)
+    table.put_item(Item=dict(pk='draft', sk='#draft', data='2024-01-05'))
+
+    def pages(**kwargs):
+        args = dict(dict(
+            IndexName='GSI', Limit=3,
+            KeyConditionExpression='sk = :sk and #data <= :created',
+            ExpressionAttributeNames={'#data': 'data'},
+            ExpressionAttributeValues={':sk': '#post',
+                                       ':created': '2024-01-08'}
+        ), **kwargs)
+        while True:
+            response = table.query(**args)
+            yield [item['n'] for item in response['Items']]
+            if 'LastEvaluatedKey' not in response:
+                return
+            assert set(response['LastEvaluatedKey']) == {'pk', 'sk', 'data'}
+            args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    assert list(pages(ScanIndexForward=False)) == \
+        [[7, 6, 5], [4, 3, 2], [1, 0]]
+    # like DynamoDB, a full page leads on, even if only to an empty one
+    assert list(pages(ScanIndexForward=False, Limit=4)) == \
+        [[7, 6, 5, 4], [3, 2, 1, 0], []]
+    assert list(pages()) == [[0, 1, 2], [3, 4, 5], [6, 7]]
+    # Limit counts the items read, before the filter
+    assert list(pages(FilterExpression='n <> :n',
+                      ExpressionAttributeValues={':sk': '#post',
+                                                 ':created': '2024-01-08',
+                                                 ':n': 1})) == \
+        [[0, 2], [3, 4, 5], [6, 7]]
+
+
+def test_invalid_requests(table):
+    with pytest.raises(memory.ValidationException):
+        table.scan(FilterExpression='nonsense =')
+    with pytest.raises(memory.ValidationException):
+        table.query(IndexName='Nope', KeyConditionExpression='pk = :pk',
+                    ExpressionAttributeValues={':pk': 'a'})
+    with pytest.raises(memory.ValidationException):
+        table.query(KeyConditionExpression='n = :n',
+                    ExpressionAttributeValues={':n': 1})
+    with pytest.raises(memory.ResourceNotFoundException):
+        memory.Table('Nope', table.database).get_item(Key=dict(pk='a'))
+
+
+def test_scan_segments(table):
+    _put_posts(table, 30)
+
+    def scan(**kwargs):
+        items = []
+        while True:
+            response = table.scan(Limit=4, **kwargs)
+            items.extend(item['n'] for item in response['Items'])
+            if 'LastEvaluatedKey' not in response:
+                return items
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    segments = [scan(Segment=i, TotalSegments=3) for i in range(3)]
+    assert sorted(sum(segments, [])) == list(range(30))
+    assert all(segments)
+    assert scan() == list(range(30))
+
+
+def test_transactions(client):
+    client.put_item(TableName='Blog', Item={'pk': {'S': 'a'},
+                                            'sk': {'S': 'b'},
+                                            'version': {'N': '1'}})
+
+    with pytest.raises(client.exceptions.TransactionCanceledException) as e:
+        client.transact_write_items(TransactItems=[
+            dict(Put=dict(TableName='Blog', Item={'pk': {'S': 'c'},
+                                                  'sk': {'S': 'd'}})),
+            dict(Delete=dict(TableName='Blog',
+                             Key={'pk': {'S': 'a'}, 'sk': {'S': 'b'}},
+                             ConditionExpression='version = :version',
+                             ExpressionAttributeValues={
+                                 ':version': {'N': '2'}
+                             }))
+        ])
+    assert [r['Code'] for r in e.value.response['CancellationReasons']] == \
+        ['None', 'ConditionalCheckFailed']
+    # nothing was written
+    assert 'Item' not in client.get_item(
+        TableName='Blog', Key={'pk': {'S': 'c'}, 'sk': {'S': 'd'}}
+    )
+
+    client.transact_write_items(TransactItems=[
+        dict(Put=dict(TableName='Blog', Item={'pk': {'S': 'c'},
+                                              'sk': {'S': 'd'}})),
+        dict(Delete=dict(TableName='Blog',
+                         Key={'pk': {'S': 'a'}, 'sk': {'S': 'b'}},
+                         ConditionExpression='version = :version',
+                         ExpressionAttributeValues={':version': {'N': '1'}}))
+    ])
+    response = client.batch_get_item(RequestItems=dict(Blog=dict(Keys=[
+        {'pk': {'S': 'a'}, 'sk': {'S': 'b'}},
+        {'pk': {'S': 'c'}, 'sk': {'S': 'd'}}
+    ])))
+    assert response['Responses']['Blog'] == [{'pk': {'S': 'c'},
+                                              'sk': {'S': 'd'}}]
+
+
+def test_batch_write_item(client, table):
+    response = client.batch_write_item(RequestItems=dict(Blog=[
+        dict(PutRequest=dict(Item={'pk': {'S': 'a'}, 'sk': {'S': str(i)}}))
+        for i in range(3)
+    ]))
+    assert response['UnprocessedItems'] == {}
+
+    client.batch_write_item(RequestItems=dict(Blog=[
+        dict(DeleteRequest=dict(Key={'pk': {'S': 'a'}, 'sk': {'S': '1'}}))
+    ]))
+    assert table.scan()['Count'] == 2
+
+
+def test_snapshot_and_restore(table, database):
+    table.put_item(Item=dict(pk='a', sk='b', data='1'))
+    snapshot = database.snapshot()
+
+    table.put_item(Item=dict(pk='c', sk='b', data='2'))
+    table.update_item(Key=dict(pk='a', sk='b'), UpdateExpression='set x = :x',
+                      ExpressionAttributeValues={':x': 1})
+    database.restore(snapshot)
+
+    assert table.scan()['Items'] == [dict(pk='a', sk='b', data='1')]
+    response = table.query(IndexName='GSI', KeyConditionExpression='sk = :sk',
+                           ExpressionAttributeValues={':sk': 'b'})
+    assert [item['pk'] for item in response['Items']] == ['a']
+
+    # restoring again gives the same contents, however they've changed since
+    table.delete_item(Key=dict(pk='a', sk='b'))
+    database.restore(snapshot)
+    assert table.scan()['Count'] == 1
+
+
+def test_connect_to_memory(monkeypatch, connect_db):
+    monkeypatch.setenv('BLOGGY_DB_BACKEND', 'memory')
+    bloggy.create_app()
+    try:
+        snapshot = memory.database.snapshot()
+        memory.database.restore({})
+        post = factories.PostFactory(published=True)
+        db.save_post(post)
+
+        assert isinstance(db._conn.table, memory.Table)
+        assert db.get_published_post(post.slug, pytest.fail) == post
+        memory.database.restore(snapshot)
+    finally:
+        connect_db()
+
+    with pytest.raises(ValueError):
+        db.connect(backend='sqlite')
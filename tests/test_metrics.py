@@ -0,0 +1,174 @@
+import multiprocessing
+import re
+import threading
+
+import pytest
+
+import bloggy
+
+from bloggy import metrics
+
+
+def _value(text, sample):
+    match = re.search('^' + re.escape(sample) + r' (\S+)$', text, re.M)
+    return float(match.group(1)) if match else None
+
+
+def test_counts_add_up_across_threads():
+    registry = metrics.Registry()
+    counter = metrics.Counter('things_total', 'Things.', ['kind'],
+                              registry=registry)
+
+    def count():
+        for _ in range(1000):
+            counter.inc('a')
+        counter.inc('b', amount=2)
+
+    threads = [threading.Thread(target=count) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    text = registry.exposition()
+    assert '# TYPE things_total counter' in text
+    assert _value(text, 'things_total{kind="a"}') == 4000
+    assert _value(text, 'things_total{kind="b"}') == 8
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = metrics.Registry()
+    histogram = metrics.Histogram('took_seconds', 'Took.', ['op'],
+                                  buckets=[0.1, 1], registry=registry)
+    for value in [0.05, 0.1, 0.5, 2]:
+        histogram.observe(value, 'get')
+
+    text = registry.exposition()
+    assert _value(text, 'took_seconds_bucket{op="get",le="0.1"}') == 2
+    assert _value(text, 'took_seconds_bucket{op="get",le="1"}') == 3
+    assert _value(text, 'took_seconds_bucket{op="get",le="+Inf"}') == 4
+    assert _value(text, 'took_seconds_count{op="get"}') == 4
+    assert _value(text, 'took_seconds_sum{op="get"}') == pytest.approx(2.65)
+
+
+def test_gauge_and_unlabelled_defaults():
+    registry = metrics.Registry()
+    gauge = metrics.Gauge('busy', 'Busy.', registry=registry)
+    assert _value(registry.exposition(), 'busy') == 0
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    assert _value(registry.exposition(), 'busy') == 1
+
+
+def test_label_values_are_escaped():
+    registry = metrics.Registry()
+    counter = metrics.Counter('odd_total', 'Odd.', ['name'],
+                              registry=registry)
+    counter.inc('say "hi"\n')
+    assert _value(registry.exposition(),
+                  r'odd_total{name="say \"hi\"\n"}') == 1
+
+
+def _count_in_child(directory):
+    registry = metrics.Registry(directory)
+    counter = metrics.Counter('shared_total', 'Shared.', registry=registry)
+    counter.inc(amount=2)
+
+
+def test_processes_share_counts_through_files(tmp_path):
+    registry = metrics.Registry(str(tmp_path))
+    counter = metrics.Counter('shared_total', 'Shared.', registry=registry)
+    counter.inc()
+
+    context = multiprocessing.get_context('fork')
+    children = [context.Process(target=_count_in_child,
+                                args=(str(tmp_path),)) for _ in range(2)]
+    for child in children:
+        child.start()
+    for child in children:
+        child.join()
+
+    assert _value(registry.exposition(), 'shared_total') == 5
+
+
+def test_forked_children_get_their_own_shards(tmp_path):
+    registry = metrics.Registry(str(tmp_path))
+    counter = metrics.Counter('forked_total', 'Forked.', registry=registry)
+    counter.inc()
+
+    child = multiprocessing.get_context('fork').Process(target=counter.inc)
+    child.start()
+    child.join()
+    counter.inc()
+
+    assert _value(registry.exposition(), 'forked_total') == 3
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_shard_files_grow(tmp_path):
+    registry = metrics.Registry(str(tmp_path))
+    counter = metrics.Counter('many_total', 'Many.', ['n'],
+                              registry=registry)
+    for n in range(5000):
+        counter.inc(str(n))
+    totals = registry.totals()
+    assert len(totals) == 5000
+    assert totals['many_total', '', ('4999',)] == 1
+
+
+def test_metrics_endpoint(requires_dynamodb, client, saved_posts):
+    client.get('/blog/post-1/')
+    client.get('/no-such-page/')
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.content_type == metrics.CONTENT_TYPE
+    text = response.get_data(as_text=True)
+    assert _value(
+        text, 'bloggy_request_seconds_count{endpoint="blog.show_post"}'
+    ) >= 1
+    assert _value(
+        text, 'bloggy_requests_total{endpoint="none",status="404"}'
+    ) >= 1
+    assert _value(text, 'bloggy_requests_in_flight') == 1
+    assert _value(
+        text, 'bloggy_dynamodb_seconds_count{operation="Query"}'
+    ) >= 1
+    assert _value(
+        text, 'bloggy_dynamodb_consumed_capacity_total{operation="Query"}'
+    ) > 0
+    assert re.search(r'^bloggy_cache_lookups_total\{cache="tags",', text,
+                     re.M)
+
+
+def test_markdown_rendering_is_observed():
+    registry = metrics.default_registry
+    before = registry.totals().get(('bloggy_markdown_seconds', 'sum', ()), 0)
+
+    class timings:
+        calls = []
+        spans = [('markdown', 0.5), ('render', 1)]
+
+    metrics.observe_timings(timings)
+    after = registry.totals()[('bloggy_markdown_seconds', 'sum', ())]
+    assert after - before == pytest.approx(0.5)
+
+
+def test_failed_calls_are_counted(app, empty_blog_table):
+    registry = metrics.default_registry
+    key = ('bloggy_dynamodb_errors_total', '',
+           ('GetItem', 'ResourceNotFoundException'))
+    before = registry.totals().get(key, 0)
+
+    @app.route('/fail/')
+    def fail():
+        try:
+            bloggy.db._conn.client.get_item(TableName='NoSuchTable',
+                                            Key={'pk': {'S': 'x'}})
+        except bloggy.db._conn.client.exceptions.ResourceNotFoundException:
+            pass
+        return 'ok'
+
+    app.test_client().get('/fail/')
+    assert registry.totals()[key] - before == 1
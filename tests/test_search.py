@@ -0,0 +1,169 @@
+import os
+
+import pytest
+
+import bloggy.db as db
+from bloggy import search
+from . import factories
+
+
+def _docs(*texts):
+    return [(f'doc{i}', search.document(f'Doc {i}', text, []))
+            for i, text in enumerate(texts)]
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = search.SearchIndex(str(tmp_path / 'search.idx'))
+    index.build(_docs('the quick brown fox',
+                      'the lazy dog and the lazy cat',
+                      'a fox and a dog',
+                      'nothing to see here'))
+    return index
+
+
+def test_document_weights_title_and_tags():
+    terms = search.document('Flask tips', 'Some flask code', ['Python'])
+    assert terms['flask'] == 1 + search.TITLE_WEIGHT
+    assert terms['python'] == search.TAG_WEIGHT
+    assert terms['code'] == 1
+
+
+def test_search_ranks_with_bm25(index):
+    # shorter documents rank higher for the same frequency
+    assert index.search('fox') == (['doc0', 'doc2'], 2)
+    assert index.search('lazy dog') == (['doc1', 'doc2'], 2)
+    # as do those matching more terms
+    assert index.search('FOX dog', limit=1) == (['doc2'], 3)
+    assert index.search('fox dog', offset=1, limit=1)[0] == ['doc0']
+    assert index.search('unicorn') == ([], 0)
+    # title terms count too
+    assert index.search('doc 3') == (['doc3', 'doc0', 'doc2', 'doc1'], 4)
+
+
+def test_changes_are_logged_until_compacted(index):
+    size = os.path.getsize(index.path)
+    index.add('doc4', search.document('Foxes', 'fox fox fox', []))
+    index.add('doc0', search.document('Doc 0', 'a slow brown dog', []))
+    index.remove('doc2')
+    index.remove('missing')
+
+    assert index.search('fox') == (['doc4'], 1)
+    assert index.search('dog')[0] == ['doc0', 'doc1']
+    assert os.path.getsize(index.path) == size
+    with open(f'{index.path}.log') as f:
+        assert len(f.readlines()) == 3
+
+    # e.g. after a restart
+    reopened = search.SearchIndex(index.path)
+    assert reopened.search('fox') == (['doc4'], 1)
+    assert reopened.search('dog')[0] == ['doc0', 'doc1']
+
+    assert index.compact() == 3
+    assert index.compact() == 0
+    assert os.path.getsize(f'{index.path}.log') == 0
+    assert index._state.changes == {}
+    reopened = search.SearchIndex(index.path)
+    assert reopened.search('fox') == (['doc4'], 1)
+    assert reopened.search('dog')[0] == ['doc0', 'doc1']
+
+
+def test_in_memory_index():
+    index = search.SearchIndex()
+    index.build(_docs('the quick brown fox', 'a fox and a dog'))
+    index.add('doc2', search.document('Foxes', 'fox fox fox', []))
+    index.remove('doc0')
+
+    assert index.search('fox') == (['doc2', 'doc1'], 2)
+
+
+def test_writers_start_from_the_latest_file(index):
+    # neither would notice the other's rewrites when searching
+    other = search.SearchIndex(index.path, reload_interval=3600)
+    index.reload_interval = 3600
+    other.add('mine', search.document('Mine', 'unicorn', []))
+    index.add('doc5', search.document('Doc 5', 'zebra', []))
+    other.remove('doc0')
+
+    assert search.SearchIndex(index.path).search('unicorn zebra fox') == \
+        (['mine', 'doc5', 'doc2'], 3)
+
+
+def test_other_processes_pick_up_changes(index):
+    other = search.SearchIndex(index.path, reload_interval=0)
+    index.add('doc5', search.document('Doc 5', 'zebra', []))
+    assert other.search('zebra') == (['doc5'], 1)
+
+    index.remove('doc5')
+    index.compact()
+    index.add('doc6', search.document('Doc 6', 'zebra', []))
+    assert other.search('zebra') == (['doc6'], 1)
+
+
+def test_build_keeps_changes_logged_meanwhile(index):
+    def documents():
+        yield from _docs('the quick brown fox')
+        # e.g. a post saved while the table is scanned
+        index.add('doc9', search.document('Doc 9', 'zebra', []))
+
+    assert index.build(documents()) == 1
+    reopened = search.SearchIndex(index.path)
+    assert reopened.search('zebra fox') == (['doc9', 'doc0'], 2)
+    assert reopened.search('dog') == ([], 0)
+
+
+def test_missing_index_file_is_empty(tmp_path):
+    index = search.SearchIndex(str(tmp_path / 'nothing.idx'))
+    assert index.search('fox') == ([], 0)
+
+    with open(tmp_path / 'junk.idx', 'wb') as f:
+        f.write(b'x' * 64)
+    with pytest.raises(ValueError, match='not a search index'):
+        search.SearchIndex(str(tmp_path / 'junk.idx'))
+
+
+def test_build_from_table(app, empty_blog_table):
+    db.save_post(factories.PostFactory(slug='post1', title='About Flask',
+                                       published=True))
+    db.save_post(factories.PostFactory(slug='post2', title='About Flask',
+                                       published=False))
+
+    assert search.build() == 1
+    assert search.index.search('flask') == (['post1'], 1)
+
+
+def test_follows_post_changes(app, empty_blog_table):
+    search.build()
+    post = factories.PostFactory(slug='post1', title='About Flask',
+                                 published=True)
+    db.save_post(post)
+    assert search.index.search('flask') == (['post1'], 1)
+
+    post.published = False
+    db.update_post(post)
+    assert search.index.search('flask') == ([], 0)
+
+    post.published = True
+    db.update_post(post)
+    db.delete_post('post1')
+    assert search.index.search('flask') == ([], 0)
+
+
+def test_follows_retagged_posts(app, empty_blog_table, monkeypatch):
+    search.build()
+    tag = factories.TagFactory(name='python', label='Python')
+    for slug in ['post1', 'post2']:
+        db.save_post(factories.PostFactory(slug=slug, tags=[tag],
+                                           published=True))
+    updates = []
+    update = search.index.update
+    monkeypatch.setattr(search.index, 'update',
+                        lambda changes: updates.append(changes) or
+                        update(changes))
+
+    relabelled = factories.TagFactory(name='python', label='Snakes')
+    assert db.retag_posts('python', lambda tags: [relabelled]) == 2
+
+    assert sorted(search.index.search('snakes')[0]) == ['post1', 'post2']
+    # in one change for both
+    assert [sorted(changes) for changes in updates] == [['post1', 'post2']]
@@ -0,0 +1,59 @@
+import json
+import logging
+
+from bloggy import timing
+
+
+def _summary(caplog, level=logging.INFO):
+    records = [r for r in caplog.records
+               if r.name == 'bloggy.timing' and r.levelno == level]
+    return json.loads(records[-1].getMessage())
+
+
+def test_server_timing(requires_dynamodb, client, saved_posts, caplog):
+    caplog.set_level(logging.INFO, logger='bloggy.timing')
+    response = client.get('/blog/post-1/')
+
+    header = response.headers['Server-Timing']
+    assert header.startswith('db;dur=')
+    assert 'render;dur=' in header
+    assert 'cattrs;dur=' in header
+    assert 'total;dur=' in header
+
+    summary = _summary(caplog)
+    assert summary['endpoint'] == 'blog.show_post'
+    assert summary['db']['calls'] > 0
+    assert summary['db']['items'] > 0
+    assert summary['db']['capacity'] > 0
+    assert 'calls' not in summary
+
+
+def test_slow_requests_list_calls(app, client, saved_posts, caplog):
+    app.config['TIMING_SLOW_MS'] = 0
+    client.get('/blog/?tag=odd')
+
+    summary = _summary(caplog, logging.WARNING)
+    assert {call['operation'] for call in summary['calls']} >= \
+        {'Query', 'BatchGetItem'}
+
+
+def test_markdown_timed(app, client, mock_get_post):
+    with app.test_request_context('/'):
+        app.preprocess_request()
+        timing.current().add_span('other', 0.001)
+        from bloggy import filters
+        filters.md_to_html('# Hi')
+        spans = timing.current().summary()['spans']
+    assert set(spans) == {'other', 'markdown'}
+
+
+def test_timing_off(app, client, saved_posts):
+    app.config['TIMING'] = False
+    response = client.get('/blog/post-1/')
+    assert 'Server-Timing' not in response.headers
+
+
+def test_no_timing_outside_requests():
+    assert timing.current() is None
+    with timing.timed('anything'):
+        pass
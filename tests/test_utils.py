@@ -17,3 +17,22 @@ def test_url_tokenisation_with_none():
 
 def test_from_url_token_with_invalid_token():
     assert utils.from_url_token('invalid-token') is None
+
+
+def test_cursor_round_trip(app):
+    key = dict(created='2023-01-12T00:00:00', slug='post-12')
+    with app.test_request_context():
+        cursor = utils.make_cursor(7, key, backward=True)
+        assert utils.read_cursor(cursor) == (7, key, True)
+        assert urllib.parse.quote(cursor) == cursor
+        # the size depends on the key, not on the page
+        assert len(utils.make_cursor(7000, key)) - len(cursor) < 8
+
+
+def test_read_cursor_rejects_tampering(app):
+    with app.test_request_context():
+        cursor = utils.make_cursor(2, dict(slug='post-12'))
+        data, signature = cursor.split('.')
+        forged = utils.to_url_token(dict(p=2, k=dict(slug='other')))
+        assert utils.read_cursor(f'{forged}.{signature}') is None
+        assert utils.read_cursor(None) is None